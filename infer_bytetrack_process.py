@@ -1,10 +1,15 @@
 import copy
-from ikomia import core, dataprocess
+import os
+from ikomia import core, dataprocess, utils
 
 import numpy as np
 from argparse import Namespace
 from infer_bytetrack.yolox.tracker.byte_tracker import BYTETracker
-from infer_bytetrack.utils import match_detections_with_tracks, xywh_xyxy
+from infer_bytetrack.yolox.tracker.array_tracker import ArrayBYTETracker
+from infer_bytetrack.yolox.tracker.tracker_pool import TrackerPool
+from infer_bytetrack.yolox.tracking_utils.io import ResultWriter
+from infer_bytetrack.yolox.tracking_utils.timer import StageProfiler
+from infer_bytetrack.utils import DetectionBuffer, DetectionSchedule, match_detections_with_tracks
 
 
 # --------------------
@@ -21,6 +26,15 @@ class InferBytetrackParam(core.CWorkflowTaskParam):
         self.conf_thres_match = 0.7
         self.update = False
         self.categories = "all"
+        self.backend = "object"
+        self.stream_id = ""
+        self.stream_timeout = 60.
+        self.class_aware = False
+        self.profile = False
+        self.trajectory_file = ""
+        self.detector_stride = 1
+        self.scene_change_thresh = 0.
+        self.precision = "float64"
 
     def set_values(self, param_map):
         # Set parameters values from Ikomia application
@@ -30,6 +44,15 @@ class InferBytetrackParam(core.CWorkflowTaskParam):
         self.conf_thres = float(param_map["conf_thres"])
         self.track_buffer = int(param_map["track_buffer"])
         self.categories = str(param_map["categories"])
+        self.backend = str(param_map["backend"])
+        self.stream_id = str(param_map["stream_id"])
+        self.stream_timeout = float(param_map["stream_timeout"])
+        self.class_aware = utils.strtobool(param_map["class_aware"])
+        self.profile = utils.strtobool(param_map["profile"])
+        self.trajectory_file = str(param_map["trajectory_file"])
+        self.detector_stride = int(param_map["detector_stride"])
+        self.scene_change_thresh = float(param_map["scene_change_thresh"])
+        self.precision = str(param_map["precision"])
 
     def get_values(self):
         # Send parameters values to Ikomia application
@@ -38,7 +61,16 @@ class InferBytetrackParam(core.CWorkflowTaskParam):
             "conf_thres_match": str(self.conf_thres_match),
             "conf_thres": str(self.conf_thres),
             "track_buffer": str(self.track_buffer),
-            "categories": str(self.categories)
+            "categories": str(self.categories),
+            "backend": str(self.backend),
+            "stream_id": str(self.stream_id),
+            "stream_timeout": str(self.stream_timeout),
+            "class_aware": str(self.class_aware),
+            "profile": str(self.profile),
+            "trajectory_file": str(self.trajectory_file),
+            "detector_stride": str(self.detector_stride),
+            "scene_change_thresh": str(self.scene_change_thresh),
+            "precision": str(self.precision)
         }
         return param_map
 
@@ -55,8 +87,27 @@ class InferBytetrack(dataprocess.CObjectDetectionTask):
         self.remove_input(1)
         self.add_input(dataprocess.CObjectDetectionIO())
         self.add_input(dataprocess.CInstanceSegmentationIO())
+        # Tracker stage timings, filled when profiling is enabled
+        self.add_output(dataprocess.DataDictIO())
+        # Detection schedule: detection frame flag and ids of the predicted tracks
+        self.add_output(dataprocess.DataDictIO())
 
-        self.tracker = None
+        # One isolated tracker per stream id
+        self.trackers = None
+        self.tracker_settings = None
+        # Frames tracked since profiling started, each tracker counting its own updates
+        self.profiled_frames = 0
+        # Input detections, reused from frame to frame
+        self.detections = DetectionBuffer()
+        # Recorded trajectories: stream id -> [ResultWriter, frame count]
+        self.trajectory_writers = {}
+        # Frame count of the streams whose writer was closed on eviction, they append to their file
+        self.trajectory_frames = {}
+        self.trajectory_file = ""
+        # Frames on which the detector runs, the others are coasted
+        self.schedule = DetectionSchedule()
+        # Output tracks of the last detection frame: stream id -> (instance segmentation input, {track id: label})
+        self.coasted_tracks = {}
 
         # Create parameters class
         if param is None:
@@ -74,6 +125,133 @@ class InferBytetrack(dataprocess.CObjectDetectionTask):
         color = [int((p * (label ** 2 - label + 1)) % 255) for p in self.palette]
         return color
 
+    @staticmethod
+    def create_tracker(track_thresh, track_buffer, match_thresh, backend, precision="float64", profiler=None):
+        args = Namespace()
+        args.track_thresh = track_thresh
+        args.track_buffer = track_buffer
+        args.mot20 = False
+        args.match_thresh = match_thresh
+        dtype = np.dtype(precision)
+        if backend == "array":
+            return ArrayBYTETracker(args, profiler=profiler, dtype=dtype)
+        return BYTETracker(args, profiler=profiler, dtype=dtype)
+
+    def track(self, param, detections, img_size, labels_to_track):
+        """
+        Run the trackers of the current stream on the loaded detections.
+        Return a dict mapping detection rows to track ids.
+        """
+        pairings = {}
+        if param.categories == "all":
+            to_track = np.ones(len(detections), dtype=bool)
+        else:
+            to_track = self.detections.label_mask(labels_to_track)
+
+        if not param.class_aware:
+            tracks = self.trackers.update(param.stream_id, detections, img_size, img_size)
+            for k, v in match_detections_with_tracks(tracks).items():
+                if to_track[k]:
+                    pairings[k] = self.trackers.namespaced_id(param.stream_id, v)
+            return pairings
+
+        # Class-aware mode: unwanted categories are dropped before tracking and
+        # each label has its own tracker, so objects of different classes are
+        # never associated. Every label tracker of the stream advances on each
+        # frame, even without detection of its label, for lost tracks to age.
+        labels = self.detections.labels[:len(detections)]
+        keys = {key for key in self.trackers.stream_ids() if key[0] == param.stream_id}
+        keys = sorted(keys.union((param.stream_id, label) for label in set(labels[to_track])))
+        rows = {key: np.flatnonzero(to_track & (labels == key[1])) for key in keys}
+        outputs = self.trackers.update_many({key: (detections[rows[key]], img_size, img_size) for key in keys})
+        for key, tracks in outputs.items():
+            for k, v in match_detections_with_tracks(tracks).items():
+                pairings[rows[key][k]] = self.trackers.namespaced_id(key, v)
+        return pairings
+
+    def coast(self, param):
+        """
+        Advance the trackers of the current stream on their Kalman predictions.
+        Return the output tracks of the last detection frame as (track id, label,
+        confidence, predicted box) tuples, boxes being (x, y, w, h).
+        """
+        if param.class_aware:
+            keys = [key for key in self.trackers.stream_ids() if key[0] == param.stream_id]
+        else:
+            keys = [param.stream_id]
+        labels = self.coasted_tracks[param.stream_id][1]
+        predictions = []
+        for key, tracks in self.trackers.coast_many(keys).items():
+            for track in tracks:
+                track_id = self.trackers.namespaced_id(key, track.track_id)
+                if track_id in labels:
+                    predictions.append((track_id, labels[track_id], float(track.score), track.tlwh.tolist()))
+        return predictions
+
+    def detection_due(self, stream_id=""):
+        """
+        Whether the next frame of `stream_id` is a detection frame. With a detector
+        stride, the detector only needs to run on these frames.
+        """
+        return self.schedule.is_due(stream_id)
+
+    def profile_summary(self):
+        """
+        Flatten the summary of the tracker profilers into a "section/name/statistic" -> value
+        dict. Every tracker of the pool has its own profiler, their samples are per tracker
+        update: in class-aware mode a frame updates one tracker per label.
+        """
+        summary = StageProfiler.merge(tracker.profiler for tracker in self.trackers.trackers()).summary()
+        data = {"frames": self.profiled_frames, "updates": summary["frames"]}
+        for section in ("times_ms", "counts"):
+            for name, stats in summary[section].items():
+                for stat, value in stats.items():
+                    data["{}/{}/{}".format(section, name, stat)] = value
+        for name, dims in summary["cost_shapes"].items():
+            for dim, stats in dims.items():
+                for stat, value in stats.items():
+                    data["cost_shapes/{}/{}/{}".format(name, dim, stat)] = value
+        return data
+
+    def trajectory_writer(self, param):
+        """
+        Return the [writer, frame id] of the current frame of the stream, or None
+        when trajectories are not recorded. Each stream has its own file.
+        """
+        if param.trajectory_file != self.trajectory_file:
+            self.close_trajectories()
+            self.trajectory_file = param.trajectory_file
+        if not param.trajectory_file:
+            return None
+        entry = self.trajectory_writers.get(param.stream_id)
+        if entry is None:
+            root, ext = os.path.splitext(param.trajectory_file)
+            filename = "{}_{}{}".format(root, param.stream_id, ext) if param.stream_id else param.trajectory_file
+            append = param.stream_id in self.trajectory_frames
+            # MOT text for .txt files, indexed binary records otherwise
+            entry = [ResultWriter(filename, binary=ext != ".txt", append=append),
+                     self.trajectory_frames.pop(param.stream_id, 0)]
+            self.trajectory_writers[param.stream_id] = entry
+        entry[1] += 1
+        return entry
+
+    def close_trajectories(self, stream_ids=None):
+        """
+        Close the trajectory files of `stream_ids`, e.g. evicted streams, which append
+        to their file if they come back. All of them by default, for good.
+        """
+        for stream_id in list(self.trajectory_writers) if stream_ids is None else stream_ids:
+            writer, frame_count = self.trajectory_writers.pop(stream_id)
+            writer.close()
+            self.trajectory_frames[stream_id] = frame_count
+        if stream_ids is None:
+            self.trajectory_frames = {}
+
+    def stop(self):
+        super().stop()
+        # Buffered trajectories are written when the workflow stops
+        self.close_trajectories()
+
     def get_progress_steps(self):
         # Function returning the number of progress steps for this process
         # This is handled by the main progress bar of Ikomia application
@@ -87,13 +265,21 @@ class InferBytetrack(dataprocess.CObjectDetectionTask):
         # Get parameters :
         param = self.get_param_object()
 
-        if self.tracker is None or param.update:
-            args = Namespace()
-            args.track_thresh = param.conf_thres
-            args.track_buffer = param.track_buffer
-            args.mot20 = False
-            args.match_thresh = param.conf_thres_match
-            self.tracker = BYTETracker(args)
+        # Switching stream only selects another tracker, other changes reset them all
+        settings = (param.conf_thres, param.track_buffer, param.conf_thres_match, param.backend, param.precision,
+                    param.class_aware, param.profile)
+        if self.trackers is None or settings != self.tracker_settings:
+            # One profiler per tracker, so that trackers updated concurrently do not mix their times
+            self.trackers = TrackerPool(lambda: self.create_tracker(
+                *settings[:5], profiler=StageProfiler() if settings[6] else None))
+            self.profiled_frames = 0
+            self.tracker_settings = settings
+            self.schedule = DetectionSchedule()
+            self.coasted_tracks = {}
+        self.trackers.idle_timeout = param.stream_timeout
+        self.schedule.stride = param.detector_stride
+        self.schedule.scene_change_thresh = param.scene_change_thresh
+        param.update = False
 
         # Get input :
         task_input = self.get_input(0)
@@ -111,25 +297,45 @@ class InferBytetrack(dataprocess.CObjectDetectionTask):
         while ', ' in self.categories:
             self.categories = self.categories.replace(", ", ",")
         labels_to_track = self.categories.split(',')
+        trajectories = self.trajectory_writer(param)
+        pairings = {}
+        objects = dets if len(dets) else inst_segs
+        coasting = not self.schedule.next_frame(param.stream_id, src_image) and param.stream_id in self.coasted_tracks
+        predictions = []
+
+        # Frames skipped by the detector: the tracks of the last detection frame
+        # are output at their predicted position, the detection input is not read
+        if coasting:
+            segmentation = self.coasted_tracks[param.stream_id][0]
+            predictions = self.coast(param)
+            if segmentation:
+                self.set_output(dataprocess.CInstanceSegmentationIO(), 1)
+                task_output = self.get_output(1)
+                task_output.init("ByteTrack", 0, img_size[1], img_size[0])
+                # Masks are not predicted
+                empty_mask = np.zeros(img_size[:2], dtype=np.uint8)
+            else:
+                self.set_output(dataprocess.CObjectDetectionIO(), 1)
+                task_output = self.get_output(1)
+                task_output.init("ByteTrack", 0)
+            for track_id, label, confidence, box in predictions:
+                color = self.compute_color_for_labels(track_id)
+                if segmentation:
+                    task_output.add_object(track_id, 0, 0, label, confidence, *box, empty_mask, color)
+                else:
+                    task_output.add_object(track_id, label, confidence, *box, color)
 
         # Tracking for object detection input
-        if len(dets):
+        elif len(dets):
             self.set_output(dataprocess.CObjectDetectionIO(), 1)
             # Get output :
             task_output = self.get_output(1)
             task_output.init("ByteTrack", 0)
-            tracks = self.tracker.update(
-                                    np.array([xywh_xyxy(o.box) + [o.confidence] for o in dets]),
-                                    img_size,
-                                    img_size
-            )
-            if len(tracks) > 0:
-                pairings = match_detections_with_tracks(dets, tracks)
-                for k, v in pairings.items():
-                    det = dets[k]
-                    if param.categories == "all" or det.label in labels_to_track:
-                        color = self.compute_color_for_labels(v)
-                        task_output.add_object(v, det.label, det.confidence, *det.box, color)
+            pairings = self.track(param, self.detections.load(dets), img_size, labels_to_track)
+            for k, v in pairings.items():
+                det = dets[k]
+                color = self.compute_color_for_labels(v)
+                task_output.add_object(v, det.label, det.confidence, *det.box, color)
 
         # Tracking for instance segmentation input
         elif len(inst_segs):
@@ -137,27 +343,55 @@ class InferBytetrack(dataprocess.CObjectDetectionTask):
             # Get output :
             task_output = self.get_output(1)
             task_output.init("ByteTrack", 0, img_size[1], img_size[0])
-            tracks = self.tracker.update(
-                                    np.array([xywh_xyxy(o.box) + [o.confidence] for o in inst_segs]),
-                                    img_size,
-                                    img_size
-            )
-            if len(tracks) > 0:
-                pairings = match_detections_with_tracks(inst_segs, tracks)
-                for k, v in pairings.items():
-                    inst_seg = inst_segs[k]
-                    if param.categories == "all" or det.label in labels_to_track:
-                        color = self.compute_color_for_labels(v)
-                        task_output.add_object(
-                                            v,
-                                            0,
-                                            0,
-                                            inst_seg.label,
-                                            inst_seg.confidence,
-                                            *inst_seg.box,
-                                            inst_seg.mask,
-                                            color
-                        )
+            pairings = self.track(param, self.detections.load(inst_segs), img_size, labels_to_track)
+            for k, v in pairings.items():
+                inst_seg = inst_segs[k]
+                color = self.compute_color_for_labels(v)
+                task_output.add_object(
+                                    v,
+                                    0,
+                                    0,
+                                    inst_seg.label,
+                                    inst_seg.confidence,
+                                    *inst_seg.box,
+                                    inst_seg.mask,
+                                    color
+                )
+
+        # Detection frame without objects: the trackers still advance for their lost
+        # tracks to age, and the next coasted frames have no track to predict
+        elif not coasting:
+            self.track(param, self.detections.load(objects), img_size, labels_to_track)
+
+        if not coasting:
+            self.profiled_frames += 1
+            segmentation = len(dets) == 0 and len(inst_segs) > 0
+            self.coasted_tracks[param.stream_id] = (segmentation, {v: objects[k].label for k, v in pairings.items()})
+        streams = {key[0] if isinstance(key, tuple) else key for key in self.trackers.stream_ids()}
+        streams.add(param.stream_id)
+        self.schedule.retain(streams)
+        self.coasted_tracks = {stream_id: v for stream_id, v in self.coasted_tracks.items() if stream_id in streams}
+        # Evicted streams release their trajectory file and buffered rows
+        self.close_trajectories([stream_id for stream_id in self.trajectory_writers if stream_id not in streams])
+
+        if trajectories is not None and pairings:
+            writer, frame_id = trajectories
+            rows = sorted(pairings)
+            writer.add(frame_id, [objects[k].box for k in rows], [pairings[k] for k in rows],
+                       [objects[k].confidence for k in rows])
+        elif trajectories is not None and predictions:
+            writer, frame_id = trajectories
+            writer.add(frame_id, [p[3] for p in predictions], [p[0] for p in predictions],
+                       [p[2] for p in predictions])
+
+        self.get_output(3).data = {
+            "detection_frame": int(not coasting),
+            "detect_next": int(self.schedule.is_due(param.stream_id)),
+            "predicted_ids": [p[0] for p in predictions],
+        }
+
+        if param.profile:
+            self.get_output(2).data = self.profile_summary()
 
         # Step progress bar (Ikomia Studio):
         self.emit_step_progress()
@@ -50,6 +50,56 @@ class InferBytetrackWidget(core.CWorkflowTaskWidget):
                                                     min=0., max=100
         )
 
+        self.combo_backend = pyqtutils.append_combo(self.grid_layout, "Tracker backend")
+        self.combo_backend.addItem("object")
+        self.combo_backend.addItem("array")
+        self.combo_backend.setCurrentText(self.parameters.backend)
+
+        self.combo_precision = pyqtutils.append_combo(self.grid_layout, "Kalman precision")
+        self.combo_precision.addItem("float64")
+        self.combo_precision.addItem("float32")
+        self.combo_precision.setCurrentText(self.parameters.precision)
+
+        self.edit_stream_id = pyqtutils.append_edit(self.grid_layout, "Stream id", self.parameters.stream_id)
+
+        self.spin_stream_timeout = pyqtutils.append_double_spin(
+                                                    self.grid_layout,
+                                                    "Idle stream timeout (s)",
+                                                    self.parameters.stream_timeout,
+                                                    min=0., max=86400.,
+                                                    step=1., decimals=1
+        )
+
+        self.check_class_aware = pyqtutils.append_check(
+                                                    self.grid_layout,
+                                                    "Class-aware tracking",
+                                                    self.parameters.class_aware
+        )
+
+        self.check_profile = pyqtutils.append_check(
+                                                    self.grid_layout,
+                                                    "Profile tracker stages",
+                                                    self.parameters.profile
+        )
+
+        self.edit_trajectory_file = pyqtutils.append_edit(self.grid_layout, "Trajectory file",
+                                                          self.parameters.trajectory_file)
+
+        self.spin_detector_stride = pyqtutils.append_spin(
+                                                    self.grid_layout,
+                                                    "Detector stride",
+                                                    self.parameters.detector_stride,
+                                                    min=1, max=100
+        )
+
+        self.spin_scene_change_thresh = pyqtutils.append_double_spin(
+                                                    self.grid_layout,
+                                                    "Scene change threshold",
+                                                    self.parameters.scene_change_thresh,
+                                                    min=0., max=1.,
+                                                    step=0.01, decimals=2
+        )
+
         # PyQt -> Qt wrapping
         layout_ptr = qtconversion.PyQtToQt(self.grid_layout)
 
@@ -62,6 +112,15 @@ class InferBytetrackWidget(core.CWorkflowTaskWidget):
         self.parameters.categories = self.edit_categories.text()
         self.parameters.conf_thres_match = self.spin_conf_thres_match.value()
         self.parameters.track_buffer = self.spin_track_buffer.value()
+        self.parameters.backend = self.combo_backend.currentText()
+        self.parameters.precision = self.combo_precision.currentText()
+        self.parameters.stream_id = self.edit_stream_id.text()
+        self.parameters.stream_timeout = self.spin_stream_timeout.value()
+        self.parameters.class_aware = self.check_class_aware.isChecked()
+        self.parameters.profile = self.check_profile.isChecked()
+        self.parameters.trajectory_file = self.edit_trajectory_file.text()
+        self.parameters.detector_stride = self.spin_detector_stride.value()
+        self.parameters.scene_change_thresh = self.spin_scene_change_thresh.value()
         self.parameters.update = True
 
         # Send signal to launch the process
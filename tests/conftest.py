@@ -0,0 +1,22 @@
+"""
+The modules import each other through the `infer_bytetrack` package, the
+folder name Ikomia installs the plugin under. The checkout is registered
+under that name when it is not importable as a package, e.g. a clone
+named otherwise:
+
+    python -m pytest
+"""
+import importlib.util
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# From the checkout, `infer_bytetrack` can also resolve to the plugin module infer_bytetrack.py
+spec = importlib.util.find_spec('infer_bytetrack')
+if spec is None or spec.submodule_search_locations is None:
+    spec = importlib.util.spec_from_file_location('infer_bytetrack', os.path.join(ROOT, '__init__.py'),
+                                                  submodule_search_locations=[ROOT])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['infer_bytetrack'] = module
+    spec.loader.exec_module(module)
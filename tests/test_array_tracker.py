@@ -0,0 +1,118 @@
+from argparse import Namespace
+
+import numpy as np
+import pytest
+
+from infer_bytetrack.yolox.tracker.array_tracker import ArrayBYTETracker
+from infer_bytetrack.yolox.tracker.basetrack import TrackState
+from infer_bytetrack.yolox.tracker.byte_tracker import BYTETracker
+
+IMG_SIZE = (1080, 1920)
+
+
+def tracker_args(**kwargs):
+    args = Namespace(track_thresh=0.5, track_buffer=30, mot20=False, match_thresh=0.8)
+    for name, value in kwargs.items():
+        setattr(args, name, value)
+    return args
+
+
+def make_scene(seed, num_frames=150, num_objects=40, width=1920, height=1080):
+    """Detections of objects drifting across the image, with misses, low scores and false positives"""
+    rng = np.random.default_rng(seed)
+    position = rng.uniform([0, 0], [width, height], size=(num_objects, 2))
+    velocity = rng.normal(0, 3, size=(num_objects, 2))
+    size = rng.uniform([20, 40], [60, 160], size=(num_objects, 2))
+    frames = []
+    for _ in range(num_frames):
+        position = (position + velocity) % [width, height]
+        velocity += rng.normal(0, 0.3, size=velocity.shape)
+        visible = rng.uniform(size=num_objects) > 0.1
+        boxes = np.hstack([position, position + size])[visible] + rng.normal(0, 1.5, size=(visible.sum(), 4))
+        scores = rng.uniform(0.05, 1., size=visible.sum())
+        corners = rng.uniform(0, width - 100, size=(rng.integers(0, 5), 2))
+        boxes = np.vstack([boxes, np.hstack([corners, corners + rng.uniform(20, 80, size=corners.shape)])])
+        scores = np.concatenate([scores, rng.uniform(0.05, 0.7, len(corners))])
+        # Values exact in float32 too, for both trackers to see the same inputs whatever their dtype
+        frames.append(np.hstack([np.round(boxes * 4) / 4, np.round(scores[:, None] * 256) / 256]))
+    return frames
+
+
+def run(tracker, frames):
+    """Output tracks of every frame as (ids, tlwhs, scores, det indices), and the finished ids per frame"""
+    outputs, finished = [], []
+    tracker.on_finished = lambda tracks: finished[-1].extend(track.track_id for track in tracks)
+    for dets in frames:
+        finished.append([])
+        tracks = tracker.update(dets.copy(), IMG_SIZE, IMG_SIZE)
+        outputs.append(([t.track_id for t in tracks], np.array([t.tlwh for t in tracks]).reshape(-1, 4),
+                        np.array([t.score for t in tracks]), [t.det_index for t in tracks]))
+    return outputs, [sorted(ids) for ids in finished]
+
+
+def run_finished(tracker_class, frames, **kwargs):
+    """Track ids passed to `on_finished`, per frame"""
+    return run(tracker_class(tracker_args(), **kwargs), frames)[1]
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('mot20, sparse_iou, dtype', [
+    (False, False, np.float64), (True, False, np.float64), (False, True, np.float64), (False, False, np.float32)])
+def test_array_tracker_matches_byte_tracker(seed, mot20, sparse_iou, dtype):
+    frames = make_scene(seed)
+    args = tracker_args(mot20=mot20)
+    expected, expected_finished = run(BYTETracker(args, sparse_iou=sparse_iou, dtype=dtype), frames)
+    # A small store grows, and recycles the slots of the removed tracks
+    tracker = ArrayBYTETracker(args, capacity=8, sparse_iou=sparse_iou, dtype=dtype)
+    outputs, finished = run(tracker, frames)
+    assert tracker.store.capacity < tracker.id_allocator.snapshot()
+    assert finished == expected_finished
+    tolerance = 1e-6 if dtype == np.float64 else 1e-2
+    for (ids, tlwhs, scores, det_indices), (ref_ids, ref_tlwhs, ref_scores, ref_det_indices) in zip(outputs, expected):
+        # Same tracks in the same order
+        assert ids == ref_ids
+        assert det_indices == ref_det_indices
+        np.testing.assert_allclose(tlwhs, ref_tlwhs, atol=tolerance)
+        np.testing.assert_allclose(scores, ref_scores, atol=tolerance)
+
+
+@pytest.mark.parametrize('tracker_class', [BYTETracker, ArrayBYTETracker])
+def test_lost_track_is_refound_then_removed(tracker_class):
+    box = np.array([[100., 100., 200., 300., 0.9]])
+    empty = np.empty((0, 5))
+    # Tracked on frames 1-3, lost on 4-5, re-found on 6-7, then lost for more than the 5 frame buffer
+    # A new track is output from its second frame
+    frames = [box] * 3 + [empty] * 2 + [box] * 2 + [empty] * 8 + [box + 500] * 2
+    outputs, finished = run(tracker_class(tracker_args(track_buffer=5)), frames)
+    assert [ids for ids, _, _, _ in outputs] == [[1]] * 3 + [[]] * 2 + [[1]] * 2 + [[]] * 9 + [[2]]
+    # Lost on frame 8, removed on frame 14 once 5 frames have passed
+    assert finished == [[]] * 13 + [[1]] + [[]] * 3
+
+
+def test_removed_slot_is_reused():
+    tracker = ArrayBYTETracker(tracker_args(track_buffer=5), capacity=1)
+    box = np.array([[100., 100., 200., 300., 0.9]])
+    frames = [box] * 2 + [np.empty((0, 5))] * 6
+    run(tracker, frames)
+    store = tracker.store
+    # Removed on the last frame: kept in the lost list until the next update
+    assert store.state[0] == TrackState.Removed and store.was_removed[0] and store.alive[0]
+    tracker.update(np.empty((0, 5)), IMG_SIZE, IMG_SIZE)
+    assert len(store) == 0
+    tracker.update(box + 500, IMG_SIZE, IMG_SIZE)
+    tracks = tracker.update(box + 500, IMG_SIZE, IMG_SIZE)
+    assert [track.track_id for track in tracks] == [2]
+    assert store.capacity == 1 and store.track_id[0] == 2 and not store.was_removed[0]
+
+
+@pytest.mark.parametrize('sparse_iou', [False, True])
+def test_duplicate_lost_track_finishes_once(sparse_iou):
+    # A and B are tracked from frame 1, C overlaps both of them on frames 6-8.
+    # Lost on frame 9, C is a duplicate of both A and B.
+    a = [100, 100, 200, 300, 0.9]
+    b = [106, 100, 206, 300, 0.9]
+    c = [103, 100, 203, 300, 0.9]
+    frames = [np.array([a, b])] * 5 + [np.array([a, b, c])] * 3 + [np.array([a, b])] * 3
+    expected = run_finished(BYTETracker, frames, sparse_iou=sparse_iou)
+    assert expected[8] == [3]
+    assert run_finished(ArrayBYTETracker, frames, sparse_iou=sparse_iou) == expected
@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+import scipy.sparse
+
+from infer_bytetrack.yolox.tracker import assignment
+
+# lapjv is the historical solver, the other backends are checked against it
+REFERENCE = 'lapjv' if assignment.lap is not None else 'scipy'
+EXACT_BACKENDS = [name for name in ('lapjv', 'scipy', 'sparse') if name != 'lapjv' or assignment.lap is not None]
+SHAPES = [(0, 6), (6, 0), (0, 0), (1, 1), (5, 9), (12, 7), (25, 25)]
+
+
+def assert_same_solution(solution, reference):
+    matches, unmatched_a, unmatched_b = solution
+    ref_matches, ref_unmatched_a, ref_unmatched_b = reference
+    np.testing.assert_array_equal(matches.reshape(-1, 2), ref_matches.reshape(-1, 2))
+    np.testing.assert_array_equal(np.sort(unmatched_a), np.sort(ref_unmatched_a))
+    np.testing.assert_array_equal(np.sort(unmatched_b), np.sort(ref_unmatched_b))
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('shape', SHAPES)
+@pytest.mark.parametrize('thresh', [0.3, 0.8])
+def test_dense_backends_match_reference(seed, shape, thresh):
+    cost_matrix = np.random.default_rng(seed).uniform(size=shape)
+    reference = assignment.solve(cost_matrix, thresh, REFERENCE)
+    for backend in EXACT_BACKENDS:
+        assert_same_solution(assignment.solve(cost_matrix, thresh, backend), reference)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('shape', SHAPES)
+def test_sparse_matrix_matches_dense(seed, shape):
+    rng = np.random.default_rng(seed)
+    thresh = 0.8
+    # Pairs left out of the sparse matrix cost 1 in the dense one, above the threshold
+    dense = np.ones(shape)
+    keep = rng.uniform(size=shape) < 0.3
+    dense[keep] = rng.uniform(size=int(keep.sum()))
+    rows, cols = np.nonzero(keep)
+    sparse = scipy.sparse.coo_matrix((dense[rows, cols], (rows, cols)), shape=shape)
+    reference = assignment.solve(dense, thresh, REFERENCE)
+    for backend in EXACT_BACKENDS:
+        # Sparse matrices are always solved per connected component, with `backend`
+        assert_same_solution(assignment.solve(sparse, thresh, backend), reference)
+    assert_same_solution(assignment.solve(dense, thresh, 'sparse'), reference)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('shape', SHAPES)
+def test_greedy_matches_reference_when_separated(seed, shape):
+    # Greedy is not optimal in general, but it is when every row has at most
+    # one column below the threshold and every column at most one row
+    rng = np.random.default_rng(seed)
+    thresh = 0.5
+    cost_matrix = rng.uniform(0.6, 1., size=shape)
+    size = min(shape)
+    rows, cols = rng.permutation(shape[0])[:size], rng.permutation(shape[1])[:size]
+    cost_matrix[rows, cols] = rng.uniform(0., 0.7, size=size)
+    reference = assignment.solve(cost_matrix, thresh, REFERENCE)
+    assert_same_solution(assignment.solve(cost_matrix, thresh, 'greedy'), reference)
+
+
+def test_costs_above_thresh_are_never_matched():
+    cost_matrix = np.array([[0.2, 0.9], [0.95, 0.85]])
+    for backend in assignment.BACKENDS:
+        if backend == 'lapjv' and assignment.lap is None:
+            continue
+        matches, unmatched_a, unmatched_b = assignment.solve(cost_matrix, 0.8, backend)
+        np.testing.assert_array_equal(matches, [[0, 0]])
+        np.testing.assert_array_equal(unmatched_a, [1])
+        np.testing.assert_array_equal(unmatched_b, [1])
@@ -0,0 +1,66 @@
+import threading
+from argparse import Namespace
+
+import numpy as np
+import pytest
+
+from infer_bytetrack.yolox.tracker.array_tracker import ArrayBYTETracker
+from infer_bytetrack.yolox.tracker.basetrack import IdAllocator
+from infer_bytetrack.yolox.tracker.byte_tracker import BYTETracker
+
+
+def test_take_allocates_consecutive_ids():
+    allocator = IdAllocator(start=10)
+    assert allocator.next_id() == 11
+    np.testing.assert_array_equal(allocator.take(3), [12, 13, 14])
+    assert len(allocator.take(0)) == 0
+    assert allocator.next_id() == 15
+
+
+def test_snapshot_and_restore():
+    allocator = IdAllocator()
+    allocator.take(5)
+    snapshot = allocator.snapshot()
+    assert snapshot == 5
+    allocator.take(3)
+    allocator.restore(snapshot)
+    assert allocator.next_id() == 6
+    # A new allocator resumes the saved sequence
+    resumed = IdAllocator()
+    resumed.restore(snapshot)
+    assert resumed.next_id() == 6
+
+
+def test_allocation_is_thread_safe():
+    allocator = IdAllocator()
+    ids = [[] for _ in range(8)]
+
+    def allocate(out):
+        for _ in range(500):
+            out.append(allocator.next_id())
+            out.extend(allocator.take(2).tolist())
+
+    threads = [threading.Thread(target=allocate, args=(out,)) for out in ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # No id is given twice or skipped
+    assert sorted(sum(ids, [])) == list(range(1, 8 * 500 * 3 + 1))
+    assert allocator.snapshot() == 8 * 500 * 3
+
+
+@pytest.mark.parametrize('tracker_class', [BYTETracker, ArrayBYTETracker])
+def test_trackers_number_their_tracks_from_1(tracker_class):
+    args = Namespace(track_thresh=0.5, track_buffer=30, mot20=False, match_thresh=0.8)
+    dets = np.array([[100., 100., 200., 300., 0.9], [400., 100., 500., 300., 0.9]])
+    first, second = tracker_class(args), tracker_class(args)
+    first.update(dets, (1080, 1920), (1080, 1920))
+    first_ids = [track.track_id for track in first.update(dets, (1080, 1920), (1080, 1920))]
+    second_ids = [track.track_id for track in second.update(dets, (1080, 1920), (1080, 1920))]
+    assert first_ids == second_ids == [1, 2]
+    # A shared allocator numbers the tracks of both trackers
+    allocator = IdAllocator()
+    third, fourth = tracker_class(args, id_allocator=allocator), tracker_class(args, id_allocator=allocator)
+    third.update(dets, (1080, 1920), (1080, 1920))
+    assert [track.track_id for track in fourth.update(dets, (1080, 1920), (1080, 1920))] == [3, 4]
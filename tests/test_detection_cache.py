@@ -0,0 +1,90 @@
+import os
+
+import numpy as np
+import pytest
+
+from infer_bytetrack.yolox.evaluators.detection_cache import DetectionCache
+
+
+@pytest.fixture
+def checkpoint(tmp_path):
+    path = tmp_path / "model.pth"
+    path.write_bytes(b"weights")
+    return str(path)
+
+
+def make_cache(cache_dir, checkpoint, **settings):
+    return DetectionCache(str(cache_dir), checkpoint, (800, 1440), 0.01, 0.7, num_classes=1, **settings)
+
+
+def write(cache, images):
+    cache.open()
+    for image in images:
+        cache.add(*image)
+    cache.close()
+
+
+def random_images(rng, count=6):
+    images = []
+    for i in range(count):
+        # Some images have no object, `postprocess` then returns None
+        output = None if i % 3 == 1 else rng.uniform(0, 100, (int(rng.integers(0, 5)), 7))
+        images.append((i + 10, output, 1080, 1920, i + 1, 1, "MOT17-02/img1/{:06d}.jpg".format(i + 1)))
+    return images
+
+
+def test_round_trip(tmp_path, checkpoint):
+    images = random_images(np.random.default_rng(0))
+    cache = make_cache(tmp_path / "cache", checkpoint)
+    assert not cache.exists()
+    write(cache, images)
+    assert cache.exists()
+    assert not os.path.exists(cache.path + ".tmp")
+
+    # Another evaluation with the same settings finds the cache
+    cache = make_cache(tmp_path / "cache", checkpoint)
+    assert cache.exists()
+    cache.load()
+    assert len(cache) == len(images)
+    for (img_id, output, height, width, frame_id, video_id, file_name), image in zip(cache, images):
+        assert (img_id, height, width, frame_id, video_id, file_name) == image[:1] + image[2:]
+        if image[1] is None:
+            assert output is None
+        else:
+            np.testing.assert_array_equal(output, image[1].astype(np.float32))
+            assert not output.flags.writeable
+
+
+def test_empty_detections(tmp_path, checkpoint):
+    write(make_cache(tmp_path, checkpoint),
+          [(1, None, 10, 10, 1, 1, "a.jpg"), (2, np.empty((0, 7)), 10, 10, 2, 1, "b.jpg")])
+    cache = make_cache(tmp_path, checkpoint).load()
+    assert cache[0][1] is None
+    assert cache[1][1].shape == (0, 7)
+
+
+def test_settings_change_is_a_miss(tmp_path, checkpoint):
+    write(make_cache(tmp_path, checkpoint), random_images(np.random.default_rng(1)))
+    assert make_cache(tmp_path, checkpoint).exists()
+    assert not make_cache(tmp_path, checkpoint, half=True).exists()
+    assert not DetectionCache(str(tmp_path), checkpoint, (800, 1440), 0.1, 0.7, num_classes=1).exists()
+
+    # A retrained checkpoint at the same path changes the signature
+    with open(checkpoint, "ab") as f:
+        f.write(b"more weights")
+    assert not make_cache(tmp_path, checkpoint).exists()
+
+
+def test_interrupted_write_leaves_no_cache(tmp_path, checkpoint):
+    cache = make_cache(tmp_path, checkpoint)
+    cache.open()
+    cache.add(*random_images(np.random.default_rng(2))[0])
+    assert not cache.exists()
+    cache.discard()
+    assert not cache.exists()
+    assert not os.path.exists(cache.path + ".tmp")
+    # A stale temporary folder is replaced by the next write
+    cache.open()
+    cache.add(*random_images(np.random.default_rng(2))[0])
+    cache.close()
+    assert make_cache(tmp_path, checkpoint).exists()
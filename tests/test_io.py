@@ -0,0 +1,266 @@
+import os
+
+import numpy as np
+import pytest
+
+from infer_bytetrack.yolox.tracking_utils import io
+from infer_bytetrack.yolox.tracking_utils.io import RESULT_DTYPE, ResultColumns, ResultWriter
+
+
+def make_results(seed, num_frames=30):
+    """(frame id, tlwhs, track ids, scores) of every frame, with Python float values and negative ids"""
+    rng = np.random.default_rng(seed)
+    results = []
+    for frame_id in range(1, num_frames + 1):
+        count = int(rng.integers(0, 6))
+        tlwhs = np.round(rng.uniform(-10, 1900, (count, 4)), int(rng.integers(1, 5)))
+        track_ids = rng.choice([-1, 1, 2, 3, 4, 5, 6, 7], size=count, replace=False)
+        scores = rng.uniform(0, 1, count)
+        results.append((frame_id, tlwhs.tolist(), track_ids.tolist(), scores.tolist()))
+    return results
+
+
+def old_write_results(filename, results, with_scores=True):
+    """The str.format writers `ResultWriter` replaced, on Python floats"""
+    if with_scores:
+        save_format = '{frame},{id},{x1},{y1},{w},{h},{s},-1,-1,-1\n'
+    else:
+        save_format = '{frame},{id},{x1},{y1},{w},{h},-1,-1,-1,-1\n'
+    with open(filename, 'w') as f:
+        for frame_id, tlwhs, track_ids, scores in results:
+            for tlwh, track_id, score in zip(tlwhs, track_ids, scores):
+                if track_id < 0:
+                    continue
+                x1, y1, w, h = tlwh
+                f.write(save_format.format(frame=frame_id, id=track_id, x1=round(x1, 1), y1=round(y1, 1),
+                                           w=round(w, 1), h=round(h, 1), s=round(score, 2)))
+
+
+def write(filename, results, **kwargs):
+    with ResultWriter(filename, **kwargs) as writer:
+        for frame_id, tlwhs, track_ids, scores in results:
+            writer.add(frame_id, tlwhs, track_ids, scores)
+    return writer
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('with_scores', [True, False])
+@pytest.mark.parametrize('buffer_size', [1, 7, 65536])
+def test_text_matches_old_writer(tmp_path, seed, with_scores, buffer_size):
+    results = make_results(seed)
+    # Near-ties and values rounding to -0.0
+    results.append((31, [[1453.45, 0.25, 2.675, -0.04]], [1], [0.125]))
+    old_write_results(str(tmp_path / 'old.txt'), results, with_scores)
+    writer = write(str(tmp_path / 'new.txt'), results, with_scores=with_scores, buffer_size=buffer_size)
+    assert (tmp_path / 'new.txt').read_text() == (tmp_path / 'old.txt').read_text()
+    assert writer.num_rows == len((tmp_path / 'old.txt').read_text().splitlines())
+
+
+@pytest.mark.parametrize('buffer_size', [1, 7, 65536])
+def test_binary_round_trip(tmp_path, buffer_size):
+    filename = str(tmp_path / 'tracks.bin')
+    results = make_results(0)
+    write(filename, results, binary=True, buffer_size=buffer_size)
+    assert os.path.isfile(filename + '.index.npz')
+    rows = [(frame_id, track_id, tlwh, score) for frame_id, tlwhs, track_ids, scores in results
+            for tlwh, track_id, score in zip(tlwhs, track_ids, scores) if track_id >= 0]
+    columns = ResultColumns(filename)
+    assert len(columns) == len(rows)
+    np.testing.assert_array_equal(columns.frame_ids, sorted({row[0] for row in rows}))
+    np.testing.assert_array_equal(columns.track_ids, sorted({row[1] for row in rows}))
+    for frame_id in range(0, 33):
+        records = columns.frame(frame_id)
+        expected = [row for row in rows if row[0] == frame_id]
+        assert records.dtype == RESULT_DTYPE
+        # Rows of a frame in writing order
+        assert records['id'].tolist() == [row[1] for row in expected]
+        np.testing.assert_allclose(records['tlwh'], np.array([row[2] for row in expected]).reshape(-1, 4), rtol=1e-6)
+        np.testing.assert_allclose(records['score'], [row[3] for row in expected], rtol=1e-6)
+    for track_id in range(-1, 9):
+        records = columns.track(track_id)
+        assert records['frame'].tolist() == [row[0] for row in rows if row[1] == track_id]
+    mot_columns = columns.to_columns()
+    assert len(mot_columns) == len(rows)
+    np.testing.assert_array_equal(mot_columns.frame_ids, columns.frame_ids)
+
+
+def test_index_is_rebuilt_when_stale(tmp_path):
+    filename = str(tmp_path / 'tracks.bin')
+    results = make_results(1)
+    write(filename, results[:10], binary=True)
+    # Rows appended without closing the writer: the index of the first ten frames is stale
+    writer = ResultWriter(filename, binary=True, append=True)
+    for frame_id, tlwhs, track_ids, scores in results[10:]:
+        writer.add(frame_id, tlwhs, track_ids, scores)
+    writer.flush()
+    columns = ResultColumns(filename)
+    num_rows = sum(track_id >= 0 for _, _, track_ids, _ in results for track_id in track_ids)
+    assert len(columns) == num_rows
+    np.testing.assert_array_equal(columns.frame_ids, sorted({frame_id for frame_id, _, track_ids, _ in results
+                                                             if max(track_ids + [-1]) >= 0}))
+    writer.close()
+    with np.load(filename + '.index.npz') as index:
+        assert int(index['num_rows']) == num_rows
+
+
+def test_append(tmp_path):
+    results = make_results(2)
+    old_write_results(str(tmp_path / 'old.txt'), results)
+    write(str(tmp_path / 'new.txt'), results[:12])
+    write(str(tmp_path / 'new.txt'), results[12:], append=True)
+    assert (tmp_path / 'new.txt').read_text() == (tmp_path / 'old.txt').read_text()
+
+
+def test_empty_binary_file(tmp_path):
+    filename = str(tmp_path / 'empty.bin')
+    write(filename, [(1, [], [], [])], binary=True)
+    columns = ResultColumns(filename)
+    assert len(columns) == 0 and len(columns.frame(1)) == 0 and len(columns.track(1)) == 0
+
+
+def old_read_mot_results(filename, is_gt, is_ignore):
+    """The line parser `read_mot_results` had before the columnar loader"""
+    valid_labels = {1}
+    ignore_labels = {2, 7, 8, 12}
+    results_dict = dict()
+    if os.path.isfile(filename):
+        with open(filename, 'r') as f:
+            for line in f.readlines():
+                linelist = line.split(',')
+                if len(linelist) < 7:
+                    continue
+                fid = int(linelist[0])
+                if fid < 1:
+                    continue
+                results_dict.setdefault(fid, list())
+                if is_gt:
+                    if 'MOT16-' in filename or 'MOT17-' in filename:
+                        label = int(float(linelist[7]))
+                        mark = int(float(linelist[6]))
+                        if mark == 0 or label not in valid_labels:
+                            continue
+                    score = 1
+                elif is_ignore:
+                    if 'MOT16-' in filename or 'MOT17-' in filename:
+                        label = int(float(linelist[7]))
+                        vis_ratio = float(linelist[8])
+                        if label not in ignore_labels and vis_ratio >= 0:
+                            continue
+                    else:
+                        continue
+                    score = 1
+                else:
+                    score = float(linelist[6])
+                tlwh = tuple(map(float, linelist[2:6]))
+                target_id = int(linelist[1])
+                results_dict[fid].append((tlwh, target_id, score))
+    return results_dict
+
+
+def old_read_mot_detections(filename):
+    """The `np.loadtxt` reader `read_mot_detections` had before the columnar loader"""
+    if not os.path.isfile(filename) or os.path.getsize(filename) == 0:
+        return dict()
+    data = np.loadtxt(filename, delimiter=',', ndmin=2, usecols=range(7))
+    data = data[np.argsort(data[:, 0], kind='stable')]
+    frames = data[:, 0].astype(int)
+    dets = np.empty((len(data), 5))
+    dets[:, :2] = data[:, 2:4]
+    dets[:, 2:4] = data[:, 2:4] + data[:, 4:6]
+    dets[:, 4] = data[:, 6]
+    frame_ids, starts = np.unique(frames, return_index=True)
+    return {int(fid): frame_dets for fid, frame_dets in zip(frame_ids, np.split(dets, starts[1:]))}
+
+
+def make_mot_lines(seed, num_values=9, num_rows=300, min_frame=1):
+    """Rows of a MOT file, frames out of order, with the marks, classes and visibilities of MOT17 gt"""
+    rng = np.random.default_rng(seed)
+    lines = []
+    for _ in range(num_rows):
+        values = [str(int(rng.integers(min_frame, 40))), str(int(rng.integers(1, 30)))]
+        values += ['{:.2f}'.format(v) for v in rng.uniform(-5, 1900, 4)]
+        values += [str(int(rng.integers(0, 2))), str(int(rng.integers(1, 14))),
+                   '{:.3f}'.format(rng.choice([-1., rng.uniform()]))]
+        lines.append(','.join(values[:num_values]))
+    return lines
+
+
+# MOT16/17 ground truth has classes and visibilities
+@pytest.mark.parametrize('name, num_values', [
+    ('MOT17-02-FRCNN/gt/gt.txt', 9), ('MOT17-02-FRCNN/gt/gt.txt', 'ragged'), ('MOT16-05/gt/gt.txt', 9),
+    ('MOT16-05/gt/gt.txt', 'ragged'), ('custom/gt/gt.txt', 9), ('custom/gt/gt.txt', 7), ('custom/gt/gt.txt', 'ragged')])
+def test_read_mot_results_matches_line_parser(tmp_path, name, num_values):
+    filename = tmp_path / name
+    filename.parent.mkdir(parents=True)
+    if num_values == 'ragged':
+        # Rows of 6 to 10 values, the short ones are skipped, and frames below 1. The old parser
+        # fails on rows of 7 values in MOT16/17 ground truth, they are only read from other files
+        lines = [line + ',-1' * (i % 2) for i, line in enumerate(make_mot_lines(0, min_frame=-1))]
+        lines += ['3,1,10,10,20,20'] + (['4,2,10,10,20,20,1'] if 'custom' in name else [])
+    else:
+        lines = make_mot_lines(0, num_values)
+    filename.write_text('\n'.join(lines) + '\n')
+    for is_gt, is_ignore in [(False, False), (True, False), (False, True)]:
+        expected = old_read_mot_results(str(filename), is_gt, is_ignore)
+        assert io.read_mot_results(str(filename), is_gt, is_ignore) == expected
+        assert io.read_results(str(filename), 'mot', is_gt, is_ignore) == expected
+
+
+def test_read_mot_results_of_missing_or_empty_file(tmp_path):
+    assert io.read_mot_results(str(tmp_path / 'missing.txt'), False, False) == {}
+    (tmp_path / 'empty.txt').write_text('')
+    assert io.read_mot_results(str(tmp_path / 'empty.txt'), True, False) == {}
+    assert io.read_mot_detections(str(tmp_path / 'empty.txt')) == {}
+
+
+@pytest.mark.parametrize('num_values', [7, 10])
+def test_read_mot_detections_matches_loadtxt(tmp_path, num_values):
+    filename = tmp_path / 'det.txt'
+    lines = make_mot_lines(1, min(num_values, 9))
+    filename.write_text('\n'.join(line + ',-1' * (num_values - 9) for line in lines) + '\n')
+    expected = old_read_mot_detections(str(filename))
+    detections = io.read_mot_detections(str(filename))
+    assert sorted(detections) == sorted(expected)
+    for frame_id, dets in expected.items():
+        np.testing.assert_array_equal(detections[frame_id], dets)
+
+
+def test_sidecar_follows_the_text_file(tmp_path, monkeypatch):
+    filename = tmp_path / 'gt.txt'
+    lines = make_mot_lines(2)
+    filename.write_text('\n'.join(lines) + '\n')
+    columns = io.read_mot_columns(str(filename), sidecar=True)
+    assert os.path.isfile(str(filename) + '.npz')
+    parse = io._parse_mot_values
+    parsed = []
+    monkeypatch.setattr(io, '_parse_mot_values', lambda name: parsed.append(name) or parse(name))
+    # Unchanged text file: the columns come from the sidecar
+    reloaded = io.read_mot_columns(str(filename), sidecar=True)
+    assert parsed == []
+    for name in ('frames', 'ids', 'tlwhs', 'scores', 'classes', 'visibilities', 'starts'):
+        np.testing.assert_array_equal(getattr(reloaded, name), getattr(columns, name))
+    # A row more changes the size of the file
+    filename.write_text('\n'.join(lines + ['45,1,1,2,3,4,1,1,1']) + '\n')
+    assert io.read_mot_columns(str(filename), sidecar=True).frames.max() == 45
+    assert len(parsed) == 1
+    # Same size, other values: only the modification time changes
+    stat = os.stat(str(filename))
+    filename.write_text('\n'.join(lines + ['46,1,1,2,3,4,1,1,1']) + '\n')
+    os.utime(str(filename), ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+    assert io.read_mot_columns(str(filename), sidecar=True).frames.max() == 46
+    assert len(parsed) == 2
+    io.read_mot_columns(str(filename), sidecar=True)
+    assert len(parsed) == 2
+    # Without the sidecar option the file is always parsed
+    io.read_mot_columns(str(filename))
+    assert len(parsed) == 3
+
+
+def test_sidecar_path(tmp_path):
+    filename = tmp_path / 'gt.txt'
+    filename.write_text('\n'.join(make_mot_lines(3)) + '\n')
+    sidecar = str(tmp_path / 'cache' / 'gt.npz')
+    os.makedirs(os.path.dirname(sidecar))
+    columns = io.read_mot_columns(str(filename), sidecar=sidecar)
+    assert os.path.isfile(sidecar) and not os.path.isfile(str(filename) + '.npz')
+    np.testing.assert_array_equal(io.MOTColumns.load(sidecar).ids, columns.ids)
@@ -0,0 +1,100 @@
+import numpy as np
+import pytest
+
+from infer_bytetrack.yolox.tracker import iou
+
+SHAPES = [(0, 5), (5, 0), (0, 0), (1, 1), (37, 23)]
+
+
+def reference_overlaps(boxes, query_boxes):
+    """The loop of `cython_bbox.bbox_overlaps`"""
+    overlaps = np.zeros((len(boxes), len(query_boxes)))
+    for k, (qx1, qy1, qx2, qy2) in enumerate(query_boxes.tolist()):
+        box_area = (qx2 - qx1 + 1) * (qy2 - qy1 + 1)
+        for n, (x1, y1, x2, y2) in enumerate(boxes.tolist()):
+            iw = min(x2, qx2) - max(x1, qx1) + 1
+            if iw > 0:
+                ih = min(y2, qy2) - max(y1, qy1) + 1
+                if ih > 0:
+                    ua = (x2 - x1 + 1) * (y2 - y1 + 1) + box_area - iw * ih
+                    overlaps[n, k] = iw * ih / ua
+    return overlaps
+
+
+def make_boxes(rng, count, size=200.):
+    # Small image for many overlaps, half of the corners on integers for boxes touching exactly
+    boxes = iou.random_boxes(count, rng, size)
+    boxes[::2] = np.round(boxes[::2])
+    return boxes
+
+
+@pytest.fixture
+def default_backend():
+    backend = iou.get_default_backend()
+    yield backend
+    iou.set_default_backend(backend)
+
+
+@pytest.mark.parametrize('backend', sorted(iou.BACKENDS))
+@pytest.mark.parametrize('shape', SHAPES)
+def test_backends_match_cython_loop(backend, shape):
+    if backend not in iou.available_backends():
+        pytest.skip('{} is not installed'.format(backend))
+    rng = np.random.default_rng(0)
+    boxes, query_boxes = make_boxes(rng, shape[0]), make_boxes(rng, shape[1])
+    expected = reference_overlaps(boxes, query_boxes)
+    overlaps = iou.bbox_overlaps(boxes, query_boxes, backend=backend)
+    assert overlaps.shape == shape and overlaps.dtype == np.float64
+    np.testing.assert_allclose(overlaps, expected, rtol=1e-12, atol=0)
+    if backend != 'cython':
+        overlaps32 = iou.bbox_overlaps(boxes, query_boxes, dtype=np.float32, backend=backend)
+        assert overlaps32.dtype == np.float32
+        np.testing.assert_allclose(overlaps32, expected, atol=1e-5)
+
+
+@pytest.mark.parametrize('backend', ['cython', 'numba'])
+def test_numpy_matches_other_backends(backend):
+    if backend not in iou.available_backends():
+        pytest.skip('{} is not installed'.format(backend))
+    rng = np.random.default_rng(1)
+    boxes, query_boxes = make_boxes(rng, 300), make_boxes(rng, 200)
+    np.testing.assert_array_equal(iou.overlaps_numpy(boxes, query_boxes),
+                                  iou.bbox_overlaps(boxes, query_boxes, backend=backend))
+
+
+@pytest.mark.parametrize('chunk_size', [1, 5, 36, 37, 38, None])
+def test_numpy_chunks(chunk_size):
+    rng = np.random.default_rng(2)
+    boxes, query_boxes = make_boxes(rng, 37), make_boxes(rng, 23)
+    expected = reference_overlaps(boxes, query_boxes)
+    np.testing.assert_array_equal(iou.overlaps_numpy(boxes, query_boxes, chunk_size=chunk_size), expected)
+    # The output is written in place, whatever it held before
+    out = np.full((37, 23), np.nan)
+    assert iou.overlaps_numpy(boxes, query_boxes, out=out, chunk_size=chunk_size) is out
+    np.testing.assert_array_equal(out, expected)
+
+
+@pytest.mark.parametrize('rows', [1, 261, 262, 263, 525])
+def test_numpy_default_chunks(rows):
+    # 1000 query boxes make chunks of CHUNK_ELEMENTS // 1000 = 262 rows
+    assert iou.CHUNK_ELEMENTS // 1000 == 262
+    rng = np.random.default_rng(3)
+    boxes, query_boxes = make_boxes(rng, rows, 1000.), make_boxes(rng, 1000, 1000.)
+    expected = np.vstack([iou.overlaps_numpy(box[None], query_boxes) for box in boxes])
+    np.testing.assert_array_equal(iou.overlaps_numpy(boxes, query_boxes), expected)
+    np.testing.assert_array_equal(expected[:3, :40], reference_overlaps(boxes[:3], query_boxes[:40]))
+
+
+def test_set_default_backend(default_backend, monkeypatch):
+    calls = []
+    monkeypatch.setitem(iou.BACKENDS, 'numpy', lambda *args, **kwargs: calls.append(args) or 'numpy')
+    iou.set_default_backend('numpy')
+    assert iou.get_default_backend() == 'numpy'
+    assert iou.bbox_overlaps(np.zeros((1, 4)), np.zeros((1, 4))) == 'numpy'
+    assert len(calls) == 1
+    with pytest.raises(ValueError):
+        iou.set_default_backend('opencl')
+    for backend in set(iou.BACKENDS) - set(iou.available_backends()):
+        with pytest.raises(ImportError):
+            iou.set_default_backend(backend)
+    assert iou.get_default_backend() == 'numpy'
@@ -0,0 +1,112 @@
+import numpy as np
+import pytest
+
+from infer_bytetrack.yolox.tracker import iou, matching
+
+
+def random_boxes(rng, count, width=640, height=480):
+    """Boxes of very different sizes, with points and lines among them"""
+    corners = rng.uniform([-20, -20], [width, height], size=(count, 2))
+    sides = rng.choice([2., 20., 60., 400.], size=(count, 1)) * rng.uniform(0.2, 1., size=(count, 2))
+    sides[rng.uniform(size=count) < 0.1, 0] = 0
+    sides[rng.uniform(size=count) < 0.1, 1] = 0
+    # Integer corners, for boxes to touch exactly
+    return np.round(np.hstack([corners, corners + sides]))
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('shape', [(0, 5), (5, 0), (0, 0), (1, 1), (30, 40), (200, 150)])
+def test_sparse_iou_distance_matches_dense(seed, shape):
+    rng = np.random.default_rng(seed)
+    atlbrs, btlbrs = random_boxes(rng, shape[0]), random_boxes(rng, shape[1])
+    # Some pairs of identical boxes, whose cost is 0
+    common = min(shape[0], shape[1], 3)
+    btlbrs[:common] = atlbrs[:common]
+    cost_matrix = matching.sparse_iou_distance(atlbrs, btlbrs)
+    assert cost_matrix.shape == shape
+    # Every stored pair overlaps, the others cost 1 in the dense matrix
+    dense = np.ones(shape)
+    dense[cost_matrix.row, cost_matrix.col] = cost_matrix.data
+    assert np.all(cost_matrix.data < 1)
+    assert len(set(zip(cost_matrix.row.tolist(), cost_matrix.col.tolist()))) == cost_matrix.nnz
+    np.testing.assert_allclose(dense, matching.iou_distance(atlbrs, btlbrs), atol=1e-12)
+
+
+@pytest.mark.parametrize('cell_size', [1., 7., 50., 1000.])
+def test_iou_pairs_do_not_depend_on_the_grid(cell_size):
+    # Small cells make most boxes span many of them
+    rng = np.random.default_rng(0)
+    atlbrs, btlbrs = random_boxes(rng, 60), random_boxes(rng, 50)
+    rows, cols, ious = matching.iou_pairs(atlbrs, btlbrs, cell_size)
+    dense = matching.ious(atlbrs, btlbrs)
+    expected_rows, expected_cols = np.nonzero(dense > 0)
+    order = np.lexsort((cols, rows))
+    np.testing.assert_array_equal(rows[order], expected_rows)
+    np.testing.assert_array_equal(cols[order], expected_cols)
+    np.testing.assert_allclose(ious[order], dense[expected_rows, expected_cols], atol=1e-12)
+
+
+def test_grid_cells_cover_the_boxes():
+    tlbrs = np.array([[0., 0., 9., 9.], [5., 12., 5., 12.], [-15., -1., 25., 3.]])
+    xs, ys, index = matching._grid_cells(tlbrs, 10.)
+    cells = {i: sorted(zip(xs[index == i].tolist(), ys[index == i].tolist())) for i in range(3)}
+    # Boxes count their last pixel, 0-9 reaches the cell of 10
+    assert cells[0] == [(0, 0), (0, 1), (1, 0), (1, 1)]
+    assert cells[1] == [(0, 1)]
+    assert cells[2] == [(x, y) for x in range(-2, 3) for y in (-1, 0)]
+
+
+def fusion_inputs(seed, shape):
+    rng = np.random.default_rng(seed)
+    atlbrs, btlbrs = random_boxes(rng, shape[0], 200, 150), random_boxes(rng, shape[1], 200, 150)
+    return atlbrs, btlbrs, np.round(rng.uniform(0.1, 1., shape[1]), 3)
+
+
+@pytest.mark.parametrize('seed', range(5))
+@pytest.mark.parametrize('shape', [(0, 5), (5, 0), (0, 0), (1, 1), (20, 30), (40, 25)])
+@pytest.mark.parametrize('fuse', [False, True])
+@pytest.mark.parametrize('thresh', [0.5, 0.8])
+def test_fused_cost_matches_fuse_score(seed, shape, fuse, thresh):
+    atlbrs, btlbrs, scores = fusion_inputs(seed, shape)
+    scores = scores if fuse else None
+    expected = matching.iou_distance(atlbrs, btlbrs)
+    if fuse:
+        expected = matching.fuse_score(expected, scores)
+    for backend in iou.available_backends():
+        cost_matrix = iou.fused_cost(atlbrs, btlbrs, scores, thresh, backend=backend)
+        # The costs above the threshold are gated to thresh + 1
+        gated = expected > thresh
+        np.testing.assert_allclose(cost_matrix[~gated], expected[~gated], atol=1e-12)
+        assert np.all(cost_matrix[gated] == thresh + 1)
+    cost_matrix = matching.fused_iou_distance(atlbrs, btlbrs, scores, thresh)
+    # The default solver of the trackers, and scipy which needs no extra package
+    for backend in (None, 'scipy'):
+        solution = matching.linear_assignment(cost_matrix, thresh, backend)
+        for result, reference in zip(solution, matching.linear_assignment(expected, thresh, backend)):
+            np.testing.assert_array_equal(result, reference)
+
+
+def test_cost_buffer_is_reused():
+    buffer = matching.CostBuffer(np.float32)
+    data = []
+    # Shapes of the successive association steps of a tracker
+    for seed, shape in enumerate([(3, 4), (10, 10), (2, 3), (0, 5), (12, 9), (12, 10), (1, 1), (20, 20)]):
+        atlbrs, btlbrs, scores = fusion_inputs(seed, shape)
+        cost_matrix = matching.fused_iou_distance(atlbrs, btlbrs, scores, 0.8, buffer, np.float32)
+        assert cost_matrix.shape == shape and cost_matrix.dtype == np.float32 and cost_matrix.flags.c_contiguous
+        np.testing.assert_array_equal(cost_matrix, matching.fused_iou_distance(atlbrs, btlbrs, scores, 0.8,
+                                                                               dtype=np.float32))
+        assert np.shares_memory(cost_matrix, buffer._data) or cost_matrix.size == 0
+        data.append(len(buffer._data))
+    # The buffer only grows, at least doubling
+    assert data == [12, 100, 100, 100, 200, 200, 200, 400]
+
+
+@pytest.mark.parametrize('dtype', [np.float32, np.float64])
+def test_fuse_score_keeps_the_cost_dtype(dtype):
+    atlbrs, btlbrs, scores = fusion_inputs(0, (20, 30))
+    dense = matching.fuse_score(matching.iou_distance(atlbrs, btlbrs, dtype), scores)
+    sparse = matching.fuse_score(matching.sparse_iou_distance(atlbrs, btlbrs, dtype), scores)
+    assert dense.dtype == sparse.dtype == dtype
+    dense[dense == 1] = 0
+    np.testing.assert_allclose(sparse.toarray(), dense, atol=1e-6)
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from infer_bytetrack.yolox.tracking_utils.metrics import COUNTS, clear_mot
+
+mm = pytest.importorskip("motmetrics")
+
+METRICS = ['num_frames', 'num_objects', 'num_predictions', 'num_matches', 'num_switches', 'num_false_positives',
+           'num_misses', 'idtp', 'idfp', 'idfn', 'mota', 'idf1']
+
+
+def make_sequence(seed, num_frames=60, num_objects=15):
+    """Crowded ground truth, noisy tracks with misses, false positives and id swaps, and ignore regions"""
+    rng = np.random.default_rng(seed)
+    start = np.column_stack([rng.uniform(0, 400, (num_objects, 2)), rng.uniform(20, 60, (num_objects, 2))])
+    velocity = rng.normal(0, 3, (num_objects, 2))
+    gt, results, ignore = [], [], []
+    swap = {}
+    for frame in range(1, num_frames + 1):
+        tlwhs = start.copy()
+        tlwhs[:, :2] += velocity * frame
+        for obj, tlwh in enumerate(tlwhs):
+            if rng.uniform() < 0.1:
+                continue
+            gt.append((frame, obj + 1, tlwh))
+            if rng.uniform() < 0.15:
+                continue
+            if rng.uniform() < 0.02:
+                swap[obj] = int(rng.integers(100, 200))
+            noisy = tlwh + rng.normal(0, 0.3, 4) * tlwh[[2, 3, 2, 3]]
+            results.append((frame, swap.get(obj, obj + 1), noisy))
+        for _ in range(int(rng.integers(0, 4))):
+            results.append((frame, int(rng.integers(300, 310)), np.concatenate([rng.uniform(0, 500, 2),
+                                                                                rng.uniform(20, 60, 2)])))
+        # Ignore regions, some of them covering a result
+        for _ in range(int(rng.integers(0, 3))):
+            region = np.concatenate([rng.uniform(0, 500, 2), rng.uniform(20, 60, 2)])
+            ignore.append((frame, -1, region))
+            if rng.uniform() < 0.7:
+                results.append((frame, int(rng.integers(400, 410)), region + rng.normal(0, 2, 4)))
+    # Frames without any track still count as evaluated frames
+    results = [r for r in results if r[0] % 17 != 0]
+    return [as_arrays(rows) for rows in (gt, results, ignore)]
+
+
+def as_arrays(rows):
+    rows = sorted(rows, key=lambda row: row[0])
+    return (np.array([row[0] for row in rows], dtype=np.int64), np.array([row[1] for row in rows], dtype=np.int64),
+            np.array([row[2] for row in rows], dtype=np.float64).reshape(-1, 4))
+
+
+def iou_matrix(objs, hyps, max_iou):
+    """`mm.distances.iou_matrix`, whose `np.asfarray` is gone from NumPy 2"""
+    if np.size(objs) == 0 or np.size(hyps) == 0:
+        return np.empty((0, 0))
+    dist = 1 - mm.distances.boxiou(objs[:, None], hyps[None, :])
+    return np.where(dist > max_iou, np.nan, dist)
+
+
+def motmetrics_reference(gt, results, ignore, frames, max_dist):
+    """`Evaluator.eval_frame` of every frame, with `max_dist` instead of 0.5"""
+    acc = mm.MOTAccumulator(auto_id=True)
+    for frame in frames:
+        gt_rows = gt[0] == frame
+        res_rows = results[0] == frame
+        trk_ids, trk_tlwhs = results[1][res_rows], results[2][res_rows]
+        ignore_tlwhs = ignore[2][ignore[0] == frame]
+        keep = np.ones(len(trk_ids), dtype=bool)
+        iou_distance = iou_matrix(ignore_tlwhs, trk_tlwhs, max_iou=max_dist)
+        if len(iou_distance) > 0:
+            match_is, match_js = mm.lap.linear_sum_assignment(iou_distance)
+            match_is, match_js = np.asarray(match_is, dtype=int), np.asarray(match_js, dtype=int)
+            keep[match_js[~np.isnan(iou_distance[match_is, match_js])]] = False
+        trk_ids, trk_tlwhs = trk_ids[keep], trk_tlwhs[keep]
+        acc.update(gt[1][gt_rows], trk_ids, iou_matrix(gt[2][gt_rows], trk_tlwhs, max_iou=max_dist))
+    summary = mm.metrics.create().compute(acc, metrics=METRICS)
+    return {name: summary[name].iloc[0] for name in METRICS}
+
+
+@pytest.mark.parametrize('seed', range(3))
+@pytest.mark.parametrize('max_dist', [0.5, 0.7])
+def test_clear_mot_matches_motmetrics(seed, max_dist):
+    # Above 0.5, the center prefilter of the candidate pairs is bypassed
+    gt, results, ignore = make_sequence(seed)
+    frames = np.arange(1, 61)
+    metrics = clear_mot(gt, results, ignore, frames=frames, max_dist=max_dist)
+    reference = motmetrics_reference(gt, results, ignore, frames, max_dist)
+    assert metrics['num_switches'] > 0 and metrics['num_predictions'] < len(results[0])
+    for name in METRICS:
+        if name in COUNTS or name == 'num_frames':
+            assert metrics[name] == reference[name], name
+        else:
+            assert metrics[name] == pytest.approx(reference[name]), name
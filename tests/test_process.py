@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+dataprocess = pytest.importorskip("ikomia.dataprocess")
+
+from infer_bytetrack.infer_bytetrack_process import InferBytetrack, InferBytetrackParam  # noqa: E402
+
+IMAGE = np.zeros((480, 640, 3), dtype=np.uint8)
+
+
+def run_frame(task, boxes):
+    """Run the task on one frame with `boxes` (x, y, w, h) detected, return its output 3 data"""
+    task.get_input(0).set_image(IMAGE)
+    detections = dataprocess.CObjectDetectionIO()
+    detections.init("detector", 0)
+    for index, box in enumerate(boxes):
+        detections.add_object(index, "person", 0.9, *box, [0, 0, 255])
+    task.set_input(detections, 1)
+    task.set_input(dataprocess.CInstanceSegmentationIO(), 2)
+    task.run()
+    return task.get_output(3).data
+
+
+@pytest.mark.parametrize("backend", ["object", "array"])
+def test_empty_detection_frame_is_not_coasted(backend):
+    param = InferBytetrackParam()
+    param.backend = backend
+    param.detector_stride = 3
+    task = InferBytetrack("infer_bytetrack", param)
+    box = [100., 100., 50., 120.]
+    schedule = [run_frame(task, [box]) for _ in range(3)]
+    # The object left the scene: the detection frame sees nothing, the coasted frames predict nothing
+    schedule += [run_frame(task, []) for _ in range(3)]
+    assert [data["detection_frame"] for data in schedule] == [1, 0, 0, 1, 0, 0]
+    assert [data["predicted_ids"] for data in schedule] == [[], [1], [1], [], [], []]
+    # The empty detection frame advanced the tracker too
+    assert task.trackers.get("").frame_id == 6
+
+
+class FakeClock(object):
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_evicted_stream_closes_its_trajectory_file(tmp_path):
+    param = InferBytetrackParam()
+    param.trajectory_file = str(tmp_path / "tracks.txt")
+    task = InferBytetrack("infer_bytetrack", param)
+    box = [100., 100., 50., 120.]
+    task.get_param_object().stream_id = "a"
+    run_frame(task, [box])
+    run_frame(task, [box])
+    # Stream a is idle for longer than the stream timeout when stream b comes
+    task.trackers.clock = FakeClock(task.trackers.clock() + 2 * param.stream_timeout)
+    task.get_param_object().stream_id = "b"
+    run_frame(task, [box])
+    assert list(task.trajectory_writers) == ["b"]
+    filename = tmp_path / "tracks_a.txt"
+    assert [line.split(",")[:2] for line in filename.read_text().splitlines()] == [["1", "1"], ["2", "1"]]
+    # Back with a new tracker, stream a appends to its file and goes on counting its frames
+    task.get_param_object().stream_id = "a"
+    run_frame(task, [box])
+    task.stop()
+    assert task.trajectory_writers == {}
+    lines = filename.read_text().splitlines()
+    assert [line.split(",")[:2] for line in lines] == [["1", "1"], ["2", "1"], ["3", "2000001"]]
@@ -0,0 +1,26 @@
+from infer_bytetrack.yolox.tracking_utils.timer import StageProfiler
+
+
+def test_merge_keeps_the_updates_of_every_profiler():
+    profilers = [StageProfiler(window=10) for _ in range(3)]
+    for i, profiler in enumerate(profilers):
+        for _ in range(i + 2):
+            profiler.start()
+            profiler.mark('predict')
+            profiler.mark('association')
+            profiler.count('tracked', i)
+            profiler.shape('first_association', (i, 2 * i))
+    merged = StageProfiler.merge(profilers)
+    summary = merged.summary()
+    assert summary['frames'] == 2 + 3 + 4
+    assert len(merged.times['predict']) == len(merged.times['association']) == 9
+    assert 'total' in summary['times_ms']
+    assert sorted(merged.counts['tracked']) == [0] * 2 + [1] * 3 + [2] * 4
+    assert summary['cost_shapes']['first_association']['cols']['mean'] == (0 * 2 + 2 * 3 + 4 * 4) / 9
+    # The profilers themselves are left untouched
+    assert [profiler.frames for profiler in profilers] == [2, 3, 4]
+
+
+def test_merge_of_no_profiler():
+    summary = StageProfiler.merge([]).summary()
+    assert summary['frames'] == 0 and summary['times_ms'] == {}
@@ -0,0 +1,114 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from infer_bytetrack.yolox.tracker.tracker_pool import TrackerPool
+
+
+class FakeTracker(object):
+    """Counts its updates and coasted frames"""
+
+    def __init__(self):
+        self.frame_id = 0
+
+    def update(self, output_results, img_info, img_size):
+        self.frame_id += 1
+        return self.frame_id, output_results
+
+    def coast(self):
+        self.frame_id += 1
+        return self.frame_id
+
+
+class FakeClock(object):
+    def __init__(self):
+        self.now = 0.
+
+    def __call__(self):
+        return self.now
+
+
+def make_pool(idle_timeout=10.):
+    clock = FakeClock()
+    return TrackerPool(FakeTracker, idle_timeout=idle_timeout, id_stride=1000, clock=clock), clock
+
+
+def test_one_tracker_per_stream():
+    pool, _ = make_pool()
+    a = pool.get('a')
+    assert pool.get('a') is a
+    assert pool.get('b') is not a
+    assert len(pool) == 2 and 'a' in pool and 'c' not in pool
+    pool.remove('a')
+    assert pool.stream_ids() == ['b']
+
+
+def test_streams_are_ordered_by_last_update():
+    pool, clock = make_pool()
+    for stream_id in ('a', 'b', 'c'):
+        pool.get(stream_id)
+        clock.now += 1
+    pool.update('a', None, None, None)
+    assert pool.stream_ids() == ['b', 'c', 'a']
+    # Listing the trackers does not refresh them
+    pool.trackers()
+    assert pool.stream_ids() == ['b', 'c', 'a']
+
+
+def test_idle_streams_are_evicted():
+    pool, clock = make_pool()
+    pool.get('a')
+    clock.now = 1.
+    pool.get('b')
+    clock.now = 2.
+    pool.get('c')
+    clock.now = 9.
+    pool.get('a')
+    # Idle for more than 10 s: b only, a was refreshed and c is idle for 9.5 s
+    assert pool.evict_idle(11.5) == ['b']
+    assert pool.stream_ids() == ['c', 'a']
+    # Getting a stream evicts the idle ones first
+    clock.now = 19.5
+    pool.get('d')
+    assert pool.stream_ids() == ['d']
+
+
+@pytest.mark.parametrize('idle_timeout', [0, None])
+def test_eviction_can_be_disabled(idle_timeout):
+    pool, clock = make_pool(idle_timeout)
+    pool.get('a')
+    clock.now = 1e6
+    assert pool.evict_idle() == []
+    pool.get('b')
+    assert pool.stream_ids() == ['a', 'b']
+
+
+def test_namespaced_ids_stay_unique_when_a_stream_comes_back():
+    pool, clock = make_pool()
+    pool.get('a')
+    pool.get('b')
+    first = pool.namespaced_id('a', 7)
+    assert (first, pool.namespaced_id('b', 7)) == (7, 1007)
+    clock.now = 20.
+    # `a` is evicted with `b`, then comes back with a new tracker and namespace
+    a = pool.get('a')
+    assert a.frame_id == 0 and pool.stream_ids() == ['a']
+    assert pool.namespaced_id('a', 7) == 2007
+
+
+@pytest.mark.parametrize('workers', [None, 4])
+def test_update_many(workers):
+    pool, _ = make_pool()
+    pool.update('b', None, None, None)
+    frames = {stream_id: ('dets ' + stream_id, None, None) for stream_id in ('a', 'b', 'c')}
+    if workers is None:
+        outputs = pool.update_many(frames)
+        predictions = pool.coast_many(['a', 'b'])
+    else:
+        with ThreadPoolExecutor(workers) as executor:
+            outputs = pool.update_many(frames, executor)
+            predictions = pool.coast_many(['a', 'b'], executor)
+    # Every stream is advanced by its own tracker
+    assert outputs == {'a': (1, 'dets a'), 'b': (2, 'dets b'), 'c': (1, 'dets c')}
+    assert predictions == {'a': 2, 'b': 3}
+    assert pool.stream_ids() == ['c', 'a', 'b']
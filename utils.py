@@ -1,27 +1,104 @@
 import numpy as np
-from onemetric.cv.utils.iou import box_iou_batch
 
 
-# converts List[STrack] into format that can be consumed by match_detections_with_tracks function
-def tracks2boxes(tracks):
-    return np.array([
-        track.tlbr
-        for track
-        in tracks
-    ], dtype=float)
+class DetectionBuffer:
+    """
+    Preallocated float32 arrays holding the detections of the current frame.
+
+    The boxes and scores of the input objects are read once per frame, and the
+    same arrays then serve as tracker input, for the category filter and to
+    pair the output tracks with their detections.
+    """
+
+    def __init__(self, capacity=256):
+        # x1, y1, x2, y2, score
+        self.data = np.zeros((capacity, 5), dtype=np.float32)
+        self.labels = np.empty(capacity, dtype=object)
+        self.count = 0
+
+    def load(self, objects):
+        """Read the boxes, scores and labels of `objects` (Ikomia detection or
+        instance segmentation objects) and return the tracker input."""
+        count = len(objects)
+        if count > len(self.data):
+            capacity = max(count, 2 * len(self.data))
+            self.data = np.zeros((capacity, 5), dtype=np.float32)
+            self.labels = np.empty(capacity, dtype=object)
+
+        data = self.data[:count]
+        if count > 0:
+            data[:] = [(*o.box, o.confidence) for o in objects]
+            # x, y, w, h -> x1, y1, x2, y2
+            data[:, 2:4] += data[:, 0:2]
+            self.labels[:count] = [o.label for o in objects]
+        self.count = count
+        return data
+
+    def label_mask(self, labels):
+        """Boolean mask of the current detections whose label is in `labels`."""
+        return np.isin(self.labels[:self.count], labels)
+
+
+class DetectionSchedule:
+    """
+    Per-stream schedule of the frames on which the detector runs.
+
+    A stream starts with a detection frame, then has one every `stride` frames.
+    On the frames in between, the tracker coasts on its Kalman predictions and
+    the detection input is not read, so the detector can be skipped. When
+    `scene_change_thresh` is positive, a coasted frame whose downscaled grayscale
+    image differs from the one of the last detection frame by more than this
+    mean absolute difference (0 to 1) makes the next frame a detection frame.
+    """
+
+    def __init__(self, stride=1, scene_change_thresh=0., thumbnail_size=32):
+        self.stride = stride
+        self.scene_change_thresh = scene_change_thresh
+        self.thumbnail_size = thumbnail_size
+        # stream id -> [frames since the last detection frame, next frame is a detection frame, thumbnail]
+        self._streams = {}
+
+    def is_due(self, stream_id):
+        """Whether the next frame of `stream_id` is a detection frame."""
+        entry = self._streams.get(stream_id)
+        return entry is None or entry[1]
+
+    def next_frame(self, stream_id, image=None):
+        """Record a new frame of `stream_id` and return whether it is a detection frame."""
+        entry = self._streams.get(stream_id)
+        if entry is None:
+            entry = self._streams[stream_id] = [0, True, None]
+        detect = entry[1]
+        entry[0] = 0 if detect else entry[0] + 1
+        changed = False
+        if self.scene_change_thresh > 0 and image is not None:
+            thumbnail = self.thumbnail(image)
+            if detect:
+                entry[2] = thumbnail
+            elif entry[2] is None or entry[2].shape != thumbnail.shape:
+                changed = True
+            else:
+                changed = np.abs(thumbnail - entry[2]).mean() > self.scene_change_thresh
+        entry[1] = changed or entry[0] + 1 >= self.stride
+        return detect
+
+    def thumbnail(self, image):
+        """Grayscale `thumbnail_size` square sample of `image`, in [0, 1] for 8-bit images."""
+        rows = np.linspace(0, image.shape[0] - 1, self.thumbnail_size).astype(int)
+        cols = np.linspace(0, image.shape[1] - 1, self.thumbnail_size).astype(int)
+        small = image[rows[:, None], cols].astype(np.float32) / 255
+        return small.mean(axis=2) if small.ndim == 3 else small
+
+    def retain(self, stream_ids):
+        """Forget the streams not in `stream_ids`."""
+        self._streams = {stream_id: entry for stream_id, entry in self._streams.items() if stream_id in stream_ids}
 
 
 # matches our bounding boxes with predictions
-def match_detections_with_tracks(detections, tracks):
-    detection_boxes = np.array([xywh_xyxy(o.box) for o in detections])
-    tracks_boxes = tracks2boxes(tracks=tracks)
-    iou = box_iou_batch(tracks_boxes, detection_boxes)
-    track2detection = np.argmax(iou, axis=1)
-    det_id_2_track_id = {}
-    for tracker_index, detection_index in enumerate(track2detection):
-        if iou[tracker_index, detection_index] != 0:
-            det_id_2_track_id[detection_index] = tracks[tracker_index].track_id
-    return det_id_2_track_id
+def match_detections_with_tracks(tracks):
+    # The tracker reports the input row each output track was associated with,
+    # so no box matching is needed and a detection maps to one track at most.
+    return {track.det_index: track.track_id for track in tracks}
 
 
 def xywh_xyxy(box):
@@ -1,8 +1,15 @@
 #!/usr/bin/env python3
 # -*- coding:utf-8 -*-
 
-from .utils import configure_module
-
-configure_module()
+# The utils, and torch with them, are imported on first use so that the
+# trackers load with NumPy and SciPy only. configure_module() now runs when
+# yolox.utils is imported.
 
 __version__ = "0.1.0"
+
+
+def __getattr__(name):
+    if name == "configure_module":
+        from .utils import configure_module
+        return configure_module
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
@@ -23,13 +23,13 @@ def _nn_cosine_distance(x, y):
 
 
 class Tracker:
-    def __init__(self, metric, max_iou_distance=0.7, max_age=70, n_init=3):
+    def __init__(self, metric, max_iou_distance=0.7, max_age=70, n_init=3, dtype=np.float64):
         self.metric = metric
         self.max_iou_distance = max_iou_distance
         self.max_age = max_age
         self.n_init = n_init
 
-        self.kf = kalman_filter.KalmanFilter()
+        self.kf = kalman_filter.KalmanFilter(dtype)
         self.tracks = []
         self._next_id = 1
 
@@ -153,7 +153,7 @@ class NearestNeighborDistanceMetric(object):
 
 
 class DeepSort(object):
-    def __init__(self, model_path, max_dist=0.1, min_confidence=0.3, nms_max_overlap=1.0, max_iou_distance=0.7, max_age=30, n_init=3, nn_budget=100, use_cuda=True):
+    def __init__(self, model_path, max_dist=0.1, min_confidence=0.3, nms_max_overlap=1.0, max_iou_distance=0.7, max_age=30, n_init=3, nn_budget=100, use_cuda=True, dtype=np.float64):
         self.min_confidence = min_confidence
         self.nms_max_overlap = nms_max_overlap
 
@@ -163,7 +163,7 @@ class DeepSort(object):
         metric = NearestNeighborDistanceMetric(
             "cosine", max_cosine_distance, nn_budget)
         self.tracker = Tracker(
-            metric, max_iou_distance=max_iou_distance, max_age=max_age, n_init=n_init)
+            metric, max_iou_distance=max_iou_distance, max_age=max_age, n_init=n_init, dtype=dtype)
 
     def update(self, output_results, img_info, img_size, img_file_name):
         img_file_name = os.path.join(get_yolox_datadir(), 'mot', 'train', img_file_name)
@@ -2,6 +2,8 @@
 import numpy as np
 import scipy.linalg
 
+from infer_bytetrack.yolox.tracker.kalman_filter import cho_factor, cholesky, squared_mahalanobis, symmetrize
+
 
 """
 Table for the 0.95 quantile of the chi-square distribution with N degrees of
@@ -30,16 +32,21 @@ class KalmanFilter(object):
     Object motion follows a constant velocity model. The bounding box location
     (x, y, a, h) is taken as direct observation of the state space (linear
     observation model).
+
+    States are computed and stored in `dtype`. In float32, updated covariances
+    are symmetrized and Cholesky factorizations fall back on a jittered diagonal.
     """
 
-    def __init__(self):
+    def __init__(self, dtype=np.float64):
         ndim, dt = 4, 1.
+        self.dtype = np.dtype(dtype)
+        self._symmetrize = self.dtype != np.float64
 
         # Create Kalman filter model matrices.
-        self._motion_mat = np.eye(2 * ndim, 2 * ndim)
+        self._motion_mat = np.eye(2 * ndim, 2 * ndim, dtype=self.dtype)
         for i in range(ndim):
             self._motion_mat[i, ndim + i] = dt
-        self._update_mat = np.eye(ndim, 2 * ndim)
+        self._update_mat = np.eye(ndim, 2 * ndim, dtype=self.dtype)
 
         # Motion and observation uncertainty are chosen relative to the current
         # state estimate. These weights control the amount of uncertainty in
@@ -63,7 +70,7 @@ class KalmanFilter(object):
         """
         mean_pos = measurement
         mean_vel = np.zeros_like(mean_pos)
-        mean = np.r_[mean_pos, mean_vel]
+        mean = np.r_[mean_pos, mean_vel].astype(self.dtype)
 
         std = [
             2 * self._std_weight_position * measurement[3],
@@ -74,7 +81,7 @@ class KalmanFilter(object):
             10 * self._std_weight_velocity * measurement[3],
             1e-5,
             10 * self._std_weight_velocity * measurement[3]]
-        covariance = np.diag(np.square(std))
+        covariance = np.diag(np.square(np.asarray(std, dtype=self.dtype)))
         return mean, covariance
 
     def predict(self, mean, covariance):
@@ -103,7 +110,7 @@ class KalmanFilter(object):
             self._std_weight_velocity * mean[3],
             1e-5,
             self._std_weight_velocity * mean[3]]
-        motion_cov = np.diag(np.square(np.r_[std_pos, std_vel]))
+        motion_cov = np.diag(np.square(np.asarray(np.r_[std_pos, std_vel], dtype=self.dtype)))
 
         mean = np.dot(self._motion_mat, mean)
         covariance = np.linalg.multi_dot((
@@ -130,13 +137,40 @@ class KalmanFilter(object):
             self._std_weight_position * mean[3],
             1e-1,
             self._std_weight_position * mean[3]]
-        innovation_cov = np.diag(np.square(std))
+        innovation_cov = np.diag(np.square(np.asarray(std, dtype=self.dtype)))
 
         mean = np.dot(self._update_mat, mean)
         covariance = np.linalg.multi_dot((
             self._update_mat, covariance, self._update_mat.T))
         return mean, covariance + innovation_cov
 
+    def multi_project(self, mean, covariance):
+        """Project state distributions to measurement space (Vectorized version).
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the object states.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the object states.
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the Nx4 projected means and Nx4x4 projected covariance
+            matrices of the given state estimates.
+        """
+        std = [
+            self._std_weight_position * mean[:, 3],
+            self._std_weight_position * mean[:, 3],
+            1e-1 * np.ones_like(mean[:, 3]),
+            self._std_weight_position * mean[:, 3]]
+        sqr = np.square(np.asarray(std)).T
+
+        mean = np.dot(mean, self._update_mat.T)
+        covariance = np.matmul(np.matmul(self._update_mat, covariance), self._update_mat.T)
+        diag = np.arange(4)
+        covariance[:, diag, diag] += sqr
+        return mean, covariance
+
     def update(self, mean, covariance, measurement):
         """Run Kalman filter correction step.
         Parameters
@@ -156,16 +190,17 @@ class KalmanFilter(object):
         """
         projected_mean, projected_cov = self.project(mean, covariance)
 
-        chol_factor, lower = scipy.linalg.cho_factor(
-            projected_cov, lower=True, check_finite=False)
+        chol_factor, lower = cho_factor(projected_cov)
         kalman_gain = scipy.linalg.cho_solve(
             (chol_factor, lower), np.dot(covariance, self._update_mat.T).T,
             check_finite=False).T
-        innovation = measurement - projected_mean
+        innovation = np.asarray(measurement, dtype=self.dtype) - projected_mean
 
         new_mean = mean + np.dot(innovation, kalman_gain.T)
         new_covariance = covariance - np.linalg.multi_dot((
             kalman_gain, projected_cov, kalman_gain.T))
+        if self._symmetrize:
+            symmetrize(new_covariance)
         return new_mean, new_covariance
 
     def gating_distance(self, mean, covariance, measurements,
@@ -199,10 +234,41 @@ class KalmanFilter(object):
             mean, covariance = mean[:2], covariance[:2, :2]
             measurements = measurements[:, :2]
 
-        cholesky_factor = np.linalg.cholesky(covariance)
-        d = measurements - mean
+        cholesky_factor = cholesky(covariance)
+        d = np.asarray(measurements, dtype=self.dtype) - mean
         z = scipy.linalg.solve_triangular(
             cholesky_factor, d.T, lower=True, check_finite=False,
             overwrite_b=True)
         squared_maha = np.sum(z * z, axis=0)
-        return squared_maha
\ No newline at end of file
+        return squared_maha
+
+    def multi_gating_distance(self, mean, covariance, measurements,
+                              only_position=False):
+        """Compute gating distances between many state distributions and
+        measurements (Vectorized version). All the innovation covariances are
+        factorized in one stacked call.
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the state distributions.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the state distributions.
+        measurements : ndarray
+            An Mx4 dimensional matrix of M measurements, each in
+            format (x, y, a, h) where (x, y) is the bounding box center
+            position, a the aspect ratio, and h the height.
+        only_position : Optional[bool]
+            If True, distance computation is done with respect to the bounding
+            box center position only.
+        Returns
+        -------
+        ndarray
+            Returns an NxM array, whose row i is the `gating_distance` of the
+            i-th state distribution to the measurements.
+        """
+        mean, covariance = self.multi_project(mean, covariance)
+        measurements = np.asarray(measurements, dtype=self.dtype)
+        if only_position:
+            mean, covariance = mean[:, :2], covariance[:, :2, :2]
+            measurements = measurements[:, :2]
+        return squared_mahalanobis(mean, covariance, measurements)
@@ -170,13 +170,15 @@ def gate_cost_matrix(
     ndarray
         Returns the modified cost matrix.
     """
+    if len(track_indices) == 0 or len(detection_indices) == 0:
+        return cost_matrix
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
     measurements = np.asarray(
         [detections[i].to_xyah() for i in detection_indices])
-    for row, track_idx in enumerate(track_indices):
-        track = tracks[track_idx]
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position)
-        cost_matrix[row, gating_distance > gating_threshold] = gated_cost
+    gating_distance = kf.multi_gating_distance(
+        np.asarray([tracks[i].mean for i in track_indices]),
+        np.asarray([tracks[i].covariance for i in track_indices]),
+        measurements, only_position)
+    cost_matrix[gating_distance > gating_threshold] = gated_cost
     return cost_matrix
\ No newline at end of file
@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+def checkpoint_signature(checkpoint):
+    """Identify a checkpoint file by its path, size and modification time, without reading it."""
+    if checkpoint is None:
+        return None
+    checkpoint = os.path.realpath(checkpoint)
+    if not os.path.isfile(checkpoint):
+        return checkpoint
+    stat = os.stat(checkpoint)
+    return "{}:{}:{}".format(checkpoint, stat.st_size, stat.st_mtime_ns)
+
+
+class DetectionCache:
+    """
+    Post-NMS detections of a model over a dataset, stored on disk.
+
+    The cache folder name is a hash of everything the detections depend on:
+    checkpoint, test size, confidence and NMS thresholds, and any extra
+    setting passed as keyword. A complete cache holds:
+        - detections.bin: the (N, 7) float32 outputs of `postprocess` of all
+          the images, concatenated and read back through a memory map
+        - index.npz: per image, its id, first row and row count in
+          detections.bin, frame id, video id, height, width and file name
+        - meta.json: the key settings and counts
+
+    The images are written in dataloader order with `add`, then `close`
+    publishes the cache atomically. An interrupted run leaves no cache.
+    Detections are stored per image, so the batch size of the dataloader
+    that wrote them is not kept: they are read back one image at a time.
+    """
+
+    def __init__(self, cache_dir, checkpoint, test_size, confthre, nmsthre, **settings):
+        self.settings = dict(
+            checkpoint=checkpoint_signature(checkpoint),
+            test_size=[int(s) for s in test_size],
+            confthre=float(confthre),
+            nmsthre=float(nmsthre),
+            **settings
+        )
+        self.key = hashlib.sha1(json.dumps(self.settings, sort_keys=True).encode()).hexdigest()[:16]
+        self.path = os.path.join(cache_dir, self.key)
+        self._tmp_path = self.path + ".tmp"
+        self._file = None
+        self._index = None
+        self._detections = None
+
+    def exists(self):
+        return os.path.isfile(os.path.join(self.path, "meta.json"))
+
+    # Writing
+
+    def open(self):
+        if os.path.isdir(self._tmp_path):
+            shutil.rmtree(self._tmp_path)
+        os.makedirs(self._tmp_path)
+        self._file = open(os.path.join(self._tmp_path, "detections.bin"), "wb")
+        self._index = {key: [] for key in ("img_ids", "starts", "counts", "frame_ids", "video_ids",
+                                           "heights", "widths", "file_names")}
+        self._rows = 0
+
+    def add(self, img_id, output, height, width, frame_id, video_id, file_name):
+        """
+        :param output: (N, 7) array of an image, or None when `postprocess` found no object
+        """
+        if output is None:
+            count = -1
+        else:
+            output = np.ascontiguousarray(output, dtype=np.float32).reshape(-1, 7)
+            self._file.write(output.tobytes())
+            count = len(output)
+        index = self._index
+        index["img_ids"].append(int(img_id))
+        index["starts"].append(self._rows)
+        index["counts"].append(count)
+        index["frame_ids"].append(int(frame_id))
+        index["video_ids"].append(int(video_id))
+        index["heights"].append(int(height))
+        index["widths"].append(int(width))
+        index["file_names"].append(str(file_name))
+        self._rows += max(count, 0)
+
+    def close(self):
+        self._file.close()
+        self._file = None
+        np.savez(os.path.join(self._tmp_path, "index.npz"),
+                 **{key: np.asarray(values) for key, values in self._index.items()})
+        with open(os.path.join(self._tmp_path, "meta.json"), "w") as f:
+            json.dump(dict(self.settings, num_images=len(self._index["img_ids"]), num_rows=self._rows), f)
+        self._index = None
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.rename(self._tmp_path, self.path)
+
+    def discard(self):
+        """Drop a partially written cache."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if os.path.isdir(self._tmp_path):
+            shutil.rmtree(self._tmp_path)
+
+    # Reading
+
+    def load(self):
+        with open(os.path.join(self.path, "meta.json")) as f:
+            meta = json.load(f)
+        with np.load(os.path.join(self.path, "index.npz")) as data:
+            self._index = {key: data[key] for key in data.files}
+        if meta["num_rows"] > 0:
+            self._detections = np.memmap(os.path.join(self.path, "detections.bin"), dtype=np.float32,
+                                         mode="r", shape=(meta["num_rows"], 7))
+        else:
+            self._detections = np.empty((0, 7), dtype=np.float32)
+        return self
+
+    def __len__(self):
+        return len(self._index["img_ids"])
+
+    def __getitem__(self, i):
+        """
+        :return: (img_id, output, height, width, frame_id, video_id, file_name), output is
+            a read-only (N, 7) view of the memory map or None
+        """
+        index = self._index
+        start, count = index["starts"][i], index["counts"][i]
+        output = None if count < 0 else self._detections[start:start + count]
+        return (int(index["img_ids"][i]), output, int(index["heights"][i]), int(index["widths"][i]),
+                int(index["frame_ids"][i]), int(index["video_ids"][i]), str(index["file_names"][i]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
@@ -16,8 +16,11 @@ from infer_bytetrack.yolox.tracker.byte_tracker import BYTETracker
 from infer_bytetrack.yolox.sort_tracker.sort import Sort
 from infer_bytetrack.yolox.deepsort_tracker.deepsort import DeepSort
 from infer_bytetrack.yolox.motdt_tracker.motdt_tracker import OnlineTracker
+from infer_bytetrack.yolox.evaluators.detection_cache import DetectionCache, checkpoint_signature
+from infer_bytetrack.yolox.tracking_utils.io import ResultWriter
 
 import contextlib
+import functools
 import io
 import os
 import itertools
@@ -25,30 +28,34 @@ import json
 import tempfile
 import time
 
+import numpy as np
+
+
+# Per-sequence tracker settings of the ByteTrack results on MOT17 and MOT20. A table
+# found by a sweep (see tracking_utils/sweep.py) can be passed to MOTEvaluator instead.
+SEQUENCE_CONFIGS = {
+    'MOT17-01-FRCNN': {'track_thresh': 0.65},
+    'MOT17-05-FRCNN': {'track_buffer': 14},
+    'MOT17-06-FRCNN': {'track_buffer': 14, 'track_thresh': 0.65},
+    'MOT17-12-FRCNN': {'track_thresh': 0.7},
+    'MOT17-13-FRCNN': {'track_buffer': 25},
+    'MOT17-14-FRCNN': {'track_buffer': 25, 'track_thresh': 0.67},
+    'MOT20-06': {'track_thresh': 0.3},
+    'MOT20-08': {'track_thresh': 0.3},
+}
+
 
 def write_results(filename, results):
-    save_format = '{frame},{id},{x1},{y1},{w},{h},{s},-1,-1,-1\n'
-    with open(filename, 'w') as f:
+    with ResultWriter(filename) as writer:
         for frame_id, tlwhs, track_ids, scores in results:
-            for tlwh, track_id, score in zip(tlwhs, track_ids, scores):
-                if track_id < 0:
-                    continue
-                x1, y1, w, h = tlwh
-                line = save_format.format(frame=frame_id, id=track_id, x1=round(x1, 1), y1=round(y1, 1), w=round(w, 1), h=round(h, 1), s=round(score, 2))
-                f.write(line)
+            writer.add(frame_id, tlwhs, track_ids, scores)
     logger.info('save results to {}'.format(filename))
 
 
 def write_results_no_score(filename, results):
-    save_format = '{frame},{id},{x1},{y1},{w},{h},-1,-1,-1,-1\n'
-    with open(filename, 'w') as f:
+    with ResultWriter(filename, with_scores=False) as writer:
         for frame_id, tlwhs, track_ids in results:
-            for tlwh, track_id in zip(tlwhs, track_ids):
-                if track_id < 0:
-                    continue
-                x1, y1, w, h = tlwh
-                line = save_format.format(frame=frame_id, id=track_id, x1=round(x1, 1), y1=round(y1, 1), w=round(w, 1), h=round(h, 1))
-                f.write(line)
+            writer.add(frame_id, tlwhs, track_ids)
     logger.info('save results to {}'.format(filename))
 
 
@@ -59,7 +66,8 @@ class MOTEvaluator:
     """
 
     def __init__(
-        self, args, dataloader, img_size, confthre, nmsthre, num_classes):
+        self, args, dataloader, img_size, confthre, nmsthre, num_classes, cache_dir=None, checkpoint=None,
+        sequence_configs=None):
         """
         Args:
             dataloader (Dataloader): evaluate dataloader.
@@ -68,6 +76,12 @@ class MOTEvaluator:
             confthre (float): confidence threshold ranging from 0 to 1, which
                 is defined in the config file.
             nmsthre (float): IoU threshold of non-max supression ranging from 0 to 1.
+            cache_dir (str): folder of the detection caches. When set, the post-NMS
+                detections of the first evaluation are cached there, and the next
+                evaluations with the same checkpoint and settings skip inference.
+            checkpoint (str): checkpoint file of the evaluated model, part of the cache key.
+            sequence_configs (dict): sequence name -> tracker settings overriding args
+                in `evaluate`, e.g. the output of a sweep. SEQUENCE_CONFIGS by default.
         """
         self.dataloader = dataloader
         self.img_size = img_size
@@ -75,6 +89,9 @@ class MOTEvaluator:
         self.nmsthre = nmsthre
         self.num_classes = num_classes
         self.args = args
+        self.cache_dir = cache_dir
+        self.checkpoint = checkpoint
+        self.sequence_configs = SEQUENCE_CONFIGS if sequence_configs is None else sequence_configs
 
     def evaluate(
         self,
@@ -100,35 +117,24 @@ class MOTEvaluator:
             ap50 (float) : COCO AP of IoU=50
             summary (sr): summary info of evaluation.
         """
-        # TODO half to amp_test
-        tensor_type = torch.cuda.HalfTensor if half else torch.cuda.FloatTensor
-        model = model.eval()
-        if half:
-            model = model.half()
         ids = []
         data_list = []
         results = []
         video_names = defaultdict()
-        progress_bar = tqdm if is_main_process() else iter
+        progress_bar = functools.partial(tqdm, total=len(self.dataloader)) if is_main_process() else iter
 
         inference_time = 0
         track_time = 0
         n_samples = len(self.dataloader) - 1
 
-        if trt_file is not None:
-            from torch2trt import TRTModule
-
-            model_trt = TRTModule()
-            model_trt.load_state_dict(torch.load(trt_file))
-
-            x = torch.ones(1, 3, test_size[0], test_size[1]).cuda()
-            model(x)
-            model = model_trt
-            
         tracker = BYTETracker(self.args)
-        ori_thresh = self.args.track_thresh
-        for cur_iter, (imgs, _, info_imgs, ids) in enumerate(
-            progress_bar(self.dataloader)
+        # Settings of the sequences without override
+        default_config = {'track_buffer': 30}
+        for key in set(itertools.chain(*self.sequence_configs.values())) - {'track_buffer'}:
+            default_config[key] = getattr(self.args, key, None)
+        detections = self._detections(model, distributed, half, trt_file, decoder, test_size)
+        for cur_iter, (outputs, info_imgs, ids, forward_time) in enumerate(
+            progress_bar(detections)
         ):
             with torch.no_grad():
                 # init tracker
@@ -136,25 +142,12 @@ class MOTEvaluator:
                 video_id = info_imgs[3].item()
                 img_file_name = info_imgs[4]
                 video_name = img_file_name[0].split('/')[0]
-                if video_name == 'MOT17-05-FRCNN' or video_name == 'MOT17-06-FRCNN':
-                    self.args.track_buffer = 14
-                elif video_name == 'MOT17-13-FRCNN' or video_name == 'MOT17-14-FRCNN':
-                    self.args.track_buffer = 25
-                else:
-                    self.args.track_buffer = 30
-
-                if video_name == 'MOT17-01-FRCNN':
-                    self.args.track_thresh = 0.65
-                elif video_name == 'MOT17-06-FRCNN':
-                    self.args.track_thresh = 0.65
-                elif video_name == 'MOT17-12-FRCNN':
-                    self.args.track_thresh = 0.7
-                elif video_name == 'MOT17-14-FRCNN':
-                    self.args.track_thresh = 0.67
-                elif video_name in ['MOT20-06', 'MOT20-08']:
-                    self.args.track_thresh = 0.3
-                else:
-                    self.args.track_thresh = ori_thresh
+                for key, value in dict(default_config, **self.sequence_configs.get(video_name, {})).items():
+                    if value is None:
+                        if hasattr(self.args, key):
+                            delattr(self.args, key)
+                    else:
+                        setattr(self.args, key, value)
 
                 if video_name not in video_names:
                     video_names[video_id] = video_name
@@ -165,22 +158,11 @@ class MOTEvaluator:
                         write_results(result_filename, results)
                         results = []
 
-                imgs = imgs.type(tensor_type)
-
                 # skip the the last iters since batchsize might be not enough for batch inference
                 is_time_record = cur_iter < len(self.dataloader) - 1
-                if is_time_record:
-                    start = time.time()
-
-                outputs = model(imgs)
-                if decoder is not None:
-                    outputs = decoder(outputs, dtype=outputs.type())
-
-                outputs = postprocess(outputs, self.num_classes, self.confthre, self.nmsthre)
-            
                 if is_time_record:
                     infer_end = time_synchronized()
-                    inference_time += infer_end - start
+                    inference_time += forward_time
 
             output_results = self.convert_to_coco_format(outputs, info_imgs, ids)
             data_list.extend(output_results)
@@ -210,8 +192,9 @@ class MOTEvaluator:
                 result_filename = os.path.join(result_folder, '{}.txt'.format(video_names[video_id]))
                 write_results(result_filename, results)
 
-        statistics = torch.cuda.FloatTensor([inference_time, track_time, n_samples])
+        statistics = torch.FloatTensor([inference_time, track_time, n_samples])
         if distributed:
+            statistics = statistics.cuda()
             data_list = gather(data_list, dst=0)
             data_list = list(itertools.chain(*data_list))
             torch.distributed.reduce(statistics, dst=0)
@@ -244,35 +227,21 @@ class MOTEvaluator:
             ap50 (float) : COCO AP of IoU=50
             summary (sr): summary info of evaluation.
         """
-        # TODO half to amp_test
-        tensor_type = torch.cuda.HalfTensor if half else torch.cuda.FloatTensor
-        model = model.eval()
-        if half:
-            model = model.half()
         ids = []
         data_list = []
         results = []
         video_names = defaultdict()
-        progress_bar = tqdm if is_main_process() else iter
+        progress_bar = functools.partial(tqdm, total=len(self.dataloader)) if is_main_process() else iter
 
         inference_time = 0
         track_time = 0
         n_samples = len(self.dataloader) - 1
 
-        if trt_file is not None:
-            from torch2trt import TRTModule
-
-            model_trt = TRTModule()
-            model_trt.load_state_dict(torch.load(trt_file))
-
-            x = torch.ones(1, 3, test_size[0], test_size[1]).cuda()
-            model(x)
-            model = model_trt
-            
         tracker = Sort(self.args.track_thresh)
         
-        for cur_iter, (imgs, _, info_imgs, ids) in enumerate(
-            progress_bar(self.dataloader)
+        detections = self._detections(model, distributed, half, trt_file, decoder, test_size)
+        for cur_iter, (outputs, info_imgs, ids, forward_time) in enumerate(
+            progress_bar(detections)
         ):
             with torch.no_grad():
                 # init tracker
@@ -290,22 +259,11 @@ class MOTEvaluator:
                         write_results_no_score(result_filename, results)
                         results = []
 
-                imgs = imgs.type(tensor_type)
-
                 # skip the the last iters since batchsize might be not enough for batch inference
                 is_time_record = cur_iter < len(self.dataloader) - 1
-                if is_time_record:
-                    start = time.time()
-
-                outputs = model(imgs)
-                if decoder is not None:
-                    outputs = decoder(outputs, dtype=outputs.type())
-
-                outputs = postprocess(outputs, self.num_classes, self.confthre, self.nmsthre)
-            
                 if is_time_record:
                     infer_end = time_synchronized()
-                    inference_time += infer_end - start
+                    inference_time += forward_time
 
             output_results = self.convert_to_coco_format(outputs, info_imgs, ids)
             data_list.extend(output_results)
@@ -332,8 +290,9 @@ class MOTEvaluator:
                 result_filename = os.path.join(result_folder, '{}.txt'.format(video_names[video_id]))
                 write_results_no_score(result_filename, results)
 
-        statistics = torch.cuda.FloatTensor([inference_time, track_time, n_samples])
+        statistics = torch.FloatTensor([inference_time, track_time, n_samples])
         if distributed:
+            statistics = statistics.cuda()
             data_list = gather(data_list, dst=0)
             data_list = list(itertools.chain(*data_list))
             torch.distributed.reduce(statistics, dst=0)
@@ -367,35 +326,21 @@ class MOTEvaluator:
             ap50 (float) : COCO AP of IoU=50
             summary (sr): summary info of evaluation.
         """
-        # TODO half to amp_test
-        tensor_type = torch.cuda.HalfTensor if half else torch.cuda.FloatTensor
-        model = model.eval()
-        if half:
-            model = model.half()
         ids = []
         data_list = []
         results = []
         video_names = defaultdict()
-        progress_bar = tqdm if is_main_process() else iter
+        progress_bar = functools.partial(tqdm, total=len(self.dataloader)) if is_main_process() else iter
 
         inference_time = 0
         track_time = 0
         n_samples = len(self.dataloader) - 1
 
-        if trt_file is not None:
-            from torch2trt import TRTModule
-
-            model_trt = TRTModule()
-            model_trt.load_state_dict(torch.load(trt_file))
-
-            x = torch.ones(1, 3, test_size[0], test_size[1]).cuda()
-            model(x)
-            model = model_trt
-            
         tracker = DeepSort(model_folder, min_confidence=self.args.track_thresh)
         
-        for cur_iter, (imgs, _, info_imgs, ids) in enumerate(
-            progress_bar(self.dataloader)
+        detections = self._detections(model, distributed, half, trt_file, decoder, test_size)
+        for cur_iter, (outputs, info_imgs, ids, forward_time) in enumerate(
+            progress_bar(detections)
         ):
             with torch.no_grad():
                 # init tracker
@@ -413,22 +358,11 @@ class MOTEvaluator:
                         write_results_no_score(result_filename, results)
                         results = []
 
-                imgs = imgs.type(tensor_type)
-
                 # skip the the last iters since batchsize might be not enough for batch inference
                 is_time_record = cur_iter < len(self.dataloader) - 1
-                if is_time_record:
-                    start = time.time()
-
-                outputs = model(imgs)
-                if decoder is not None:
-                    outputs = decoder(outputs, dtype=outputs.type())
-
-                outputs = postprocess(outputs, self.num_classes, self.confthre, self.nmsthre)
-            
                 if is_time_record:
                     infer_end = time_synchronized()
-                    inference_time += infer_end - start
+                    inference_time += forward_time
 
             output_results = self.convert_to_coco_format(outputs, info_imgs, ids)
             data_list.extend(output_results)
@@ -455,8 +389,9 @@ class MOTEvaluator:
                 result_filename = os.path.join(result_folder, '{}.txt'.format(video_names[video_id]))
                 write_results_no_score(result_filename, results)
 
-        statistics = torch.cuda.FloatTensor([inference_time, track_time, n_samples])
+        statistics = torch.FloatTensor([inference_time, track_time, n_samples])
         if distributed:
+            statistics = statistics.cuda()
             data_list = gather(data_list, dst=0)
             data_list = list(itertools.chain(*data_list))
             torch.distributed.reduce(statistics, dst=0)
@@ -490,34 +425,20 @@ class MOTEvaluator:
             ap50 (float) : COCO AP of IoU=50
             summary (sr): summary info of evaluation.
         """
-        # TODO half to amp_test
-        tensor_type = torch.cuda.HalfTensor if half else torch.cuda.FloatTensor
-        model = model.eval()
-        if half:
-            model = model.half()
         ids = []
         data_list = []
         results = []
         video_names = defaultdict()
-        progress_bar = tqdm if is_main_process() else iter
+        progress_bar = functools.partial(tqdm, total=len(self.dataloader)) if is_main_process() else iter
 
         inference_time = 0
         track_time = 0
         n_samples = len(self.dataloader) - 1
 
-        if trt_file is not None:
-            from torch2trt import TRTModule
-
-            model_trt = TRTModule()
-            model_trt.load_state_dict(torch.load(trt_file))
-
-            x = torch.ones(1, 3, test_size[0], test_size[1]).cuda()
-            model(x)
-            model = model_trt
-            
         tracker = OnlineTracker(model_folder, min_cls_score=self.args.track_thresh)
-        for cur_iter, (imgs, _, info_imgs, ids) in enumerate(
-            progress_bar(self.dataloader)
+        detections = self._detections(model, distributed, half, trt_file, decoder, test_size)
+        for cur_iter, (outputs, info_imgs, ids, forward_time) in enumerate(
+            progress_bar(detections)
         ):
             with torch.no_grad():
                 # init tracker
@@ -535,22 +456,11 @@ class MOTEvaluator:
                         write_results(result_filename, results)
                         results = []
 
-                imgs = imgs.type(tensor_type)
-
                 # skip the the last iters since batchsize might be not enough for batch inference
                 is_time_record = cur_iter < len(self.dataloader) - 1
-                if is_time_record:
-                    start = time.time()
-
-                outputs = model(imgs)
-                if decoder is not None:
-                    outputs = decoder(outputs, dtype=outputs.type())
-
-                outputs = postprocess(outputs, self.num_classes, self.confthre, self.nmsthre)
-            
                 if is_time_record:
                     infer_end = time_synchronized()
-                    inference_time += infer_end - start
+                    inference_time += forward_time
 
             output_results = self.convert_to_coco_format(outputs, info_imgs, ids)
             data_list.extend(output_results)
@@ -579,8 +489,9 @@ class MOTEvaluator:
                 result_filename = os.path.join(result_folder, '{}.txt'.format(video_names[video_id]))
                 write_results(result_filename, results)
 
-        statistics = torch.cuda.FloatTensor([inference_time, track_time, n_samples])
+        statistics = torch.FloatTensor([inference_time, track_time, n_samples])
         if distributed:
+            statistics = statistics.cuda()
             data_list = gather(data_list, dst=0)
             data_list = list(itertools.chain(*data_list))
             torch.distributed.reduce(statistics, dst=0)
@@ -589,6 +500,83 @@ class MOTEvaluator:
         synchronize()
         return eval_results
 
+    def detection_cache(self, half=False, trt_file=None):
+        if self.cache_dir is None:
+            return None
+        if self.checkpoint is None and trt_file is None:
+            logger.warning("Detection cache disabled: no checkpoint to identify the model")
+            return None
+        dataset = self.dataloader.dataset
+        return DetectionCache(
+            self.cache_dir, self.checkpoint, self.img_size, self.confthre, self.nmsthre,
+            num_classes=self.num_classes, half=half, trt_file=checkpoint_signature(trt_file),
+            dataset=[getattr(dataset, "json_file", None), len(dataset)]
+        )
+
+    def _detections(self, model, distributed=False, half=False, trt_file=None, decoder=None, test_size=None):
+        """
+        Yield (outputs, info_imgs, ids, forward_time) for every batch of the dataloader.
+        When the detection cache of this model and settings exists, the detections are
+        read back from it, without loading the images nor running the model. Cached
+        detections are yielded as batches of one image, whatever the batch size of the
+        dataloader, with a forward time of 0.
+        """
+        cache = None if distributed else self.detection_cache(half, trt_file)
+        if cache is not None and cache.exists():
+            logger.info("Read detections from {}".format(cache.path))
+            for img_id, output, height, width, frame_id, video_id, file_name in cache.load():
+                outputs = [None if output is None else torch.from_numpy(np.array(output))]
+                info_imgs = [torch.tensor([height]), torch.tensor([width]), torch.tensor([frame_id]),
+                             torch.tensor([video_id]), [file_name]]
+                yield outputs, info_imgs, torch.tensor([img_id]), 0.
+            return
+
+        # TODO half to amp_test
+        tensor_type = torch.cuda.HalfTensor if half else torch.cuda.FloatTensor
+        model = model.eval()
+        if half:
+            model = model.half()
+
+        if trt_file is not None:
+            from torch2trt import TRTModule
+
+            model_trt = TRTModule()
+            model_trt.load_state_dict(torch.load(trt_file))
+
+            x = torch.ones(1, 3, test_size[0], test_size[1]).cuda()
+            model(x)
+            model = model_trt
+
+        if cache is not None:
+            cache.open()
+        try:
+            for imgs, _, info_imgs, ids in self.dataloader:
+                with torch.no_grad():
+                    imgs = imgs.type(tensor_type)
+                    start = time.time()
+
+                    outputs = model(imgs)
+                    if decoder is not None:
+                        outputs = decoder(outputs, dtype=outputs.type())
+
+                    outputs = postprocess(outputs, self.num_classes, self.confthre, self.nmsthre)
+                    forward_time = time_synchronized() - start
+
+                if cache is not None:
+                    for output, height, width, frame_id, video_id, file_name, img_id in zip(
+                        outputs, info_imgs[0], info_imgs[1], info_imgs[2], info_imgs[3], info_imgs[4], ids
+                    ):
+                        output = None if output is None else output.float().cpu().numpy()
+                        cache.add(img_id, output, height, width, frame_id, video_id, file_name)
+                yield outputs, info_imgs, ids, forward_time
+        except BaseException:
+            if cache is not None:
+                cache.discard()
+            raise
+        if cache is not None:
+            cache.close()
+            logger.info("Saved detections to {}".format(cache.path))
+
     def convert_to_coco_format(self, outputs, info_imgs, ids):
         data_list = []
         for (output, img_h, img_w, img_id) in zip(
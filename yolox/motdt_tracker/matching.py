@@ -1,10 +1,9 @@
 import cv2
 import numpy as np
-import lap
 from scipy.spatial.distance import cdist
 
-from cython_bbox import bbox_overlaps as bbox_ious
 from infer_bytetrack.yolox.motdt_tracker import kalman_filter
+from infer_bytetrack.yolox.tracker import assignment, iou
 
 
 def _indices_to_matches(cost_matrix, indices, thresh):
@@ -18,18 +17,8 @@ def _indices_to_matches(cost_matrix, indices, thresh):
     return matches, unmatched_a, unmatched_b
 
 
-def linear_assignment(cost_matrix, thresh):
-    if cost_matrix.size == 0:
-        return np.empty((0, 2), dtype=int), tuple(range(cost_matrix.shape[0])), tuple(range(cost_matrix.shape[1]))
-    matches, unmatched_a, unmatched_b = [], [], []
-    cost, x, y = lap.lapjv(cost_matrix, extend_cost=True, cost_limit=thresh)
-    for ix, mx in enumerate(x):
-        if mx >= 0:
-            matches.append([ix, mx])
-    unmatched_a = np.where(x < 0)[0]
-    unmatched_b = np.where(y < 0)[0]
-    matches = np.asarray(matches)
-    return matches, unmatched_a, unmatched_b
+def linear_assignment(cost_matrix, thresh, backend=None):
+    return assignment.solve(cost_matrix, thresh, backend)
 
 
 def ious(atlbrs, btlbrs):
@@ -43,10 +32,7 @@ def ious(atlbrs, btlbrs):
     if ious.size == 0:
         return ious
 
-    ious = bbox_ious(
-        np.ascontiguousarray(atlbrs, dtype=np.float32),
-        np.ascontiguousarray(btlbrs, dtype=np.float32)
-    )
+    ious = iou.bbox_overlaps(atlbrs, btlbrs)
 
     return ious
 
@@ -109,8 +95,8 @@ def gate_cost_matrix(kf, cost_matrix, tracks, detections, only_position=False):
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
     measurements = np.asarray([det.to_xyah() for det in detections])
-    for row, track in enumerate(tracks):
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position)
-        cost_matrix[row, gating_distance > gating_threshold] = np.inf
+    gating_distance = kf.multi_gating_distance(
+        np.asarray([track.mean for track in tracks]), np.asarray([track.covariance for track in tracks]),
+        measurements, only_position)
+    cost_matrix[gating_distance > gating_threshold] = np.inf
     return cost_matrix
\ No newline at end of file
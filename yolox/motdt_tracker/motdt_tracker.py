@@ -182,13 +182,14 @@ class STrack(BaseTrack):
 
 class OnlineTracker(object):
 
-    def __init__(self, model_folder, min_cls_score=0.4, min_ap_dist=0.8, max_time_lost=30, use_tracking=True, use_refind=True):
+    def __init__(self, model_folder, min_cls_score=0.4, min_ap_dist=0.8, max_time_lost=30, use_tracking=True,
+                 use_refind=True, dtype=np.float64):
 
         self.min_cls_score = min_cls_score
         self.min_ap_dist = min_ap_dist
         self.max_time_lost = max_time_lost
 
-        self.kalman_filter = KalmanFilter()
+        self.kalman_filter = KalmanFilter(dtype)
 
         self.tracked_stracks = []   # type: list[STrack]
         self.lost_stracks = []      # type: list[STrack]
@@ -0,0 +1,427 @@
+import functools
+
+import numpy as np
+import scipy.sparse
+
+from .kalman_filter import KalmanFilter
+from infer_bytetrack.yolox.tracker import matching
+from .basetrack import IdAllocator, TrackState
+
+
+class TrackStore(object):
+    """
+    Structure-of-arrays storage for the live tracks of an `ArrayBYTETracker`.
+
+    Every track owns one row (slot) of preallocated contiguous arrays, so
+    prediction, association and state transitions run as batched array
+    operations over index vectors instead of loops over track objects.
+    Slots of removed tracks are recycled and the store doubles its capacity
+    when it runs out of free rows. Means and covariances are stored in `dtype`.
+    """
+
+    def __init__(self, capacity=256, dtype=np.float64):
+        self.capacity = 0
+        self.mean = np.zeros((0, 8), dtype=dtype)
+        self.covariance = np.zeros((0, 8, 8), dtype=dtype)
+        self.state = np.zeros(0, dtype=np.int8)
+        self.is_activated = np.zeros(0, dtype=bool)
+        self.was_removed = np.zeros(0, dtype=bool)
+        self.alive = np.zeros(0, dtype=bool)
+        self.score = np.zeros(0)
+        self.track_id = np.zeros(0, dtype=np.int64)
+        self.frame_id = np.zeros(0, dtype=np.int64)
+        self.start_frame = np.zeros(0, dtype=np.int64)
+        self.tracklet_len = np.zeros(0, dtype=np.int64)
+        # Row of the tracker input holding the detection last associated to the track
+        self.det_index = np.zeros(0, dtype=np.int64)
+        # Position key of each track in the tracked/lost lists of `BYTETracker`,
+        # so that sorting by it reproduces the association order of the lists.
+        self.order = np.zeros(0, dtype=np.int64)
+        self._order_count = 0
+        self._grow(capacity)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive))
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self.mean = np.concatenate([self.mean, np.zeros((extra, 8), dtype=self.mean.dtype)])
+        self.covariance = np.concatenate([self.covariance, np.zeros((extra, 8, 8), dtype=self.covariance.dtype)])
+        self.state = np.concatenate([self.state, np.full(extra, TrackState.Removed, dtype=np.int8)])
+        self.is_activated = np.concatenate([self.is_activated, np.zeros(extra, dtype=bool)])
+        self.was_removed = np.concatenate([self.was_removed, np.zeros(extra, dtype=bool)])
+        self.alive = np.concatenate([self.alive, np.zeros(extra, dtype=bool)])
+        self.score = np.concatenate([self.score, np.zeros(extra)])
+        self.track_id = np.concatenate([self.track_id, np.zeros(extra, dtype=np.int64)])
+        self.frame_id = np.concatenate([self.frame_id, np.zeros(extra, dtype=np.int64)])
+        self.start_frame = np.concatenate([self.start_frame, np.zeros(extra, dtype=np.int64)])
+        self.tracklet_len = np.concatenate([self.tracklet_len, np.zeros(extra, dtype=np.int64)])
+        self.det_index = np.concatenate([self.det_index, np.full(extra, -1, dtype=np.int64)])
+        self.order = np.concatenate([self.order, np.zeros(extra, dtype=np.int64)])
+        self.capacity = capacity
+
+    def allocate(self, count):
+        """Reserve `count` free slots, growing the arrays if needed."""
+        free = np.flatnonzero(~self.alive)
+        if len(free) < count:
+            old_capacity = self.capacity
+            self._grow(max(2 * old_capacity, old_capacity + count))
+            free = np.concatenate([free, np.arange(old_capacity, self.capacity)])
+        slots = free[:count]
+        self.alive[slots] = True
+        self.was_removed[slots] = False
+        return slots
+
+    def release(self, slots):
+        self.alive[slots] = False
+        self.state[slots] = TrackState.Removed
+        self.is_activated[slots] = False
+
+    def reorder(self, slots):
+        """Move `slots` to the end of their list, in the given order."""
+        self.order[slots] = np.arange(self._order_count, self._order_count + len(slots))
+        self._order_count += len(slots)
+
+    def select(self, *states):
+        """Return the live slots in one of `states`, sorted by list position."""
+        slots = np.flatnonzero(self.alive & np.isin(self.state, states))
+        return slots[np.argsort(self.order[slots], kind='stable')]
+
+    def tlwh(self, slots):
+        """Get the boxes of `slots` in format `(top left x, top left y, width, height)`."""
+        ret = self.mean[slots, :4].copy()
+        ret[:, 2] *= ret[:, 3]
+        ret[:, :2] -= ret[:, 2:] / 2
+        return ret
+
+    def tlbr(self, slots):
+        """Get the boxes of `slots` in format `(min x, min y, max x, max y)`."""
+        ret = self.tlwh(slots)
+        ret[:, 2:] += ret[:, :2]
+        return ret
+
+
+class TrackView(object):
+    """Read-only snapshot of one output track of an `ArrayBYTETracker`.
+
+    It exposes the `STrack` attributes read by the callers of `BYTETracker`,
+    so both trackers can be used interchangeably.
+    """
+    __slots__ = ('track_id', 'score', 'tlwh', 'start_frame', 'frame_id', 'det_index')
+
+    def __init__(self, track_id, score, tlwh, start_frame, frame_id, det_index):
+        self.track_id = track_id
+        self.score = score
+        self.tlwh = tlwh
+        self.start_frame = start_frame
+        self.frame_id = frame_id
+        self.det_index = det_index
+
+    @property
+    def end_frame(self):
+        return self.frame_id
+
+    @property
+    def tlbr(self):
+        ret = self.tlwh.copy()
+        ret[2:] += ret[:2]
+        return ret
+
+    def __repr__(self):
+        return 'OT_{}_({}-{})'.format(self.track_id, self.start_frame, self.end_frame)
+
+
+def tlbr_to_xyah(tlbr, dtype=np.float64):
+    """Convert Nx4 boxes `(min x, min y, max x, max y)` to `(center x, center y,
+    aspect ratio, height)`."""
+    ret = np.array(tlbr, dtype=dtype)
+    ret[:, 2:] -= ret[:, :2]
+    ret[:, :2] += ret[:, 2:] / 2
+    ret[:, 2] /= ret[:, 3]
+    return ret
+
+
+def _matches(matches):
+    return np.asarray(matches, dtype=int).reshape(-1, 2)
+
+
+class ArrayBYTETracker(object):
+    """
+    ByteTrack association on top of a `TrackStore`.
+
+    Same algorithm and interface as `BYTETracker`, but all live tracks are kept
+    in contiguous (N, 8) mean and (N, 8, 8) covariance arrays plus state, score,
+    frame and id columns. Kalman predict/update, IoU costs and state transitions
+    run as batched array operations, without per-track Python objects on the
+    hot path. Only the returned `TrackView` snapshots are built per track.
+    """
+
+    def __init__(self, args, frame_rate=30, capacity=256, on_finished=None, id_allocator=None,
+                 sparse_iou=False, profiler=None, dtype=np.float64):
+        """
+        :param capacity: initial number of track slots, grown on demand.
+        :param on_finished: optional callable receiving, once per frame, the
+            `TrackView` list of the tracks that left the tracker on that frame.
+        :param id_allocator: `IdAllocator` numbering the tracks, a new one
+            starting at 1 by default.
+        :param sparse_iou: only compute the IoU of overlapping boxes, see `BYTETracker`.
+        :param profiler: optional `StageProfiler`, see `BYTETracker`.
+        :param dtype: float type of the Kalman states and cost matrices, see `BYTETracker`.
+        """
+        self.dtype = np.dtype(dtype)
+        self.store = TrackStore(capacity, dtype)
+        self.on_finished = on_finished
+
+        self.frame_id = 0
+        self.args = args
+        self.det_thresh = args.track_thresh + 0.1
+        self.low_thresh = getattr(args, 'low_thresh', 0.1)
+        self.second_match_thresh = getattr(args, 'second_match_thresh', 0.5)
+        self.unconfirmed_match_thresh = getattr(args, 'unconfirmed_match_thresh', 0.7)
+        self.buffer_size = int(frame_rate / 30.0 * args.track_buffer)
+        self.max_time_lost = self.buffer_size
+        self.kalman_filter = KalmanFilter(dtype)
+        self.id_allocator = IdAllocator() if id_allocator is None else id_allocator
+        self.sparse_iou = sparse_iou
+        # Every dense cost matrix of a frame is written in this buffer, each one is
+        # consumed before the next one is computed
+        self.cost_buffer = matching.CostBuffer(dtype)
+        if sparse_iou:
+            self.iou_distance = functools.partial(matching.sparse_iou_distance, dtype=dtype)
+        else:
+            self.iou_distance = functools.partial(matching.fused_iou_distance, buffer=self.cost_buffer, dtype=dtype)
+        self.profiler = profiler
+
+    def update(self, output_results, img_info, img_size):
+        slots = self._step(output_results, img_info, img_size)
+        return self._views(slots)
+
+    def update_arrays(self, output_results, img_info, img_size):
+        """Same as `update` but return the output tracks as
+        `(track_ids, tlwhs, scores, det_indices)` arrays."""
+        slots = self._step(output_results, img_info, img_size)
+        store = self.store
+        return store.track_id[slots], store.tlwh(slots), store.score[slots], store.det_index[slots]
+
+    def coast(self):
+        """Advance the tracker by one frame on Kalman predictions only, see `BYTETracker.coast`."""
+        return self._views(self._coast())
+
+    def coast_arrays(self):
+        """Same as `coast` but return the output tracks as arrays, see `update_arrays`."""
+        slots = self._coast()
+        store = self.store
+        return store.track_id[slots], store.tlwh(slots), store.score[slots], store.det_index[slots]
+
+    def _coast(self):
+        self.frame_id += 1
+        store = self.store
+        tracked = store.select(TrackState.Tracked)
+        output = tracked[store.is_activated[tracked]]
+        self._predict(np.concatenate([output, store.select(TrackState.Lost, TrackState.Removed)]))
+        return output
+
+    def _predict(self, slots):
+        store = self.store
+        if len(slots) > 0:
+            multi_mean = store.mean[slots]
+            multi_mean[store.state[slots] != TrackState.Tracked, 7] = 0
+            # The gathered rows are copies, predicted in place then scattered back
+            multi_covariance = store.covariance[slots]
+            self.kalman_filter.multi_predict(multi_mean, multi_covariance, out=(multi_mean, multi_covariance))
+            store.mean[slots], store.covariance[slots] = multi_mean, multi_covariance
+
+    def association_cost(self, slots, tlbrs, scores, thresh):
+        """IoU distance of track slots and detection boxes, see `BYTETracker.association_cost`.
+        `scores` are the detection scores to fuse, or None."""
+        if self.sparse_iou:
+            dists = self.iou_distance(self.store.tlbr(slots), tlbrs)
+            return dists if scores is None else matching.fuse_score(dists, scores)
+        return matching.fused_iou_distance(self.store.tlbr(slots), tlbrs, scores, thresh, self.cost_buffer, self.dtype)
+
+    def _views(self, slots):
+        store = self.store
+        return [TrackView(int(tid), float(score), tlwh, int(start), int(frame), int(det_index))
+                for tid, score, tlwh, start, frame, det_index in zip(
+                    store.track_id[slots], store.score[slots], store.tlwh(slots),
+                    store.start_frame[slots], store.frame_id[slots], store.det_index[slots])]
+
+    def _update_tracks(self, slots, tlbrs, scores, det_index):
+        """Correct matched tracks with their detections, re-activating lost ones.
+
+        Returns the re-found slots, i.e. the ones that were not `Tracked`.
+        """
+        store = self.store
+        if len(slots) == 0:
+            return slots
+        was_tracked = store.state[slots] == TrackState.Tracked
+        store.mean[slots], store.covariance[slots] = self.kalman_filter.multi_update(
+            store.mean[slots], store.covariance[slots], tlbr_to_xyah(tlbrs, self.dtype))
+        store.tracklet_len[slots] = np.where(was_tracked, store.tracklet_len[slots] + 1, 0)
+        store.state[slots] = TrackState.Tracked
+        store.is_activated[slots] = True
+        store.frame_id[slots] = self.frame_id
+        store.score[slots] = scores
+        store.det_index[slots] = det_index
+        return slots[~was_tracked]
+
+    def _activate_tracks(self, tlbrs, scores, det_index):
+        store = self.store
+        slots = store.allocate(len(tlbrs))
+        if len(slots) == 0:
+            return slots
+        store.mean[slots], store.covariance[slots] = self.kalman_filter.multi_initiate(tlbr_to_xyah(tlbrs, self.dtype))
+        store.track_id[slots] = self.id_allocator.take(len(slots))
+        store.state[slots] = TrackState.Tracked
+        store.is_activated[slots] = self.frame_id == 1
+        store.score[slots] = scores
+        store.frame_id[slots] = self.frame_id
+        store.start_frame[slots] = self.frame_id
+        store.tracklet_len[slots] = 0
+        store.det_index[slots] = det_index
+        return slots
+
+    def _step(self, output_results, img_info, img_size):
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
+        self.frame_id += 1
+        store = self.store
+
+        output_results = np.asarray(matching.as_numpy(output_results), dtype=self.dtype)
+        if output_results.shape[1] == 5:
+            scores = output_results[:, 4]
+        else:
+            scores = output_results[:, 4] * output_results[:, 5]
+        img_h, img_w = img_info[0], img_info[1]
+        scale = min(img_size[0] / float(img_h), img_size[1] / float(img_w))
+        bboxes = output_results[:, :4] / scale  # x1y1x2y2
+
+        remain_inds = scores > self.args.track_thresh
+        inds_second = np.logical_and(scores > self.low_thresh, scores < self.args.track_thresh)
+        dets = bboxes[remain_inds]
+        scores_keep = scores[remain_inds]
+        dets_second = bboxes[inds_second]
+        scores_second = scores[inds_second]
+        index_keep = np.flatnonzero(remain_inds)
+        index_second = np.flatnonzero(inds_second)
+
+        tracked = store.select(TrackState.Tracked)
+        # Like `BYTETracker.lost_stracks`, the lost list keeps the tracks removed
+        # on the previous frame for one more association round.
+        lost = store.select(TrackState.Lost, TrackState.Removed)
+        unconfirmed = tracked[~store.is_activated[tracked]]
+        strack_pool = np.concatenate([tracked[store.is_activated[tracked]], lost])
+        if profiler is not None:
+            profiler.mark('detections')
+
+        ''' Step 2: First association, with high score detection boxes'''
+        # Predict the current location with KF
+        self._predict(strack_pool)
+        if profiler is not None:
+            profiler.mark('predict')
+        dists = self.association_cost(strack_pool, dets, None if self.args.mot20 else scores_keep,
+                                      self.args.match_thresh)
+        if profiler is not None:
+            profiler.shape('first_association', dists.shape)
+        matches, u_track, u_detection = matching.linear_assignment(dists, thresh=self.args.match_thresh)
+        matches = _matches(matches)
+        refind = self._update_tracks(
+            strack_pool[matches[:, 0]], dets[matches[:, 1]], scores_keep[matches[:, 1]], index_keep[matches[:, 1]])
+        if profiler is not None:
+            profiler.mark('first_association')
+
+        ''' Step 3: Second association, with low score detection boxes'''
+        r_tracked = strack_pool[np.asarray(u_track, dtype=int)]
+        r_tracked = r_tracked[store.state[r_tracked] == TrackState.Tracked]
+        dists = self.association_cost(r_tracked, dets_second, None, self.second_match_thresh)
+        if profiler is not None:
+            profiler.shape('second_association', dists.shape)
+        matches, u_track, _ = matching.linear_assignment(dists, thresh=self.second_match_thresh)
+        matches = _matches(matches)
+        refind_second = self._update_tracks(
+            r_tracked[matches[:, 0]], dets_second[matches[:, 1]], scores_second[matches[:, 1]],
+            index_second[matches[:, 1]])
+        refind = np.concatenate([refind, refind_second])
+
+        new_lost = r_tracked[np.asarray(u_track, dtype=int)]
+        new_lost = new_lost[store.state[new_lost] != TrackState.Lost]
+        store.state[new_lost] = TrackState.Lost
+        if profiler is not None:
+            profiler.mark('second_association')
+
+        '''Deal with unconfirmed tracks, usually tracks with only one beginning frame'''
+        u_detection = np.asarray(u_detection, dtype=int)
+        dists = self.association_cost(unconfirmed, dets[u_detection],
+                                      None if self.args.mot20 else scores_keep[u_detection],
+                                      self.unconfirmed_match_thresh)
+        if profiler is not None:
+            profiler.shape('unconfirmed', dists.shape)
+        matches, u_unconfirmed, u_detection_left = matching.linear_assignment(dists, thresh=self.unconfirmed_match_thresh)
+        matches = _matches(matches)
+        matched_dets = u_detection[matches[:, 1]]
+        self._update_tracks(
+            unconfirmed[matches[:, 0]], dets[matched_dets], scores_keep[matched_dets], index_keep[matched_dets])
+        removed = [unconfirmed[np.asarray(u_unconfirmed, dtype=int)]]
+        if profiler is not None:
+            profiler.mark('unconfirmed')
+
+        """ Step 4: Init new stracks"""
+        new_dets = u_detection[np.asarray(u_detection_left, dtype=int)]
+        new_dets = new_dets[scores_keep[new_dets] >= self.det_thresh]
+        activated = self._activate_tracks(dets[new_dets], scores_keep[new_dets], index_keep[new_dets])
+        if profiler is not None:
+            profiler.mark('init')
+
+        """ Step 5: Update state"""
+        expired = lost[self.frame_id - store.frame_id[lost] > self.max_time_lost]
+        store.state[expired] = TrackState.Removed
+
+        # New tracks then re-found tracks join the tracked list, lost tracks
+        # join the lost list; the others keep their place.
+        store.reorder(activated)
+        store.reorder(refind)
+        store.reorder(new_lost)
+
+        # Tracks removed on a previous frame leave the lost list for good,
+        # tracks removed on this frame stay in it until the next one.
+        lost = np.concatenate([lost[store.state[lost] != TrackState.Tracked], new_lost])
+        removed.append(lost[store.was_removed[lost]])
+        store.release(np.concatenate(removed))
+        store.was_removed[expired] = True
+
+        tracked = store.select(TrackState.Tracked)
+        lost = store.select(TrackState.Lost, TrackState.Removed)
+        dup_tracked, dup_lost = remove_duplicate_slots(store, tracked, lost, self.iou_distance)
+        store.release(np.concatenate([dup_tracked, dup_lost]))
+        if self.on_finished is not None:
+            # Like `BYTETracker`, only the tracks of the previous frame can finish:
+            # tracks started on this frame and dropped as duplicates are not reported.
+            dup_finished = dup_tracked[store.start_frame[dup_tracked] != self.frame_id]
+            finished = np.concatenate(removed + [dup_finished, dup_lost])
+            if len(finished) > 0:
+                # Released rows keep their values until the slots are reused.
+                self.on_finished(self._views(finished))
+
+        tracked = store.select(TrackState.Tracked)
+        output = tracked[store.is_activated[tracked]]
+        if profiler is not None:
+            profiler.mark('bookkeeping')
+            states = store.state[np.concatenate([tracked, store.select(TrackState.Lost, TrackState.Removed)])]
+            for name, count in zip(('new', 'tracked', 'lost', 'removed'), np.bincount(states, minlength=4)):
+                profiler.count(name, int(count))
+        return output
+
+
+def remove_duplicate_slots(store, slotsa, slotsb, iou_distance=matching.iou_distance):
+    """Return the slots of `slotsa` and `slotsb` overlapping each other, keeping the oldest track of each pair.
+    A slot overlapping several others is returned once."""
+    pdist = iou_distance(store.tlbr(slotsa), store.tlbr(slotsb))
+    if scipy.sparse.issparse(pdist):
+        close = pdist.data < 0.15
+        p, q = pdist.row[close], pdist.col[close]
+    else:
+        p, q = np.where(pdist < 0.15)
+    timep = store.frame_id[slotsa[p]] - store.start_frame[slotsa[p]]
+    timeq = store.frame_id[slotsb[q]] - store.start_frame[slotsb[q]]
+    return np.unique(slotsa[p[timep <= timeq]]), np.unique(slotsb[q[timep > timeq]])
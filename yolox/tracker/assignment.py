@@ -0,0 +1,266 @@
+"""
+Linear assignment solvers behind a common interface.
+
+Every backend takes a cost matrix and a threshold and returns the matched
+`(rows, cols)` index arrays. A pair costing more than the threshold is never
+matched, and any row or column may stay unmatched. The backends are:
+
+- `lapjv`: Jonker-Volgenant from the `lap` package, the historical solver.
+- `scipy`: `scipy.optimize.linear_sum_assignment` on the same extended problem
+  as lapjv, so it gives the same matches without the `lap` build dependency.
+- `greedy`: repeatedly match the cheapest free pair. Not optimal, but fast
+  on very large or easy (well separated) problems.
+- `sparse`: solve each connected component of the gated cost graph on its
+  own with a dense backend. Sparse matrices always use it.
+
+Run this module on a file saved by `CostMatrixRecorder` to compare the
+backends on recorded cost matrices:
+
+    python -m infer_bytetrack.yolox.tracker.assignment costs.npz
+"""
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse.csgraph import connected_components
+
+try:
+    import lap
+except ImportError:
+    lap = None
+
+
+def solve_lapjv(cost_matrix, thresh):
+    if lap is None:
+        raise ImportError("The lapjv assignment backend requires the lap package")
+    _, x, _ = lap.lapjv(cost_matrix, extend_cost=True, cost_limit=thresh)
+    rows = np.flatnonzero(x >= 0)
+    return rows, x[rows]
+
+
+def solve_scipy(cost_matrix, thresh):
+    # lapjv's cost_limit problem: leaving a row or a column unmatched costs half the threshold
+    num_a, num_b = cost_matrix.shape
+    extended = np.full((num_a + num_b, num_a + num_b), thresh / 2.)
+    extended[:num_a, :num_b] = cost_matrix
+    extended[num_a:, num_b:] = 0
+    rows, cols = linear_sum_assignment(extended)
+    keep = (rows < num_a) & (cols < num_b)
+    return rows[keep], cols[keep]
+
+
+def solve_greedy(cost_matrix, thresh):
+    rows, cols = np.nonzero(cost_matrix <= thresh)
+    order = np.argsort(cost_matrix[rows, cols], kind='stable')
+    free_a = np.ones(cost_matrix.shape[0], dtype=bool)
+    free_b = np.ones(cost_matrix.shape[1], dtype=bool)
+    matched = []
+    for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+        if free_a[row] and free_b[col]:
+            free_a[row] = free_b[col] = False
+            matched.append((row, col))
+    matched = np.asarray(matched, dtype=int).reshape(-1, 2)
+    return matched[:, 0], matched[:, 1]
+
+
+def solve_sparse(cost_matrix, thresh, dense_backend=None):
+    """
+    Gate out the pairs costing more than `thresh`, then solve every connected
+    component of the remaining track/detection graph separately.
+    :param cost_matrix: scipy.sparse matrix, where missing pairs cannot be matched, or np.ndarray
+    :param dense_backend: backend solving the components, the default one if None
+    """
+    if scipy.sparse.issparse(cost_matrix):
+        cost_matrix = cost_matrix.tocoo()
+        rows, cols, costs = cost_matrix.row, cost_matrix.col, cost_matrix.data
+        gated = costs <= thresh
+        rows, cols, costs = rows[gated], cols[gated], costs[gated]
+    else:
+        rows, cols = np.nonzero(cost_matrix <= thresh)
+        costs = cost_matrix[rows, cols]
+    num_a, num_b = cost_matrix.shape
+    solve_dense = BACKENDS[_dense_backend(dense_backend)]
+
+    graph = scipy.sparse.coo_matrix((np.ones(len(rows)), (rows, num_a + cols)), shape=(num_a + num_b,) * 2)
+    _, labels = connected_components(graph, directed=False)
+    comp_a = np.bincount(labels[:num_a], minlength=num_a + num_b)
+    comp_b = np.bincount(labels[num_a:], minlength=num_a + num_b)
+
+    # One row facing one column: the pair is matched without solver
+    edge_label = labels[rows]
+    single = (comp_a[edge_label] == 1) & (comp_b[edge_label] == 1)
+    matched_a, matched_b = [rows[single]], [cols[single]]
+
+    multi = ~single
+    rows, cols, costs, edge_label = rows[multi], cols[multi], costs[multi], edge_label[multi]
+    order = np.argsort(edge_label, kind='stable')
+    rows, cols, costs, edge_label = rows[order], cols[order], costs[order], edge_label[order]
+    bounds = np.flatnonzero(np.diff(edge_label)) + 1
+    for comp_rows, comp_cols, comp_costs in zip(np.split(rows, bounds), np.split(cols, bounds),
+                                                np.split(costs, bounds)):
+        if len(comp_rows) == 0:
+            continue
+        ua, ia = np.unique(comp_rows, return_inverse=True)
+        ub, ib = np.unique(comp_cols, return_inverse=True)
+        comp_matrix = np.full((len(ua), len(ub)), thresh + 1.)
+        comp_matrix[ia, ib] = comp_costs
+        x, y = solve_dense(comp_matrix, thresh)
+        matched_a.append(ua[x])
+        matched_b.append(ub[y])
+
+    return np.concatenate(matched_a), np.concatenate(matched_b)
+
+
+BACKENDS = {
+    'lapjv': solve_lapjv,
+    'scipy': solve_scipy,
+    'greedy': solve_greedy,
+    'sparse': solve_sparse,
+}
+
+_default_backend = 'lapjv' if lap is not None else 'scipy'
+_recorder = None
+
+
+def get_default_backend():
+    return _default_backend
+
+
+def set_default_backend(backend):
+    """Select the backend used when `solve` is called without one."""
+    global _default_backend
+    if backend not in BACKENDS:
+        raise ValueError("Unknown assignment backend {}, expected one of {}".format(backend, sorted(BACKENDS)))
+    if backend == 'lapjv' and lap is None:
+        raise ImportError("The lapjv assignment backend requires the lap package")
+    _default_backend = backend
+
+
+def _dense_backend(backend):
+    backend = _default_backend if backend is None else backend
+    if backend == 'sparse':
+        backend = 'lapjv' if lap is not None else 'scipy'
+    return backend
+
+
+def solve(cost_matrix, thresh, backend=None):
+    """
+    Match rows and columns of `cost_matrix` for a minimal total cost
+    :param cost_matrix: np.ndarray, or scipy.sparse matrix always solved with the sparse backend
+    :param backend: name in `BACKENDS`, the default one if None
+
+    :rtype (matches, unmatched_a, unmatched_b), matches is a (K, 2) array sorted by row
+    """
+    if _recorder is not None:
+        _recorder.add(cost_matrix, thresh)
+    num_a, num_b = cost_matrix.shape
+    if num_a == 0 or num_b == 0:
+        rows = cols = np.empty(0, dtype=int)
+    elif scipy.sparse.issparse(cost_matrix):
+        rows, cols = solve_sparse(cost_matrix, thresh, backend)
+    else:
+        backend = _default_backend if backend is None else backend
+        rows, cols = BACKENDS[backend](cost_matrix, thresh)
+
+    order = np.argsort(rows, kind='stable')
+    matches = np.stack([rows[order], cols[order]], axis=1).astype(int)
+    unmatched_a = np.setdiff1d(np.arange(num_a), rows)
+    unmatched_b = np.setdiff1d(np.arange(num_b), cols)
+    return matches, unmatched_a, unmatched_b
+
+
+class CostMatrixRecorder(object):
+    """
+    Record the cost matrices going through `solve`, to benchmark the backends
+    on real data. Use as a context manager around tracker updates:
+
+        with CostMatrixRecorder() as recorder:
+            for frame in frames:
+                tracker.update(...)
+        recorder.save("costs.npz")
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.problems = []  # list of (cost_matrix, thresh)
+
+    def add(self, cost_matrix, thresh):
+        if self.limit is not None and len(self.problems) >= self.limit:
+            return
+        if scipy.sparse.issparse(cost_matrix):
+            # Missing pairs are never matched, a cost of 1 makes them fail any threshold below 1
+            dense = np.ones(cost_matrix.shape)
+            cost_matrix = cost_matrix.tocoo()
+            dense[cost_matrix.row, cost_matrix.col] = cost_matrix.data
+            cost_matrix = dense
+        self.problems.append((np.array(cost_matrix, dtype=np.float64), float(thresh)))
+
+    def __enter__(self):
+        global _recorder
+        self._previous = _recorder
+        _recorder = self
+        return self
+
+    def __exit__(self, *exc):
+        global _recorder
+        _recorder = self._previous
+
+    def save(self, path):
+        arrays = {}
+        for i, (cost_matrix, thresh) in enumerate(self.problems):
+            arrays["cost_{}".format(i)] = cost_matrix
+            arrays["thresh_{}".format(i)] = np.float64(thresh)
+        np.savez_compressed(path, **arrays)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as data:
+            count = len([key for key in data.files if key.startswith("cost_")])
+            return [(data["cost_{}".format(i)], float(data["thresh_{}".format(i)])) for i in range(count)]
+
+
+def benchmark(problems, backends=None, repeat=3):
+    """
+    Time the backends on a list of `(cost_matrix, thresh)` problems
+    :param backends: names in `BACKENDS`, all the available ones if None
+    :param repeat: runs per backend, the fastest one is kept
+
+    :rtype dict, backend name -> {"seconds", "matches", "cost"} over all the problems
+    """
+    if backends is None:
+        backends = [name for name in BACKENDS if name != 'lapjv' or lap is not None]
+    results = {}
+    for backend in backends:
+        best = np.inf
+        for _ in range(repeat):
+            start = time.perf_counter()
+            solutions = [solve(cost_matrix, thresh, backend)[0] for cost_matrix, thresh in problems]
+            best = min(best, time.perf_counter() - start)
+        num_matches = sum(len(matches) for matches in solutions)
+        total_cost = sum(float(cost_matrix[matches[:, 0], matches[:, 1]].sum())
+                         for (cost_matrix, _), matches in zip(problems, solutions))
+        results[backend] = {"seconds": best, "matches": num_matches, "cost": total_cost}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the linear assignment backends")
+    parser.add_argument("costs", help="file saved by CostMatrixRecorder.save")
+    parser.add_argument("--backends", nargs="+", choices=sorted(BACKENDS), default=None)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    problems = CostMatrixRecorder.load(args.costs)
+    sizes = np.array([cost_matrix.size for cost_matrix, _ in problems])
+    print("{} cost matrices, median size {}".format(len(problems), int(np.median(sizes)) if len(sizes) else 0))
+    print("{:<8} {:>10} {:>12} {:>9} {:>12}".format("backend", "total ms", "us/problem", "matches", "total cost"))
+    for backend, res in benchmark(problems, args.backends, args.repeat).items():
+        print("{:<8} {:>10.2f} {:>12.1f} {:>9d} {:>12.4f}".format(
+            backend, res["seconds"] * 1e3, res["seconds"] * 1e6 / max(len(problems), 1),
+            res["matches"], res["cost"]))
+
+
+if __name__ == "__main__":
+    main()
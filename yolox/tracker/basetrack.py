@@ -1,4 +1,5 @@
 import numpy as np
+import threading
 from collections import OrderedDict
 
 
@@ -9,6 +10,41 @@ class TrackState(object):
     Removed = 3
 
 
+class IdAllocator(object):
+    """
+    Track id sequence owned by one tracker.
+
+    Unlike `BaseTrack.next_id`, which shares one class-level counter between
+    all the trackers of the process, each allocator numbers its tracks from
+    `start + 1` on its own. Allocation is thread-safe and the sequence can be
+    saved with `snapshot` and resumed with `restore`.
+    """
+
+    def __init__(self, start=0):
+        self._count = start
+        self._lock = threading.Lock()
+
+    def next_id(self):
+        with self._lock:
+            self._count += 1
+            return self._count
+
+    def take(self, count):
+        """Allocate `count` consecutive ids at once."""
+        with self._lock:
+            first = self._count + 1
+            self._count += count
+        return np.arange(first, first + count)
+
+    def snapshot(self):
+        with self._lock:
+            return self._count
+
+    def restore(self, snapshot):
+        with self._lock:
+            self._count = snapshot
+
+
 class BaseTrack(object):
     _count = 0
 
@@ -1,18 +1,18 @@
 import numpy as np
+import scipy.sparse
 from collections import deque
+import functools
 import os
 import os.path as osp
 import copy
-import torch
-import torch.nn.functional as F
 
 from .kalman_filter import KalmanFilter
 from infer_bytetrack.yolox.tracker import matching
-from .basetrack import BaseTrack, TrackState
+from .basetrack import BaseTrack, IdAllocator, TrackState
 
 class STrack(BaseTrack):
     shared_kalman = KalmanFilter()
-    def __init__(self, tlwh, score):
+    def __init__(self, tlwh, score, det_index=-1):
 
         # wait activate
         self._tlwh = np.asarray(tlwh, dtype=np.float32)
@@ -22,6 +22,73 @@ class STrack(BaseTrack):
 
         self.score = score
         self.tracklet_len = 0
+        self.was_removed = False
+        # Row of the tracker input holding the detection last associated to the track
+        self.det_index = det_index
+
+    @property
+    def mean(self):
+        return self._mean
+
+    @mean.setter
+    def mean(self, mean):
+        self._mean = mean
+        # The boxes of the new state are computed on their first access
+        self._boxes = None
+
+    @property
+    def boxes(self):
+        """Read-only (2, 4) array of the `tlwh` then `tlbr` box of the current state,
+        computed once per state change."""
+        if self._boxes is None:
+            if self._mean is None:
+                self._boxes = STrack.tlwh_to_boxes(self._tlwh[np.newaxis])[0]
+            else:
+                self._boxes = STrack.mean_to_boxes(self._mean[np.newaxis])[0]
+        return self._boxes
+
+    @staticmethod
+    def tlwh_to_boxes(tlwhs):
+        """Read-only (N, 2, 4) array of the `tlwh` then `tlbr` box of each of the (N, 4) `tlwhs`."""
+        boxes = np.empty((len(tlwhs), 2, 4), dtype=tlwhs.dtype)
+        boxes[:, 0] = tlwhs
+        boxes[:, 1] = tlwhs
+        boxes[:, 1, 2:] += boxes[:, 1, :2]
+        boxes.flags.writeable = False
+        return boxes
+
+    @staticmethod
+    def mean_to_boxes(multi_mean):
+        """Boxes of (N, 8) Kalman means, see `tlwh_to_boxes`."""
+        tlwhs = multi_mean[:, :4].copy()
+        tlwhs[:, 2] *= tlwhs[:, 3]
+        tlwhs[:, :2] -= tlwhs[:, 2:] / 2
+        return STrack.tlwh_to_boxes(tlwhs)
+
+    @staticmethod
+    def set_boxes(stracks, boxes):
+        """Keep row i of the (N, 2, 4) `boxes` as the boxes of `stracks[i]`."""
+        for st, track_boxes in zip(stracks, boxes):
+            st._boxes = track_boxes
+
+    @staticmethod
+    def multi_tlbr(stracks):
+        """(N, 4) array of the `tlbr` boxes of `stracks`."""
+        return np.array([st.boxes[1] for st in stracks]).reshape(-1, 4)
+
+    @staticmethod
+    def from_tlbrs(tlbrs, scores, det_indices):
+        """
+        Detection tracks of (N, 4) `tlbrs`, as `STrack(STrack.tlbr_to_tlwh(tlbr), score, det_index)`
+        :return: the list of tracks, and their (N, 2, 4) boxes
+        """
+        tlwhs = np.array(tlbrs).reshape(-1, 4)
+        tlwhs[:, 2:] -= tlwhs[:, :2]
+        tlwhs = tlwhs.astype(np.float32)
+        stracks = [STrack(tlwh, s, i) for tlwh, s, i in zip(tlwhs, scores, det_indices)]
+        boxes = STrack.tlwh_to_boxes(tlwhs)
+        STrack.set_boxes(stracks, boxes)
+        return stracks, boxes
 
     def predict(self):
         mean_state = self.mean.copy()
@@ -31,21 +98,61 @@ class STrack(BaseTrack):
 
     @staticmethod
     def multi_predict(stracks):
+        """Predict `stracks` with one batched Kalman step.
+
+        Returns the (N, 2, 4) boxes of the predicted tracks, see `tlwh_to_boxes`.
+        """
+        if len(stracks) == 0:
+            return np.empty((0, 2, 4))
+        multi_mean = np.asarray([st.mean.copy() for st in stracks])
+        multi_covariance = np.asarray([st.covariance for st in stracks])
+        for i, st in enumerate(stracks):
+            if st.state != TrackState.Tracked:
+                multi_mean[i][7] = 0
+        # The filter of the tracker, whose precision the states follow
+        kalman_filter = stracks[0].kalman_filter or STrack.shared_kalman
+        kalman_filter.multi_predict(multi_mean, multi_covariance, out=(multi_mean, multi_covariance))
+        for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
+            stracks[i].mean = mean
+            stracks[i].covariance = cov
+        boxes = STrack.mean_to_boxes(multi_mean)
+        STrack.set_boxes(stracks, boxes)
+        return boxes
+
+    @staticmethod
+    def multi_update(stracks, detections, frame_id):
+        """Update matched tracks with one batched Kalman correction.
+
+        Tracks that are not tracked anymore are re-activated, as with
+        `re_activate` without a new id.
+        """
         if len(stracks) > 0:
-            multi_mean = np.asarray([st.mean.copy() for st in stracks])
+            multi_mean = np.asarray([st.mean for st in stracks])
             multi_covariance = np.asarray([st.covariance for st in stracks])
-            for i, st in enumerate(stracks):
-                if st.state != TrackState.Tracked:
-                    multi_mean[i][7] = 0
-            multi_mean, multi_covariance = STrack.shared_kalman.multi_predict(multi_mean, multi_covariance)
-            for i, (mean, cov) in enumerate(zip(multi_mean, multi_covariance)):
-                stracks[i].mean = mean
-                stracks[i].covariance = cov
-
-    def activate(self, kalman_filter, frame_id):
+            multi_xyah = np.asarray([det.tlwh for det in detections])
+            multi_xyah[:, :2] += multi_xyah[:, 2:] / 2
+            multi_xyah[:, 2] /= multi_xyah[:, 3]
+            kalman_filter = stracks[0].kalman_filter or STrack.shared_kalman
+            multi_mean, multi_covariance = kalman_filter.multi_update(multi_mean, multi_covariance, multi_xyah)
+            boxes = STrack.mean_to_boxes(multi_mean)
+            for st, det, mean, cov, track_boxes in zip(stracks, detections, multi_mean, multi_covariance, boxes):
+                st.mean = mean
+                st.covariance = cov
+                st._boxes = track_boxes
+                if st.state == TrackState.Tracked:
+                    st.tracklet_len += 1
+                else:
+                    st.tracklet_len = 0
+                st.state = TrackState.Tracked
+                st.is_activated = True
+                st.frame_id = frame_id
+                st.score = det.score
+                st.det_index = det.det_index
+
+    def activate(self, kalman_filter, frame_id, id_allocator=None):
         """Start a new tracklet"""
         self.kalman_filter = kalman_filter
-        self.track_id = self.next_id()
+        self.track_id = self.next_id() if id_allocator is None else id_allocator.next_id()
         self.mean, self.covariance = self.kalman_filter.initiate(self.tlwh_to_xyah(self._tlwh))
 
         self.tracklet_len = 0
@@ -56,7 +163,7 @@ class STrack(BaseTrack):
         self.frame_id = frame_id
         self.start_frame = frame_id
 
-    def re_activate(self, new_track, frame_id, new_id=False):
+    def re_activate(self, new_track, frame_id, new_id=False, id_allocator=None):
         self.mean, self.covariance = self.kalman_filter.update(
             self.mean, self.covariance, self.tlwh_to_xyah(new_track.tlwh)
         )
@@ -65,8 +172,9 @@ class STrack(BaseTrack):
         self.is_activated = True
         self.frame_id = frame_id
         if new_id:
-            self.track_id = self.next_id()
+            self.track_id = self.next_id() if id_allocator is None else id_allocator.next_id()
         self.score = new_track.score
+        self.det_index = new_track.det_index
 
     def update(self, new_track, frame_id):
         """
@@ -86,29 +194,23 @@ class STrack(BaseTrack):
         self.is_activated = True
 
         self.score = new_track.score
+        self.det_index = new_track.det_index
 
     @property
     # @jit(nopython=True)
     def tlwh(self):
         """Get current position in bounding box format `(top left x, top left y,
-                width, height)`.
+                width, height)`. Read-only, copy it to modify it.
         """
-        if self.mean is None:
-            return self._tlwh.copy()
-        ret = self.mean[:4].copy()
-        ret[2] *= ret[3]
-        ret[:2] -= ret[2:] / 2
-        return ret
+        return self.boxes[0]
 
     @property
     # @jit(nopython=True)
     def tlbr(self):
         """Convert bounding box to format `(min x, min y, max x, max y)`, i.e.,
-        `(top left, bottom right)`.
+        `(top left, bottom right)`. Read-only, copy it to modify it.
         """
-        ret = self.tlwh.copy()
-        ret[2:] += ret[:2]
-        return ret
+        return self.boxes[1]
 
     @staticmethod
     # @jit(nopython=True)
@@ -143,31 +245,67 @@ class STrack(BaseTrack):
 
 
 class BYTETracker(object):
-    def __init__(self, args, frame_rate=30):
+    def __init__(self, args, frame_rate=30, removed_buffer=1000, on_finished=None, id_allocator=None,
+                 sparse_iou=False, profiler=None, dtype=np.float64):
+        """
+        :param removed_buffer: number of most recently removed tracks kept in
+            `removed_stracks`, so memory stays bounded on endless streams.
+        :param on_finished: optional callable receiving, once per frame, the list of
+            tracks that left the tracker for good on that frame (e.g. to export them).
+        :param id_allocator: `IdAllocator` numbering the tracks, a new one
+            starting at 1 by default, so that concurrent trackers do not share ids.
+        :param sparse_iou: only compute the IoU of overlapping boxes and solve each group
+            of overlapping tracks and detections separately, for scenes with many objects.
+        :param profiler: optional `StageProfiler` recording the time of each stage of
+            `update`, the number of tracks per state and the cost-matrix shapes.
+        :param dtype: float type of the Kalman states and of the cost matrices,
+            np.float32 halves the memory of the states.
+        """
         self.tracked_stracks = []  # type: list[STrack]
         self.lost_stracks = []  # type: list[STrack]
-        self.removed_stracks = []  # type: list[STrack]
+        self.removed_stracks = deque(maxlen=removed_buffer)  # type: deque[STrack]
+        self.on_finished = on_finished
 
         self.frame_id = 0
         self.args = args
         #self.det_thresh = args.track_thresh
         self.det_thresh = args.track_thresh + 0.1
+        # Second stage thresholds, the ByteTrack ones unless set in args
+        self.low_thresh = getattr(args, 'low_thresh', 0.1)
+        self.second_match_thresh = getattr(args, 'second_match_thresh', 0.5)
+        self.unconfirmed_match_thresh = getattr(args, 'unconfirmed_match_thresh', 0.7)
         self.buffer_size = int(frame_rate / 30.0 * args.track_buffer)
         self.max_time_lost = self.buffer_size
-        self.kalman_filter = KalmanFilter()
+        self.dtype = np.dtype(dtype)
+        self.kalman_filter = KalmanFilter(dtype)
+        self.id_allocator = IdAllocator() if id_allocator is None else id_allocator
+        self.sparse_iou = sparse_iou
+        # Every dense cost matrix of a frame is written in this buffer, each one is
+        # consumed before the next one is computed
+        self.cost_buffer = matching.CostBuffer(dtype)
+        if sparse_iou:
+            self.iou_distance = functools.partial(matching.sparse_iou_distance, dtype=dtype)
+        else:
+            self.iou_distance = functools.partial(matching.fused_iou_distance, buffer=self.cost_buffer, dtype=dtype)
+        self.profiler = profiler
 
     def update(self, output_results, img_info, img_size):
+        profiler = self.profiler
+        if profiler is not None:
+            profiler.start()
         self.frame_id += 1
         activated_starcks = []
         refind_stracks = []
         lost_stracks = []
         removed_stracks = []
+        if self.on_finished is not None:
+            prev_stracks = joint_stracks(self.tracked_stracks, self.lost_stracks)
 
+        output_results = matching.as_numpy(output_results)
         if output_results.shape[1] == 5:
             scores = output_results[:, 4]
             bboxes = output_results[:, :4]
         else:
-            output_results = output_results.cpu().numpy()
             scores = output_results[:, 4] * output_results[:, 5]
             bboxes = output_results[:, :4]  # x1y1x2y2
         img_h, img_w = img_info[0], img_info[1]
@@ -175,7 +313,7 @@ class BYTETracker(object):
         bboxes /= scale
 
         remain_inds = scores > self.args.track_thresh
-        inds_low = scores > 0.1
+        inds_low = scores > self.low_thresh
         inds_high = scores < self.args.track_thresh
 
         inds_second = np.logical_and(inds_low, inds_high)
@@ -183,13 +321,11 @@ class BYTETracker(object):
         dets = bboxes[remain_inds]
         scores_keep = scores[remain_inds]
         scores_second = scores[inds_second]
+        index_keep = np.flatnonzero(remain_inds)
+        index_second = np.flatnonzero(inds_second)
 
-        if len(dets) > 0:
-            '''Detections'''
-            detections = [STrack(STrack.tlbr_to_tlwh(tlbr), s) for
-                          (tlbr, s) in zip(dets, scores_keep)]
-        else:
-            detections = []
+        '''Detections'''
+        detections, det_boxes = STrack.from_tlbrs(dets, scores_keep, index_keep)
 
         ''' Add newly detected tracklets to tracked_stracks'''
         unconfirmed = []
@@ -199,74 +335,86 @@ class BYTETracker(object):
                 unconfirmed.append(track)
             else:
                 tracked_stracks.append(track)
+        if profiler is not None:
+            profiler.mark('detections')
 
         ''' Step 2: First association, with high score detection boxes'''
         strack_pool = joint_stracks(tracked_stracks, self.lost_stracks)
         # Predict the current location with KF
-        STrack.multi_predict(strack_pool)
-        dists = matching.iou_distance(strack_pool, detections)
-        if not self.args.mot20:
-            dists = matching.fuse_score(dists, detections)
+        pool_boxes = STrack.multi_predict(strack_pool)
+        if profiler is not None:
+            profiler.mark('predict')
+        dists = self.association_cost(pool_boxes[:, 1], det_boxes[:, 1], None if self.args.mot20 else scores_keep,
+                                      self.args.match_thresh)
+        if profiler is not None:
+            profiler.shape('first_association', dists.shape)
         matches, u_track, u_detection = matching.linear_assignment(dists, thresh=self.args.match_thresh)
 
         for itracked, idet in matches:
             track = strack_pool[itracked]
-            det = detections[idet]
             if track.state == TrackState.Tracked:
-                track.update(detections[idet], self.frame_id)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, self.frame_id, new_id=False)
                 refind_stracks.append(track)
+        STrack.multi_update([strack_pool[i] for i, _ in matches], [detections[i] for _, i in matches], self.frame_id)
+        if profiler is not None:
+            profiler.mark('first_association')
 
         ''' Step 3: Second association, with low score detection boxes'''
         # association the untrack to the low score detections
-        if len(dets_second) > 0:
-            '''Detections'''
-            detections_second = [STrack(STrack.tlbr_to_tlwh(tlbr), s) for
-                          (tlbr, s) in zip(dets_second, scores_second)]
-        else:
-            detections_second = []
+        '''Detections'''
+        detections_second, det_boxes_second = STrack.from_tlbrs(dets_second, scores_second, index_second)
         r_tracked_stracks = [strack_pool[i] for i in u_track if strack_pool[i].state == TrackState.Tracked]
-        dists = matching.iou_distance(r_tracked_stracks, detections_second)
-        matches, u_track, u_detection_second = matching.linear_assignment(dists, thresh=0.5)
+        dists = self.association_cost(STrack.multi_tlbr(r_tracked_stracks), det_boxes_second[:, 1], None,
+                                      self.second_match_thresh)
+        if profiler is not None:
+            profiler.shape('second_association', dists.shape)
+        matches, u_track, u_detection_second = matching.linear_assignment(dists, thresh=self.second_match_thresh)
         for itracked, idet in matches:
             track = r_tracked_stracks[itracked]
-            det = detections_second[idet]
             if track.state == TrackState.Tracked:
-                track.update(det, self.frame_id)
                 activated_starcks.append(track)
             else:
-                track.re_activate(det, self.frame_id, new_id=False)
                 refind_stracks.append(track)
+        STrack.multi_update([r_tracked_stracks[i] for i, _ in matches], [detections_second[i] for _, i in matches],
+                            self.frame_id)
 
         for it in u_track:
             track = r_tracked_stracks[it]
             if not track.state == TrackState.Lost:
                 track.mark_lost()
                 lost_stracks.append(track)
+        if profiler is not None:
+            profiler.mark('second_association')
 
         '''Deal with unconfirmed tracks, usually tracks with only one beginning frame'''
         detections = [detections[i] for i in u_detection]
-        dists = matching.iou_distance(unconfirmed, detections)
-        if not self.args.mot20:
-            dists = matching.fuse_score(dists, detections)
-        matches, u_unconfirmed, u_detection = matching.linear_assignment(dists, thresh=0.7)
+        u_detection = np.asarray(u_detection, dtype=int)
+        dists = self.association_cost(STrack.multi_tlbr(unconfirmed), det_boxes[u_detection, 1],
+                                      None if self.args.mot20 else scores_keep[u_detection],
+                                      self.unconfirmed_match_thresh)
+        if profiler is not None:
+            profiler.shape('unconfirmed', dists.shape)
+        matches, u_unconfirmed, u_detection = matching.linear_assignment(dists, thresh=self.unconfirmed_match_thresh)
         for itracked, idet in matches:
-            unconfirmed[itracked].update(detections[idet], self.frame_id)
             activated_starcks.append(unconfirmed[itracked])
+        STrack.multi_update([unconfirmed[i] for i, _ in matches], [detections[i] for _, i in matches], self.frame_id)
         for it in u_unconfirmed:
             track = unconfirmed[it]
             track.mark_removed()
             removed_stracks.append(track)
+        if profiler is not None:
+            profiler.mark('unconfirmed')
 
         """ Step 4: Init new stracks"""
         for inew in u_detection:
             track = detections[inew]
             if track.score < self.det_thresh:
                 continue
-            track.activate(self.kalman_filter, self.frame_id)
+            track.activate(self.kalman_filter, self.frame_id, self.id_allocator)
             activated_starcks.append(track)
+        if profiler is not None:
+            profiler.mark('init')
         """ Step 5: Update state"""
         for track in self.lost_stracks:
             if self.frame_id - track.end_frame > self.max_time_lost:
@@ -280,14 +428,54 @@ class BYTETracker(object):
         self.tracked_stracks = joint_stracks(self.tracked_stracks, refind_stracks)
         self.lost_stracks = sub_stracks(self.lost_stracks, self.tracked_stracks)
         self.lost_stracks.extend(lost_stracks)
-        self.lost_stracks = sub_stracks(self.lost_stracks, self.removed_stracks)
+        # Drop the tracks removed on previous frames, the ones removed on this
+        # frame stay lost until the next one.
+        self.lost_stracks = [t for t in self.lost_stracks if not t.was_removed]
+        for track in removed_stracks:
+            track.was_removed = True
         self.removed_stracks.extend(removed_stracks)
-        self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(self.tracked_stracks, self.lost_stracks)
+        self.tracked_stracks, self.lost_stracks = remove_duplicate_stracks(
+            self.tracked_stracks, self.lost_stracks, self.iou_distance)
+        if self.on_finished is not None:
+            finished_stracks = sub_stracks(prev_stracks, joint_stracks(self.tracked_stracks, self.lost_stracks))
+            if len(finished_stracks) > 0:
+                self.on_finished(finished_stracks)
         # get scores of lost tracks
         output_stracks = [track for track in self.tracked_stracks if track.is_activated]
+        if profiler is not None:
+            profiler.mark('bookkeeping')
+            states = [track.state for track in self.tracked_stracks] + [track.state for track in self.lost_stracks]
+            for name, count in zip(('new', 'tracked', 'lost', 'removed'), np.bincount(states, minlength=4)):
+                profiler.count(name, int(count))
 
         return output_stracks
 
+    def association_cost(self, tlbrs, det_tlbrs, scores, thresh):
+        """
+        IoU distance of the (N, 4) track boxes and (M, 4) detection boxes, fused with the
+        detection `scores` unless None. Dense costs above `thresh` are gated out, and the
+        matrix lives in `cost_buffer` until the next call.
+        """
+        if self.sparse_iou:
+            dists = self.iou_distance(tlbrs, det_tlbrs)
+            return dists if scores is None else matching.fuse_score(dists, scores)
+        return matching.fused_iou_distance(tlbrs, det_tlbrs, scores, thresh, self.cost_buffer, self.dtype)
+
+    def coast(self):
+        """
+        Advance the tracker by one frame without detections, for the frames the
+        detector skips. Tracks move to their Kalman prediction and keep their state:
+        the output tracks of the last `update` are returned with their predicted box,
+        and their `frame_id` stays the one of their last detection. Lost tracks are
+        predicted too and expire on the next `update`.
+
+        :rtype list[STrack]
+        """
+        self.frame_id += 1
+        strack_pool = joint_stracks([t for t in self.tracked_stracks if t.is_activated], self.lost_stracks)
+        STrack.multi_predict(strack_pool)
+        return [track for track in self.tracked_stracks if track.is_activated]
+
 
 def joint_stracks(tlista, tlistb):
     exists = {}
@@ -314,9 +502,13 @@ def sub_stracks(tlista, tlistb):
     return list(stracks.values())
 
 
-def remove_duplicate_stracks(stracksa, stracksb):
-    pdist = matching.iou_distance(stracksa, stracksb)
-    pairs = np.where(pdist < 0.15)
+def remove_duplicate_stracks(stracksa, stracksb, iou_distance=matching.iou_distance):
+    pdist = iou_distance(STrack.multi_tlbr(stracksa), STrack.multi_tlbr(stracksb))
+    if scipy.sparse.issparse(pdist):
+        close = pdist.data < 0.15
+        pairs = pdist.row[close], pdist.col[close]
+    else:
+        pairs = np.where(pdist < 0.15)
     dupa, dupb = list(), list()
     for p, q in zip(*pairs):
         timep = stracksa[p].frame_id - stracksa[p].start_frame
@@ -0,0 +1,280 @@
+"""
+IoU of box sets behind a common interface, as `cython_bbox.bbox_overlaps`.
+
+Boxes are (x1, y1, x2, y2) with inclusive pixel coordinates, so a box is
+`x2 - x1 + 1` wide. Every backend fills a (N, K) matrix of the IoU of `boxes`
+with `query_boxes`:
+
+- `cython`: `cython_bbox.bbox_overlaps`, the historical kernel. Always float64.
+- `numpy`: vectorized over chunks of rows, in float64 (same results as cython,
+  operation for operation) or float32, into an optional preallocated output.
+- `numba`: the cython loop compiled by numba, when numba is installed.
+
+`fused_cost` goes one step further for the trackers and writes the association
+cost `1 - IoU * score` straight into a buffer kept across frames.
+
+The default backend is cython when it is installed, numpy otherwise. Run this
+module to check the backends against cython and time them, and the fused cost:
+
+    python -m infer_bytetrack.yolox.tracker.iou --boxes 500
+"""
+import argparse
+import time
+
+import numpy as np
+
+try:
+    from cython_bbox import bbox_overlaps as _cython_bbox_overlaps
+except ImportError:
+    _cython_bbox_overlaps = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Rows of `boxes` per chunk are chosen for chunks of about this many IoU values
+CHUNK_ELEMENTS = 1 << 18
+
+
+def _as_boxes(boxes, dtype):
+    return np.ascontiguousarray(np.asarray(boxes, dtype=dtype).reshape(-1, 4))
+
+
+def overlaps_cython(boxes, query_boxes, out=None, dtype=np.float64, chunk_size=None):
+    if _cython_bbox_overlaps is None:
+        raise ImportError("The cython IoU backend requires the cython_bbox package")
+    overlaps = _cython_bbox_overlaps(_as_boxes(boxes, np.float64), _as_boxes(query_boxes, np.float64))
+    if out is None:
+        return overlaps if dtype == np.float64 else overlaps.astype(dtype)
+    out[...] = overlaps
+    return out
+
+
+def overlaps_numpy(boxes, query_boxes, out=None, dtype=np.float64, chunk_size=None):
+    """
+    :param out: (N, K) array written in place, of `dtype`
+    :param dtype: np.float64, or np.float32 to compute in single precision without float64 copies
+    :param chunk_size: rows of `boxes` per chunk, bounding the temporaries to (chunk_size, K)
+    """
+    dtype = np.dtype(dtype).type
+    boxes = np.asarray(boxes, dtype=dtype).reshape(-1, 4)
+    query_boxes = np.asarray(query_boxes, dtype=dtype).reshape(-1, 4)
+    if out is None:
+        out = np.empty((len(boxes), len(query_boxes)), dtype=dtype)
+    if out.size == 0:
+        return out
+    if chunk_size is None:
+        chunk_size = max(CHUNK_ELEMENTS // len(query_boxes), 1)
+
+    one = dtype(1)
+    areas = (boxes[:, 2] - boxes[:, 0] + one) * (boxes[:, 3] - boxes[:, 1] + one)
+    query_areas = (query_boxes[:, 2] - query_boxes[:, 0] + one) * (query_boxes[:, 3] - query_boxes[:, 1] + one)
+    tmp = np.empty((min(chunk_size, len(boxes)), len(query_boxes)), dtype=dtype)
+    tmp2 = np.empty_like(tmp)
+    for start in range(0, len(boxes), chunk_size):
+        chunk = boxes[start:start + chunk_size]
+        o, t, t2 = out[start:start + len(chunk)], tmp[:len(chunk)], tmp2[:len(chunk)]
+        # Same operations as bbox_overlaps: iw = min(x2) - max(x1) + 1, ih likewise
+        np.minimum(chunk[:, 2:3], query_boxes[:, 2], out=o)
+        np.maximum(chunk[:, 0:1], query_boxes[:, 0], out=t)
+        o -= t
+        o += one
+        np.maximum(o, 0, out=o)
+        np.minimum(chunk[:, 3:4], query_boxes[:, 3], out=t)
+        np.maximum(chunk[:, 1:2], query_boxes[:, 1], out=t2)
+        t -= t2
+        t += one
+        np.maximum(t, 0, out=t)
+        o *= t
+        # union = area + query area - intersection, only divided where the boxes intersect
+        np.add(areas[start:start + len(chunk), None], query_areas, out=t)
+        t -= o
+        np.divide(o, t, out=o, where=o > 0)
+    return out
+
+
+_numba_kernel = None
+
+
+def _compile_numba_kernel():
+    @numba.njit(cache=True, nogil=True)
+    def kernel(boxes, query_boxes, out):
+        for k in range(query_boxes.shape[0]):
+            box_area = (query_boxes[k, 2] - query_boxes[k, 0] + 1) * (query_boxes[k, 3] - query_boxes[k, 1] + 1)
+            for n in range(boxes.shape[0]):
+                out[n, k] = 0
+                iw = min(boxes[n, 2], query_boxes[k, 2]) - max(boxes[n, 0], query_boxes[k, 0]) + 1
+                if iw > 0:
+                    ih = min(boxes[n, 3], query_boxes[k, 3]) - max(boxes[n, 1], query_boxes[k, 1]) + 1
+                    if ih > 0:
+                        ua = (boxes[n, 2] - boxes[n, 0] + 1) * (boxes[n, 3] - boxes[n, 1] + 1) + box_area - iw * ih
+                        out[n, k] = iw * ih / ua
+    return kernel
+
+
+def overlaps_numba(boxes, query_boxes, out=None, dtype=np.float64, chunk_size=None):
+    global _numba_kernel
+    if numba is None:
+        raise ImportError("The numba IoU backend requires the numba package")
+    if _numba_kernel is None:
+        _numba_kernel = _compile_numba_kernel()
+    boxes = _as_boxes(boxes, dtype)
+    query_boxes = _as_boxes(query_boxes, dtype)
+    if out is None:
+        out = np.empty((len(boxes), len(query_boxes)), dtype=dtype)
+    _numba_kernel(boxes, query_boxes, out)
+    return out
+
+
+BACKENDS = {
+    'cython': overlaps_cython,
+    'numpy': overlaps_numpy,
+    'numba': overlaps_numba,
+}
+
+_default_backend = 'cython' if _cython_bbox_overlaps is not None else 'numpy'
+
+
+def available_backends():
+    return [name for name, missing in (('cython', _cython_bbox_overlaps is None), ('numpy', False),
+                                       ('numba', numba is None)) if not missing]
+
+
+def get_default_backend():
+    return _default_backend
+
+
+def set_default_backend(backend):
+    """Select the backend used when `bbox_overlaps` is called without one."""
+    global _default_backend
+    if backend not in BACKENDS:
+        raise ValueError("Unknown IoU backend {}, expected one of {}".format(backend, sorted(BACKENDS)))
+    if backend not in available_backends():
+        raise ImportError("The {} IoU backend is not installed".format(backend))
+    _default_backend = backend
+
+
+def bbox_overlaps(boxes, query_boxes, out=None, dtype=np.float64, backend=None, chunk_size=None):
+    """
+    IoU of every box of `boxes` with every box of `query_boxes`
+    :type boxes: list[tlbr] | np.ndarray
+    :type query_boxes: list[tlbr] | np.ndarray
+    :param out: optional (N, K) output array of `dtype`, reused across calls
+    :param dtype: np.float64 or np.float32 computation and output type
+    :param backend: name in `BACKENDS`, the default one if None
+
+    :rtype (N, K) np.ndarray
+    """
+    backend = _default_backend if backend is None else backend
+    return BACKENDS[backend](boxes, query_boxes, out=out, dtype=dtype, chunk_size=chunk_size)
+
+
+_numba_fused_kernel = None
+
+
+def _compile_numba_fused_kernel():
+    @numba.njit(cache=True, nogil=True)
+    def kernel(boxes, query_boxes, scores, thresh, gated_cost, out):
+        for k in range(query_boxes.shape[0]):
+            box_area = (query_boxes[k, 2] - query_boxes[k, 0] + 1) * (query_boxes[k, 3] - query_boxes[k, 1] + 1)
+            for n in range(boxes.shape[0]):
+                sim = 0.
+                iw = min(boxes[n, 2], query_boxes[k, 2]) - max(boxes[n, 0], query_boxes[k, 0]) + 1
+                if iw > 0:
+                    ih = min(boxes[n, 3], query_boxes[k, 3]) - max(boxes[n, 1], query_boxes[k, 1]) + 1
+                    if ih > 0:
+                        ua = (boxes[n, 2] - boxes[n, 0] + 1) * (boxes[n, 3] - boxes[n, 1] + 1) + box_area - iw * ih
+                        sim = iw * ih / ua * scores[k]
+                cost = 1 - sim
+                out[n, k] = gated_cost if cost > thresh else cost
+    return kernel
+
+
+def fused_cost(boxes, query_boxes, scores=None, thresh=None, out=None, dtype=np.float64, backend=None):
+    """
+    Association cost `1 - IoU * score` of every box of `boxes` with every box of
+    `query_boxes`, computed in `out` without temporaries of the full matrix size
+    :param scores: (K,) scores of `query_boxes` as in `matching.fuse_score`, None for `1 - IoU`
+    :param thresh: costs above it are written as `thresh + 1`, like the pairs gated out by
+        `assignment.solve_sparse`, so that no solver matches them. None to keep the costs
+    :param out: optional (N, K) output array of `dtype`, reused across calls
+    :param backend: name in `BACKENDS`, the default one if None. The numba backend fuses
+        the three steps in a single loop, the others compute the IoU then fuse it in place
+
+    :rtype (N, K) np.ndarray
+    """
+    global _numba_fused_kernel
+    backend = _default_backend if backend is None else backend
+    dtype = np.dtype(dtype).type
+    if backend == 'numba':
+        if numba is None:
+            raise ImportError("The numba IoU backend requires the numba package")
+        if _numba_fused_kernel is None:
+            _numba_fused_kernel = _compile_numba_fused_kernel()
+        boxes = _as_boxes(boxes, dtype)
+        query_boxes = _as_boxes(query_boxes, dtype)
+        if out is None:
+            out = np.empty((len(boxes), len(query_boxes)), dtype=dtype)
+        scores = np.ones(len(query_boxes), dtype=dtype) if scores is None else np.asarray(scores, dtype=dtype)
+        thresh = np.inf if thresh is None else thresh
+        _numba_fused_kernel(boxes, query_boxes, scores, dtype(thresh), dtype(thresh + 1), out)
+        return out
+
+    out = bbox_overlaps(boxes, query_boxes, out=out, dtype=dtype, backend=backend)
+    if scores is not None:
+        out *= np.asarray(scores, dtype=dtype)
+    np.subtract(1, out, out=out)
+    if thresh is not None:
+        np.copyto(out, dtype(thresh + 1), where=out > thresh)
+    return out
+
+
+def random_boxes(count, rng, size=1920.):
+    tl = rng.uniform(0, size, (count, 2))
+    return np.hstack([tl, tl + rng.uniform(5, size / 10, (count, 2))])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check the IoU backends against cython_bbox and time them")
+    parser.add_argument("--boxes", type=int, default=500, help="boxes per set")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    boxes, query_boxes = random_boxes(args.boxes, rng), random_boxes(args.boxes, rng)
+    reference = bbox_overlaps(boxes, query_boxes, backend='cython') if _cython_bbox_overlaps is not None else None
+    print("{:<8} {:<8} {:>10} {:>14}".format("backend", "dtype", "ms/call", "max abs diff"))
+    for backend in available_backends():
+        for dtype in (np.float64, np.float32):
+            out = np.empty((args.boxes, args.boxes), dtype=dtype)
+            bbox_overlaps(boxes, query_boxes, out=out, dtype=dtype, backend=backend)
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                bbox_overlaps(boxes, query_boxes, out=out, dtype=dtype, backend=backend)
+            seconds = (time.perf_counter() - start) / args.repeat
+            diff = "-" if reference is None else "{:.3g}".format(np.abs(out - reference).max())
+            print("{:<8} {:<8} {:>10.3f} {:>14}".format(backend, np.dtype(dtype).name, seconds * 1e3, diff))
+
+    # Association cost with fused scores and gating, against the IoU then the separate steps
+    scores = rng.uniform(0.1, 1, args.boxes)
+    print("{:<8} {:<8} {:>10} {:>10}".format("backend", "dtype", "fused ms", "steps ms"))
+    for backend in available_backends():
+        for dtype in (np.float64, np.float32):
+            out = np.empty((args.boxes, args.boxes), dtype=dtype)
+            timings = []
+            for fused in (True, False):
+                start = time.perf_counter()
+                for _ in range(args.repeat):
+                    if fused:
+                        fused_cost(boxes, query_boxes, scores, 0.8, out=out, dtype=dtype, backend=backend)
+                    else:
+                        cost = 1 - (1 - (1 - bbox_overlaps(boxes, query_boxes, dtype=dtype, backend=backend))) * scores
+                        cost[cost > 0.8] = 1.8
+                timings.append((time.perf_counter() - start) / args.repeat * 1e3)
+            print("{:<8} {:<8} {:>10.3f} {:>10.3f}".format(backend, np.dtype(dtype).name, *timings))
+
+
+if __name__ == "__main__":
+    main()
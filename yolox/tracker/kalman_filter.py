@@ -20,6 +20,57 @@ chi2inv95 = {
     9: 16.919}
 
 
+def symmetrize(covariance):
+    """Average covariance matrices (..., N, N) with their transpose, in place, to
+    undo the asymmetry rounding errors accumulate in low precision."""
+    covariance += np.swapaxes(covariance, -1, -2)
+    covariance *= 0.5
+    return covariance
+
+
+def _jittered(factorize, matrix, max_tries):
+    # Retry with a growing diagonal jitter, relative to the mean diagonal, when the
+    # matrix is not numerically positive definite, as float32 covariances can be
+    try:
+        return factorize(matrix)
+    except np.linalg.LinAlgError:
+        error = None
+    diagonal = np.diagonal(matrix, axis1=-2, axis2=-1)
+    jitter = 10 * np.finfo(matrix.dtype).eps * np.abs(diagonal).mean(axis=-1)[..., np.newaxis]
+    eye = np.eye(matrix.shape[-1], dtype=matrix.dtype)
+    for _ in range(max_tries):
+        try:
+            return factorize(matrix + jitter[..., np.newaxis] * eye)
+        except np.linalg.LinAlgError as e:
+            error = e
+            jitter = jitter * 10
+    raise error
+
+
+def cholesky(matrix, max_tries=6):
+    """`np.linalg.cholesky` of one or a stack of matrices, with a jitter fallback."""
+    return _jittered(np.linalg.cholesky, matrix, max_tries)
+
+
+def cho_factor(matrix, max_tries=6):
+    """Lower `scipy.linalg.cho_factor` of a matrix, with a jitter fallback."""
+    return _jittered(lambda m: scipy.linalg.cho_factor(m, lower=True, check_finite=False), matrix, max_tries)
+
+
+def squared_mahalanobis(mean, covariance, measurements):
+    """Squared Mahalanobis distances of measurements to a stack of distributions.
+
+    :param mean: (N, D) means
+    :param covariance: (N, D, D) covariances, factorized in one stacked Cholesky call
+    :param measurements: (M, D) measurements
+    :return: (N, M) distances
+    """
+    cholesky_factor = cholesky(covariance)
+    d = measurements[np.newaxis, :, :] - mean[:, np.newaxis, :]
+    z = np.linalg.solve(cholesky_factor, d.transpose((0, 2, 1)))
+    return np.sum(z * z, axis=1)
+
+
 class KalmanFilter(object):
     """
     A simple Kalman filter for tracking bounding boxes in image space.
@@ -35,16 +86,22 @@ class KalmanFilter(object):
     (x, y, a, h) is taken as direct observation of the state space (linear
     observation model).
 
+    States are computed and stored in `dtype`. In float32, which halves the
+    memory of the states, updated covariances are symmetrized and Cholesky
+    factorizations fall back on a jittered diagonal.
+
     """
 
-    def __init__(self):
+    def __init__(self, dtype=np.float64):
         ndim, dt = 4, 1.
+        self.dtype = np.dtype(dtype)
+        self._symmetrize = self.dtype != np.float64
 
         # Create Kalman filter model matrices.
-        self._motion_mat = np.eye(2 * ndim, 2 * ndim)
+        self._motion_mat = np.eye(2 * ndim, 2 * ndim, dtype=self.dtype)
         for i in range(ndim):
             self._motion_mat[i, ndim + i] = dt
-        self._update_mat = np.eye(ndim, 2 * ndim)
+        self._update_mat = np.eye(ndim, 2 * ndim, dtype=self.dtype)
 
         # Motion and observation uncertainty are chosen relative to the current
         # state estimate. These weights control the amount of uncertainty in
@@ -71,7 +128,7 @@ class KalmanFilter(object):
         """
         mean_pos = measurement
         mean_vel = np.zeros_like(mean_pos)
-        mean = np.r_[mean_pos, mean_vel]
+        mean = np.r_[mean_pos, mean_vel].astype(self.dtype)
 
         std = [
             2 * self._std_weight_position * measurement[3],
@@ -82,7 +139,41 @@ class KalmanFilter(object):
             10 * self._std_weight_velocity * measurement[3],
             1e-5,
             10 * self._std_weight_velocity * measurement[3]]
-        covariance = np.diag(np.square(std))
+        covariance = np.diag(np.square(np.asarray(std, dtype=self.dtype)))
+        return mean, covariance
+
+    def multi_initiate(self, measurement):
+        """Create tracks from unassociated measurements (Vectorized version).
+        Parameters
+        ----------
+        measurement : ndarray
+            The Nx4 dimensional matrix of bounding box coordinates (x, y, a, h)
+            with center position (x, y), aspect ratio a, and height h.
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the Nx8 dimensional mean matrix and Nx8x8 dimensional
+            covariance matrices of the new tracks. Unobserved velocities are
+            initialized to 0 mean.
+        """
+        mean = np.zeros((len(measurement), 8), dtype=self.dtype)
+        mean[:, :4] = measurement
+
+        height = measurement[:, 3]
+        std = [
+            2 * self._std_weight_position * height,
+            2 * self._std_weight_position * height,
+            1e-2 * np.ones_like(height),
+            2 * self._std_weight_position * height,
+            10 * self._std_weight_velocity * height,
+            10 * self._std_weight_velocity * height,
+            1e-5 * np.ones_like(height),
+            10 * self._std_weight_velocity * height]
+        sqr = np.square(np.asarray(std)).T
+
+        covariance = np.zeros((len(measurement), 8, 8), dtype=self.dtype)
+        diag = np.arange(8)
+        covariance[:, diag, diag] = sqr
         return mean, covariance
 
     def predict(self, mean, covariance):
@@ -114,7 +205,7 @@ class KalmanFilter(object):
             self._std_weight_velocity * mean[3],
             1e-5,
             self._std_weight_velocity * mean[3]]
-        motion_cov = np.diag(np.square(np.r_[std_pos, std_vel]))
+        motion_cov = np.diag(np.square(np.asarray(np.r_[std_pos, std_vel], dtype=self.dtype)))
 
         #mean = np.dot(self._motion_mat, mean)
         mean = np.dot(mean, self._motion_mat.T)
@@ -145,14 +236,14 @@ class KalmanFilter(object):
             self._std_weight_position * mean[3],
             1e-1,
             self._std_weight_position * mean[3]]
-        innovation_cov = np.diag(np.square(std))
+        innovation_cov = np.diag(np.square(np.asarray(std, dtype=self.dtype)))
 
         mean = np.dot(self._update_mat, mean)
         covariance = np.linalg.multi_dot((
             self._update_mat, covariance, self._update_mat.T))
         return mean, covariance + innovation_cov
 
-    def multi_predict(self, mean, covariance):
+    def multi_predict(self, mean, covariance, out=None):
         """Run Kalman filter prediction step (Vectorized version).
         Parameters
         ----------
@@ -162,34 +253,111 @@ class KalmanFilter(object):
         covariance : ndarray
             The Nx8x8 dimensional covariance matrics of the object states at the
             previous time step.
+        out : Optional[(ndarray, ndarray)]
+            Preallocated Nx8 and Nx8x8 arrays receiving the predicted state.
+            They may be `mean` and `covariance` themselves to predict in place.
         Returns
         -------
         (ndarray, ndarray)
             Returns the mean vector and covariance matrix of the predicted
             state. Unobserved velocities are initialized to 0 mean.
         """
-        std_pos = [
+        # Computed before the mean is predicted, which may happen in place
+        std_pos = np.square(self._std_weight_position * mean[:, 3])
+        std_vel = np.square(self._std_weight_velocity * mean[:, 3])
+
+        if out is None:
+            new_mean, new_covariance = mean.copy(), covariance.copy()
+        else:
+            new_mean, new_covariance = out
+            if new_mean is not mean:
+                new_mean[...] = mean
+            if new_covariance is not covariance:
+                new_covariance[...] = covariance
+
+        # The motion matrix is [[I, dt I], [0, I]], so with the covariance in
+        # 4x4 blocks [[A, B], [C, D]], F P F^T is
+        # [[A + dt (B + C) + dt^2 D, B + dt D], [C + dt D, D]].
+        dt = self._motion_mat[0, 4]
+        new_mean[:, :4] += dt * new_mean[:, 4:]
+        a = new_covariance[:, :4, :4]
+        b = new_covariance[:, :4, 4:]
+        c = new_covariance[:, 4:, :4]
+        d = new_covariance[:, 4:, 4:]
+        a += dt * (b + c)
+        a += dt * dt * d
+        b += dt * d
+        c += dt * d
+
+        # Diagonal motion noise
+        position = [0, 1, 3]
+        velocity = [4, 5, 7]
+        new_covariance[:, position, position] += std_pos[:, np.newaxis]
+        new_covariance[:, 2, 2] += np.square(1e-2)
+        new_covariance[:, velocity, velocity] += std_vel[:, np.newaxis]
+        new_covariance[:, 6, 6] += np.square(1e-5)
+
+        return new_mean, new_covariance
+
+    def multi_project(self, mean, covariance):
+        """Project state distributions to measurement space (Vectorized version).
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the object states.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the object states.
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the Nx4 projected means and Nx4x4 projected covariance
+            matrices of the given state estimates.
+        """
+        std = [
             self._std_weight_position * mean[:, 3],
             self._std_weight_position * mean[:, 3],
-            1e-2 * np.ones_like(mean[:, 3]),
+            1e-1 * np.ones_like(mean[:, 3]),
             self._std_weight_position * mean[:, 3]]
-        std_vel = [
-            self._std_weight_velocity * mean[:, 3],
-            self._std_weight_velocity * mean[:, 3],
-            1e-5 * np.ones_like(mean[:, 3]),
-            self._std_weight_velocity * mean[:, 3]]
-        sqr = np.square(np.r_[std_pos, std_vel]).T
+        sqr = np.square(np.asarray(std)).T
 
-        motion_cov = []
-        for i in range(len(mean)):
-            motion_cov.append(np.diag(sqr[i]))
-        motion_cov = np.asarray(motion_cov)
+        mean = np.dot(mean, self._update_mat.T)
+        covariance = np.matmul(np.matmul(self._update_mat, covariance), self._update_mat.T)
+        diag = np.arange(4)
+        covariance[:, diag, diag] += sqr
+        return mean, covariance
 
-        mean = np.dot(mean, self._motion_mat.T)
-        left = np.dot(self._motion_mat, covariance).transpose((1, 0, 2))
-        covariance = np.dot(left, self._motion_mat.T) + motion_cov
+    def multi_update(self, mean, covariance, measurement):
+        """Run Kalman filter correction step (Vectorized version).
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the predicted states.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the predicted states.
+        measurement : ndarray
+            The Nx4 dimensional matrix of measurements (x, y, a, h), one row
+            per state.
+        Returns
+        -------
+        (ndarray, ndarray)
+            Returns the measurement-corrected state distributions.
+        """
+        projected_mean, projected_cov = self.multi_project(mean, covariance)
+        measurement = np.asarray(measurement, dtype=self.dtype)
+
+        # Solve the 4x4 innovation systems of all tracks in one stacked call
+        # instead of one cho_factor/cho_solve pair per track.
+        cross_cov = np.matmul(covariance, self._update_mat.T)
+        kalman_gain = np.linalg.solve(
+            projected_cov, cross_cov.transpose((0, 2, 1))).transpose((0, 2, 1))
+        innovation = measurement - projected_mean
 
-        return mean, covariance
+        new_mean = mean + np.einsum('nij,nj->ni', kalman_gain, innovation)
+        new_covariance = covariance - np.matmul(
+            np.matmul(kalman_gain, projected_cov), kalman_gain.transpose((0, 2, 1)))
+        if self._symmetrize:
+            symmetrize(new_covariance)
+        return new_mean, new_covariance
 
     def update(self, mean, covariance, measurement):
         """Run Kalman filter correction step.
@@ -213,16 +381,17 @@ class KalmanFilter(object):
         """
         projected_mean, projected_cov = self.project(mean, covariance)
 
-        chol_factor, lower = scipy.linalg.cho_factor(
-            projected_cov, lower=True, check_finite=False)
+        chol_factor, lower = cho_factor(projected_cov)
         kalman_gain = scipy.linalg.cho_solve(
             (chol_factor, lower), np.dot(covariance, self._update_mat.T).T,
             check_finite=False).T
-        innovation = measurement - projected_mean
+        innovation = np.asarray(measurement, dtype=self.dtype) - projected_mean
 
         new_mean = mean + np.dot(innovation, kalman_gain.T)
         new_covariance = covariance - np.linalg.multi_dot((
             kalman_gain, projected_cov, kalman_gain.T))
+        if self._symmetrize:
+            symmetrize(new_covariance)
         return new_mean, new_covariance
 
     def gating_distance(self, mean, covariance, measurements,
@@ -256,15 +425,56 @@ class KalmanFilter(object):
             mean, covariance = mean[:2], covariance[:2, :2]
             measurements = measurements[:, :2]
 
-        d = measurements - mean
+        d = np.asarray(measurements, dtype=self.dtype) - mean
         if metric == 'gaussian':
             return np.sum(d * d, axis=1)
         elif metric == 'maha':
-            cholesky_factor = np.linalg.cholesky(covariance)
+            cholesky_factor = cholesky(covariance)
             z = scipy.linalg.solve_triangular(
                 cholesky_factor, d.T, lower=True, check_finite=False,
                 overwrite_b=True)
             squared_maha = np.sum(z * z, axis=0)
             return squared_maha
         else:
-            raise ValueError('invalid distance metric')
\ No newline at end of file
+            raise ValueError('invalid distance metric')
+
+    def multi_gating_distance(self, mean, covariance, measurements,
+                              only_position=False, metric='maha'):
+        """Compute gating distances between many state distributions and
+        measurements (Vectorized version). All the innovation covariances are
+        factorized in one stacked call.
+        Parameters
+        ----------
+        mean : ndarray
+            The Nx8 dimensional mean matrix of the state distributions.
+        covariance : ndarray
+            The Nx8x8 dimensional covariance matrices of the state distributions.
+        measurements : ndarray
+            An Mx4 dimensional matrix of M measurements, each in
+            format (x, y, a, h) where (x, y) is the bounding box center
+            position, a the aspect ratio, and h the height.
+        only_position : Optional[bool]
+            If True, distance computation is done with respect to the bounding
+            box center position only.
+        metric : str
+            'maha' for the squared Mahalanobis distance, 'gaussian' for the
+            squared Euclidean distance.
+        Returns
+        -------
+        ndarray
+            Returns an NxM array, whose row i is the `gating_distance` of the
+            i-th state distribution to the measurements.
+        """
+        mean, covariance = self.multi_project(mean, covariance)
+        measurements = np.asarray(measurements, dtype=self.dtype)
+        if only_position:
+            mean, covariance = mean[:, :2], covariance[:, :2, :2]
+            measurements = measurements[:, :2]
+
+        if metric == 'gaussian':
+            d = measurements[np.newaxis, :, :] - mean[:, np.newaxis, :]
+            return np.sum(d * d, axis=2)
+        elif metric == 'maha':
+            return squared_mahalanobis(mean, covariance, measurements)
+        else:
+            raise ValueError('invalid distance metric')
@@ -1,11 +1,9 @@
-import cv2
 import numpy as np
 import scipy
-import lap
+import scipy.sparse
 from scipy.spatial.distance import cdist
 
-from cython_bbox import bbox_overlaps as bbox_ious
-from infer_bytetrack.yolox.tracker import kalman_filter
+from infer_bytetrack.yolox.tracker import assignment, iou, kalman_filter
 import time
 
 def merge_matches(m1, m2, shape):
@@ -36,25 +34,29 @@ def _indices_to_matches(cost_matrix, indices, thresh):
     return matches, unmatched_a, unmatched_b
 
 
-def linear_assignment(cost_matrix, thresh):
-    if cost_matrix.size == 0:
-        return np.empty((0, 2), dtype=int), tuple(range(cost_matrix.shape[0])), tuple(range(cost_matrix.shape[1]))
-    matches, unmatched_a, unmatched_b = [], [], []
-    cost, x, y = lap.lapjv(cost_matrix, extend_cost=True, cost_limit=thresh)
-    for ix, mx in enumerate(x):
-        if mx >= 0:
-            matches.append([ix, mx])
-    unmatched_a = np.where(x < 0)[0]
-    unmatched_b = np.where(y < 0)[0]
-    matches = np.asarray(matches)
-    return matches, unmatched_a, unmatched_b
+def linear_assignment(cost_matrix, thresh, backend=None):
+    """
+    :param backend: name of an `assignment.BACKENDS` solver, `assignment.get_default_backend()` if None
+    """
+    return assignment.solve(cost_matrix, thresh, backend)
 
 
-def ious(atlbrs, btlbrs):
+def as_numpy(output_results):
+    """
+    Detections as a NumPy array. Torch tensors are moved to the CPU through their own
+    methods, so the trackers never import torch themselves.
+    """
+    if hasattr(output_results, 'cpu'):
+        return output_results.cpu().numpy()
+    return np.asarray(output_results)
+
+
+def ious(atlbrs, btlbrs, dtype=np.float64):
     """
     Compute cost based on IoU
     :type atlbrs: list[tlbr] | np.ndarray
     :type atlbrs: list[tlbr] | np.ndarray
+    :param dtype: np.float64 or np.float32 computation and output type
 
     :rtype ious np.ndarray
     """
@@ -62,19 +64,17 @@ def ious(atlbrs, btlbrs):
     if ious.size == 0:
         return ious
 
-    ious = bbox_ious(
-        np.ascontiguousarray(atlbrs, dtype=np.float64),
-        np.ascontiguousarray(btlbrs, dtype=np.float64)
-    )
+    ious = iou.bbox_overlaps(atlbrs, btlbrs, dtype=dtype)
 
     return ious
 
 
-def iou_distance(atracks, btracks):
+def iou_distance(atracks, btracks, dtype=np.float64):
     """
     Compute cost based on IoU
     :type atracks: list[STrack]
     :type btracks: list[STrack]
+    :param dtype: float type of the cost matrix
 
     :rtype cost_matrix np.ndarray
     """
@@ -85,11 +85,139 @@ def iou_distance(atracks, btracks):
     else:
         atlbrs = [track.tlbr for track in atracks]
         btlbrs = [track.tlbr for track in btracks]
-    _ious = ious(atlbrs, btlbrs)
+    _ious = ious(atlbrs, btlbrs, dtype)
     cost_matrix = 1 - _ious
 
     return cost_matrix
 
+class CostBuffer(object):
+    """
+    Memory of the cost matrices of one association step, kept across frames. It only
+    grows, so that a tracker stops allocating cost matrices once its largest frame is seen.
+    """
+
+    def __init__(self, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self._data = np.empty(0, dtype=self.dtype)
+
+    def get(self, shape):
+        """
+        :return: C-contiguous array of `shape` over the buffer, overwritten by the next call
+        """
+        size = shape[0] * shape[1]
+        if size > len(self._data):
+            self._data = np.empty(max(size, 2 * len(self._data)), dtype=self.dtype)
+        return self._data[:size].reshape(shape)
+
+
+def fused_iou_distance(atracks, btracks, scores=None, thresh=None, buffer=None, dtype=np.float64):
+    """
+    `iou_distance` then `fuse_score` in one pass, see `iou.fused_cost`
+    :type atracks: list[STrack] | np.ndarray
+    :type btracks: list[STrack] | np.ndarray
+    :param scores: scores of `btracks` to fuse with the IoU, None for the plain IoU distance
+    :param thresh: costs above the matching threshold are written as `thresh + 1`, None to keep them
+    :param buffer: `CostBuffer` receiving the cost matrix, None to allocate it
+
+    :rtype cost_matrix np.ndarray
+    """
+    if (len(atracks)>0 and isinstance(atracks[0], np.ndarray)) or (len(btracks) > 0 and isinstance(btracks[0], np.ndarray)):
+        atlbrs = atracks
+        btlbrs = btracks
+    else:
+        atlbrs = [track.tlbr for track in atracks]
+        btlbrs = [track.tlbr for track in btracks]
+    out = None if buffer is None else buffer.get((len(atlbrs), len(btlbrs)))
+    return iou.fused_cost(atlbrs, btlbrs, scores, thresh, out=out, dtype=dtype)
+
+
+def _grid_cells(tlbrs, cell_size):
+    """List the cells of a uniform grid covered by each box, as (cell x, cell y, box index)."""
+    # Boxes are widened by one pixel like in bbox_overlaps, which counts inclusive pixels
+    lo = np.floor(tlbrs[:, :2] / cell_size).astype(np.int64)
+    hi = np.floor((tlbrs[:, 2:] + 1) / cell_size).astype(np.int64)
+    extent = np.maximum(hi - lo + 1, 1)
+    counts = extent[:, 0] * extent[:, 1]
+    box_index = np.repeat(np.arange(len(tlbrs)), counts)
+    local = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    width = extent[box_index, 0]
+    return lo[box_index, 0] + local % width, lo[box_index, 1] + local // width, box_index
+
+
+def _pair_ious(atlbrs, btlbrs):
+    """IoU of the boxes of `atlbrs` and `btlbrs` taken pairwise, same formula as bbox_overlaps."""
+    iw = np.minimum(atlbrs[:, 2], btlbrs[:, 2]) - np.maximum(atlbrs[:, 0], btlbrs[:, 0]) + 1
+    ih = np.minimum(atlbrs[:, 3], btlbrs[:, 3]) - np.maximum(atlbrs[:, 1], btlbrs[:, 1]) + 1
+    inter = np.maximum(iw, 0) * np.maximum(ih, 0)
+    area_a = (atlbrs[:, 2] - atlbrs[:, 0] + 1) * (atlbrs[:, 3] - atlbrs[:, 1] + 1)
+    area_b = (btlbrs[:, 2] - btlbrs[:, 0] + 1) * (btlbrs[:, 3] - btlbrs[:, 1] + 1)
+    union = area_a + area_b - inter
+    return np.where(inter > 0, inter / np.where(inter > 0, union, 1), 0.)
+
+
+def iou_pairs(atlbrs, btlbrs, cell_size=None):
+    """
+    Find the overlapping pairs of boxes with a uniform grid instead of a dense IoU matrix
+    :type atlbrs: list[tlbr] | np.ndarray
+    :type btlbrs: list[tlbr] | np.ndarray
+    :param cell_size: grid cell side, twice the median box side by default
+
+    :rtype (rows, cols, ious) np.ndarray, the pairs with a positive IoU
+    """
+    atlbrs = np.asarray(atlbrs, dtype=np.float64).reshape(-1, 4)
+    btlbrs = np.asarray(btlbrs, dtype=np.float64).reshape(-1, 4)
+    if len(atlbrs) == 0 or len(btlbrs) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0)
+    if cell_size is None:
+        sides = np.concatenate([atlbrs[:, 2:] - atlbrs[:, :2], btlbrs[:, 2:] - btlbrs[:, :2]])
+        cell_size = max(2 * float(np.median(sides)), 1.)
+
+    ax, ay, aidx = _grid_cells(atlbrs, cell_size)
+    bx, by, bidx = _grid_cells(btlbrs, cell_size)
+    y_min = min(ay.min(), by.min())
+    y_span = max(ay.max(), by.max()) - y_min + 1
+    akeys = ax * y_span + (ay - y_min)
+    bkeys = bx * y_span + (by - y_min)
+
+    # Pair every cell entry of a box in A with the entries of B in the same cell
+    order = np.argsort(bkeys, kind='stable')
+    bkeys, bidx = bkeys[order], bidx[order]
+    start = np.searchsorted(bkeys, akeys, side='left')
+    counts = np.searchsorted(bkeys, akeys, side='right') - start
+    rows = np.repeat(aidx, counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    cols = bidx[np.repeat(start, counts) + offsets]
+
+    # Boxes sharing several cells are paired once per cell
+    pairs = np.unique(rows * len(btlbrs) + cols)
+    rows, cols = pairs // len(btlbrs), pairs % len(btlbrs)
+    _ious = _pair_ious(atlbrs[rows], btlbrs[cols])
+    keep = _ious > 0
+    return rows[keep], cols[keep], _ious[keep]
+
+
+def sparse_iou_distance(atracks, btracks, dtype=np.float64):
+    """
+    Compute cost based on IoU for the overlapping pairs only
+    :type atracks: list[STrack]
+    :type btracks: list[STrack]
+    :param dtype: float type of the cost matrix
+
+    :rtype cost_matrix scipy.sparse.coo_matrix, pairs without overlap are left out
+    """
+
+    if (len(atracks)>0 and isinstance(atracks[0], np.ndarray)) or (len(btracks) > 0 and isinstance(btracks[0], np.ndarray)):
+        atlbrs = atracks
+        btlbrs = btracks
+    else:
+        atlbrs = [track.tlbr for track in atracks]
+        btlbrs = [track.tlbr for track in btracks]
+    rows, cols, _ious = iou_pairs(atlbrs, btlbrs)
+    cost_matrix = scipy.sparse.coo_matrix(((1 - _ious).astype(dtype, copy=False), (rows, cols)),
+                                          shape=(len(atlbrs), len(btlbrs)))
+
+    return cost_matrix
+
 def v_iou_distance(atracks, btracks):
     """
     Compute cost based on IoU
@@ -135,10 +263,10 @@ def gate_cost_matrix(kf, cost_matrix, tracks, detections, only_position=False):
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
     measurements = np.asarray([det.to_xyah() for det in detections])
-    for row, track in enumerate(tracks):
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position)
-        cost_matrix[row, gating_distance > gating_threshold] = np.inf
+    gating_distance = kf.multi_gating_distance(
+        np.asarray([track.mean for track in tracks]), np.asarray([track.covariance for track in tracks]),
+        measurements, only_position)
+    cost_matrix[gating_distance > gating_threshold] = np.inf
     return cost_matrix
 
 
@@ -148,11 +276,11 @@ def fuse_motion(kf, cost_matrix, tracks, detections, only_position=False, lambda
     gating_dim = 2 if only_position else 4
     gating_threshold = kalman_filter.chi2inv95[gating_dim]
     measurements = np.asarray([det.to_xyah() for det in detections])
-    for row, track in enumerate(tracks):
-        gating_distance = kf.gating_distance(
-            track.mean, track.covariance, measurements, only_position, metric='maha')
-        cost_matrix[row, gating_distance > gating_threshold] = np.inf
-        cost_matrix[row] = lambda_ * cost_matrix[row] + (1 - lambda_) * gating_distance
+    gating_distance = kf.multi_gating_distance(
+        np.asarray([track.mean for track in tracks]), np.asarray([track.covariance for track in tracks]),
+        measurements, only_position, metric='maha')
+    cost_matrix[gating_distance > gating_threshold] = np.inf
+    cost_matrix[...] = lambda_ * cost_matrix + (1 - lambda_) * gating_distance
     return cost_matrix
 
 
@@ -170,11 +298,24 @@ def fuse_iou(cost_matrix, tracks, detections):
     return fuse_cost
 
 
+def _det_scores(detections, dtype):
+    if isinstance(detections, np.ndarray):
+        return detections.astype(dtype, copy=False)
+    return np.array([det.score for det in detections], dtype=dtype)
+
+
 def fuse_score(cost_matrix, detections):
+    """
+    :param detections: list[STrack], or the array of their scores
+    """
+    if scipy.sparse.issparse(cost_matrix):
+        det_scores = _det_scores(detections, cost_matrix.dtype)
+        fuse_cost = 1 - (1 - cost_matrix.data) * det_scores[cost_matrix.col]
+        return scipy.sparse.coo_matrix((fuse_cost, (cost_matrix.row, cost_matrix.col)), shape=cost_matrix.shape)
     if cost_matrix.size == 0:
         return cost_matrix
     iou_sim = 1 - cost_matrix
-    det_scores = np.array([det.score for det in detections])
+    det_scores = _det_scores(detections, cost_matrix.dtype)
     det_scores = np.expand_dims(det_scores, axis=0).repeat(cost_matrix.shape[0], axis=0)
     fuse_sim = iou_sim * det_scores
     fuse_cost = 1 - fuse_sim
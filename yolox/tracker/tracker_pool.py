@@ -0,0 +1,112 @@
+import time
+from collections import OrderedDict
+
+
+class TrackerPool(object):
+    """
+    Stream-keyed pool of isolated trackers.
+
+    Each stream id gets its own tracker, created on first use with
+    `tracker_factory()`, so one process can serve many video feeds. Streams
+    that were not updated for `idle_timeout` seconds are evicted.
+
+    Track ids are namespaced per stream: every stream receives a namespace
+    index when it is created and `namespaced_id` maps a tracker id to
+    `namespace * id_stride + track_id`, which stays unique across streams.
+    """
+
+    def __init__(self, tracker_factory, idle_timeout=60., id_stride=1000000, clock=time.monotonic):
+        self.tracker_factory = tracker_factory
+        self.idle_timeout = idle_timeout
+        self.id_stride = id_stride
+        self.clock = clock
+        # stream id -> [tracker, namespace, last update time], least recently updated first
+        self._streams = OrderedDict()
+        self._namespace_count = 0
+
+    def __len__(self):
+        return len(self._streams)
+
+    def __contains__(self, stream_id):
+        return stream_id in self._streams
+
+    def stream_ids(self):
+        return list(self._streams.keys())
+
+    def trackers(self):
+        """Return the trackers of the pool, without refreshing their last update time."""
+        return [entry[0] for entry in self._streams.values()]
+
+    def get(self, stream_id):
+        """Return the tracker of `stream_id`, creating it if needed."""
+        now = self.clock()
+        self.evict_idle(now)
+        entry = self._streams.get(stream_id)
+        if entry is None:
+            entry = [self.tracker_factory(), self._namespace_count, now]
+            self._namespace_count += 1
+            self._streams[stream_id] = entry
+        else:
+            entry[2] = now
+            self._streams.move_to_end(stream_id)
+        return entry[0]
+
+    def namespaced_id(self, stream_id, track_id):
+        return self._streams[stream_id][1] * self.id_stride + track_id
+
+    def update(self, stream_id, output_results, img_info, img_size):
+        """Advance the tracker of `stream_id` by one frame."""
+        return self.get(stream_id).update(output_results, img_info, img_size)
+
+    def update_many(self, frames, executor=None):
+        """Advance many streams in one call.
+
+        :param frames: dict mapping a stream id to its `(output_results, img_info, img_size)`
+            tracker inputs for the current frame.
+        :param executor: optional `concurrent.futures.Executor` (e.g. a thread pool)
+            running the stream updates concurrently. Trackers own their id
+            allocator, so their ids do not depend on the execution order.
+        :return: dict mapping each stream id to its output tracks.
+        """
+        trackers = {stream_id: self.get(stream_id) for stream_id in frames}
+        if executor is None:
+            return {stream_id: trackers[stream_id].update(*inputs) for stream_id, inputs in frames.items()}
+        futures = {stream_id: executor.submit(trackers[stream_id].update, *inputs)
+                   for stream_id, inputs in frames.items()}
+        return {stream_id: future.result() for stream_id, future in futures.items()}
+
+    def coast(self, stream_id):
+        """Advance the tracker of `stream_id` by one frame without detections."""
+        return self.get(stream_id).coast()
+
+    def coast_many(self, stream_ids, executor=None):
+        """Same as `update_many` for frames without detections.
+
+        :return: dict mapping each stream id to its predicted output tracks.
+        """
+        trackers = {stream_id: self.get(stream_id) for stream_id in stream_ids}
+        if executor is None:
+            return {stream_id: tracker.coast() for stream_id, tracker in trackers.items()}
+        futures = {stream_id: executor.submit(tracker.coast) for stream_id, tracker in trackers.items()}
+        return {stream_id: future.result() for stream_id, future in futures.items()}
+
+    def evict_idle(self, now=None):
+        """Drop the streams not updated for more than `idle_timeout` seconds."""
+        if self.idle_timeout is None or self.idle_timeout <= 0:
+            return []
+        if now is None:
+            now = self.clock()
+        evicted = []
+        while self._streams:
+            stream_id, entry = next(iter(self._streams.items()))
+            if now - entry[2] <= self.idle_timeout:
+                break
+            del self._streams[stream_id]
+            evicted.append(stream_id)
+        return evicted
+
+    def remove(self, stream_id):
+        self._streams.pop(stream_id, None)
+
+    def clear(self):
+        self._streams.clear()
@@ -55,57 +55,330 @@ labels={'ped', ...			% 1
 'crowd' ...			% 13
 };
 """
+valid_labels = {1}
+ignore_labels = {2, 7, 8, 12}
+
+
+
+class MOTColumns(object):
+    """
+    Rows of a MOT text file (frame, id, x, y, w, h, score, class, visibility, ...)
+    as typed columns sorted by frame, with a frame index: the rows of frame `f`
+    are `starts[f]:starts[f + 1]`. Rows with less than 7 values or a frame
+    below 1 are dropped, missing class and visibility values are -1.
+    """
+
+    def __init__(self, frames, ids, tlwhs, scores, classes, visibilities):
+        order = np.argsort(frames, kind='stable') if np.any(np.diff(frames) < 0) else slice(None)
+        self.frames = np.asarray(frames, dtype=np.int64)[order]
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.tlwhs = np.asarray(tlwhs, dtype=np.float64).reshape(-1, 4)[order]
+        self.scores = np.asarray(scores, dtype=np.float64)[order]
+        self.classes = np.asarray(classes, dtype=np.int32)[order]
+        self.visibilities = np.asarray(visibilities, dtype=np.float32)[order]
+        last_frame = int(self.frames[-1]) if len(self.frames) else 0
+        self.starts = np.searchsorted(self.frames, np.arange(last_frame + 2))
+
+    def __len__(self):
+        return len(self.frames)
+
+    @property
+    def frame_ids(self):
+        """Frame ids holding at least one row, sorted"""
+        return np.flatnonzero(np.diff(self.starts))
+
+    def frame_slice(self, frame_id):
+        if frame_id < 0 or frame_id + 1 >= len(self.starts):
+            return slice(0, 0)
+        return slice(self.starts[frame_id], self.starts[frame_id + 1])
+
+    def select(self, mask):
+        return MOTColumns(self.frames[mask], self.ids[mask], self.tlwhs[mask], self.scores[mask],
+                          self.classes[mask], self.visibilities[mask])
+
+    def save(self, filename, source=None):
+        np.savez(filename, frames=self.frames, ids=self.ids, tlwhs=self.tlwhs, scores=self.scores,
+                 classes=self.classes, visibilities=self.visibilities, source=np.str_(source or ''))
+
+    @staticmethod
+    def load(filename):
+        with np.load(filename) as data:
+            return MOTColumns(data['frames'], data['ids'], data['tlwhs'], data['scores'],
+                              data['classes'], data['visibilities'])
+
+
+def _file_signature(filename):
+    stat = os.stat(filename)
+    return '{}:{}'.format(stat.st_size, stat.st_mtime_ns)
+
+
+def _parse_mot_values(filename):
+    """(N, 9) float array of the first 9 values of the rows with at least 7, padded with -1"""
+    try:
+        values = np.loadtxt(filename, delimiter=',', ndmin=2, dtype=np.float64)
+    except ValueError:
+        # Rows of different lengths
+        rows = []
+        with open(filename, 'r') as f:
+            for line in f:
+                linelist = line.strip().split(',')
+                if len(linelist) >= 7:
+                    rows.append([float(v) for v in linelist[:9]] + [-1.] * (9 - len(linelist)))
+        return np.asarray(rows, dtype=np.float64).reshape(-1, 9)
+    if values.shape[1] < 7:
+        return np.empty((0, 9))
+    if values.shape[1] < 9:
+        values = np.hstack([values, np.full((len(values), 9 - values.shape[1]), -1.)])
+    return values[:, :9]
+
+
+def read_mot_columns(filename, sidecar=False):
+    """
+    Parse a whole MOT text file at once
+    :param sidecar: also save the columns to `<filename>.npz`, and load them from there while
+        the text file is unchanged. A path may be given instead of True
+    :rtype MOTColumns
+    """
+    if not os.path.isfile(filename) or os.path.getsize(filename) == 0:
+        return MOTColumns(np.empty(0), np.empty(0), np.empty((0, 4)), np.empty(0), np.empty(0), np.empty(0))
+    if sidecar:
+        sidecar = filename + '.npz' if sidecar is True else sidecar
+        signature = _file_signature(filename)
+        if os.path.isfile(sidecar):
+            with np.load(sidecar) as data:
+                fresh = str(data['source']) == signature
+            if fresh:
+                return MOTColumns.load(sidecar)
+
+    values = _parse_mot_values(filename)
+    values = values[values[:, 0] >= 1]
+    columns = MOTColumns(values[:, 0], values[:, 1], values[:, 2:6], values[:, 6], values[:, 7], values[:, 8])
+    if sidecar:
+        try:
+            columns.save(sidecar, source=signature)
+        except OSError:
+            # Read-only dataset, the columns are parsed again next time
+            pass
+    return columns
+
+
+def select_mot_rows(columns, filename, is_gt=False, is_ignore=False):
+    """
+    Keep the rows `read_mot_results` keeps: the pedestrians of MOT16/17 ground truth,
+    or their ignore regions, other files being all ground truth and without ignore regions
+    :type columns: MOTColumns
+    """
+    if not is_gt and not is_ignore:
+        return columns
+    mot_challenge = 'MOT16-' in filename or 'MOT17-' in filename
+    if is_gt:
+        if not mot_challenge:
+            return columns
+        marks = columns.scores.astype(np.int64)
+        return columns.select((marks != 0) & np.isin(columns.classes, list(valid_labels)))
+    if not mot_challenge:
+        return columns.select(np.zeros(len(columns), dtype=bool))
+    return columns.select(np.isin(columns.classes, list(ignore_labels)) | (columns.visibilities < 0))
 
 
 def read_mot_results(filename, is_gt, is_ignore):
-    valid_labels = {1}
-    ignore_labels = {2, 7, 8, 12}
     results_dict = dict()
     if os.path.isfile(filename):
-        with open(filename, 'r') as f:
-            for line in f.readlines():
-                linelist = line.split(',')
-                if len(linelist) < 7:
-                    continue
-                fid = int(linelist[0])
-                if fid < 1:
-                    continue
-                results_dict.setdefault(fid, list())
-
-                box_size = float(linelist[4]) * float(linelist[5])
-
-                if is_gt:
-                    if 'MOT16-' in filename or 'MOT17-' in filename:
-                        label = int(float(linelist[7]))
-                        mark = int(float(linelist[6]))
-                        if mark == 0 or label not in valid_labels:
-                            continue
-                    score = 1
-                elif is_ignore:
-                    if 'MOT16-' in filename or 'MOT17-' in filename:
-                        label = int(float(linelist[7]))
-                        vis_ratio = float(linelist[8])
-                        if label not in ignore_labels and vis_ratio >= 0:
-                            continue
-                    else:
-                        continue
-                    score = 1
-                else:
-                    score = float(linelist[6])
-
-                #if box_size > 7000:
-                #if box_size <= 7000 or box_size >= 15000:
-                #if box_size < 15000:
-                    #continue
-
-                tlwh = tuple(map(float, linelist[2:6]))
-                target_id = int(linelist[1])
-
-                results_dict[fid].append((tlwh, target_id, score))
+        columns = read_mot_columns(filename)
+        # Every frame of the file has an entry, even when all its rows are filtered out
+        results_dict = {int(fid): list() for fid in columns.frame_ids}
+        rows = select_mot_rows(columns, filename, is_gt, is_ignore)
+        scores = [1] * len(rows) if is_gt or is_ignore else rows.scores.tolist()
+        for fid, tlwh, target_id, score in zip(rows.frames.tolist(), rows.tlwhs.tolist(), rows.ids.tolist(),
+                                               scores):
+            results_dict[fid].append((tuple(tlwh), target_id, score))
 
     return results_dict
 
 
+def read_mot_detections(filename):
+    """
+    Read a MOT detection file (frame, id, x, y, w, h, score, ...), e.g. det.txt
+    :rtype dict, frame id -> (N, 5) float array of x1, y1, x2, y2, score
+    """
+    columns = read_mot_columns(filename)
+    dets = np.empty((len(columns), 5))
+    dets[:, :2] = columns.tlwhs[:, :2]
+    dets[:, 2:4] = columns.tlwhs[:, :2] + columns.tlwhs[:, 2:]
+    dets[:, 4] = columns.scores
+    return {int(fid): dets[columns.frame_slice(fid)] for fid in columns.frame_ids}
+
+
+RESULT_DTYPE = np.dtype([('frame', '<i4'), ('id', '<i4'), ('tlwh', '<f4', (4,)), ('score', '<f4')])
+# Rows are buffered in double precision, the precision of the rounding of the text format
+_BUFFER_DTYPE = np.dtype([('frame', '<i8'), ('id', '<i8'), ('tlwh', '<f8', (4,)), ('score', '<f8')])
+
+
+class ResultWriter(object):
+    """
+    Buffered sink of tracking results. Tracks are accumulated in arrays and
+    written in bulk every `buffer_size` rows, either as MOT text lines
+    (frame,id,x,y,w,h,score,-1,-1,-1 with boxes rounded to 0.1 and scores to
+    0.01, like the results of `MOTEvaluator`) or with `binary` as
+    `RESULT_DTYPE` records. Closing a binary file writes its frame and track
+    index to `<filename>.index.npz`, read back by `ResultColumns`.
+    Rows with a negative track id are not written.
+
+    Text values are printed like `round(float(x), 1)` and `round(float(score), 2)`.
+    The old `str.format` writers rounded the NumPy scalars of the trackers with
+    `np.round`, which can differ next to a tie (1453.45 was written 1453.4, now
+    1453.5), and printed np.float32 scores in full (0.5899999737739563, now 0.59).
+    """
+
+    def __init__(self, filename, binary=False, with_scores=True, buffer_size=65536, append=False):
+        """
+        :param append: add the rows after the ones of an existing file instead of replacing it
+        """
+        path = os.path.dirname(filename)
+        if path and not os.path.exists(path):
+            os.makedirs(path, exist_ok=True)
+        self.filename = filename
+        self.binary = binary
+        self.with_scores = with_scores
+        self.buffer_size = buffer_size
+        self.num_rows = 0
+        self._file = open(filename, ('a' if append else 'w') + ('b' if binary else ''))
+        self._chunks = []
+        self._buffered = 0
+
+    def add(self, frame_id, tlwhs, track_ids, scores=None):
+        """
+        :param tlwhs: (N, 4) boxes of the tracks of the frame
+        :param scores: N scores, written as -1 when None
+        """
+        track_ids = np.asarray(track_ids, dtype=np.int64).reshape(-1)
+        if len(track_ids) == 0:
+            return
+        chunk = np.empty(len(track_ids), dtype=_BUFFER_DTYPE)
+        chunk['frame'] = frame_id
+        chunk['id'] = track_ids
+        chunk['tlwh'] = np.asarray(tlwhs, dtype=np.float64).reshape(-1, 4)
+        chunk['score'] = -1 if scores is None else np.asarray(scores, dtype=np.float64).reshape(-1)
+        chunk = chunk[track_ids >= 0]
+        self._chunks.append(chunk)
+        self._buffered += len(chunk)
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows, for readers of the file to see them"""
+        if not self._chunks:
+            return
+        records = np.concatenate(self._chunks)
+        self._chunks = []
+        self._buffered = 0
+        if self.binary:
+            self._file.write(records.astype(RESULT_DTYPE).tobytes())
+        else:
+            # One % formatting of the whole buffer. %.1f prints a box value like round(float(x), 1)
+            # (correctly rounded), scores are rounded first for %s to print them like round(float(score), 2)
+            values = np.empty((len(records), 7))
+            values[:, 0] = records['frame']
+            values[:, 1] = records['id']
+            values[:, 2:6] = records['tlwh']
+            if self.with_scores:
+                values[:, 6] = _round(records['score'], 2)
+                line_format = '%d,%d,%.1f,%.1f,%.1f,%.1f,%s,-1,-1,-1\n'
+            else:
+                values = values[:, :6]
+                line_format = '%d,%d,%.1f,%.1f,%.1f,%.1f,-1,-1,-1,-1\n'
+            self._file.write((line_format * len(records)) % tuple(values.ravel().tolist()))
+        self._file.flush()
+        self.num_rows += len(records)
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        if self.binary:
+            records = np.fromfile(self.filename, dtype=RESULT_DTYPE)
+            np.savez(self.filename + '.index.npz', **_result_index(records))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _round(values, decimals):
+    """`round` of every value, np.round only differs from it next to a tie"""
+    rounded = np.round(values, decimals)
+    scaled = values * 10 ** decimals
+    ties = np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6
+    rounded[ties] = [round(value, decimals) for value in values[ties].tolist()]
+    return rounded
+
+
+def _result_index(records):
+    """Rows of the records ordered by frame and by track then frame, with the run start of each value"""
+    frame_rows = np.argsort(records['frame'], kind='stable')
+    frame_ids, frame_starts = np.unique(records['frame'][frame_rows], return_index=True)
+    track_rows = np.lexsort((records['frame'], records['id']))
+    track_ids, track_starts = np.unique(records['id'][track_rows], return_index=True)
+    return dict(num_rows=np.int64(len(records)),
+                frame_rows=frame_rows, frame_ids=frame_ids, frame_starts=np.append(frame_starts, len(records)),
+                track_rows=track_rows, track_ids=track_ids, track_starts=np.append(track_starts, len(records)))
+
+
+class ResultColumns(object):
+    """
+    Random access to the binary results of `ResultWriter`, by frame or by track,
+    through a memory map. The index is rebuilt when the writer was not closed.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        if os.path.getsize(filename) > 0:
+            self.records = np.memmap(filename, dtype=RESULT_DTYPE, mode='r')
+        else:
+            self.records = np.empty(0, dtype=RESULT_DTYPE)
+        index = None
+        index_filename = filename + '.index.npz'
+        if os.path.isfile(index_filename):
+            with np.load(index_filename) as data:
+                index = {key: data[key] for key in data.files}
+            if int(index['num_rows']) != len(self.records):
+                index = None
+        if index is None:
+            index = _result_index(self.records)
+        self._index = index
+        self.frame_ids = index['frame_ids']
+        self.track_ids = index['track_ids']
+
+    def __len__(self):
+        return len(self.records)
+
+    def _rows(self, key, value):
+        ids = self._index[key + '_ids']
+        i = np.searchsorted(ids, value)
+        if i == len(ids) or ids[i] != value:
+            return self.records[:0]
+        starts = self._index[key + '_starts']
+        return self.records[self._index[key + '_rows'][starts[i]:starts[i + 1]]]
+
+    def frame(self, frame_id):
+        """:return: RESULT_DTYPE records of the frame, in writing order"""
+        return self._rows('frame', frame_id)
+
+    def track(self, track_id):
+        """:return: RESULT_DTYPE records of the track, in frame order"""
+        return self._rows('track', track_id)
+
+    def to_columns(self):
+        """:rtype MOTColumns"""
+        records = self.records
+        missing = np.full(len(records), -1)
+        return MOTColumns(records['frame'], records['id'], records['tlwh'], records['score'], missing, missing)
+
+
 def unzip_objs(objs):
     if len(objs) > 0:
         tlwhs, ids, scores = zip(*objs)
@@ -0,0 +1,356 @@
+"""
+CLEAR-MOT and IDF1 metrics of whole sequences, computed with NumPy.
+
+Gives the metrics of `Evaluator` (motmetrics) without building per-frame
+accumulators and pandas event tables. The boxes of a sequence are held as
+arrays sorted by frame, the IoU of every ground truth / result pair of the
+same frame is computed in one pass, and only the frames with a possible match
+go through the CLEAR-MOT correspondence loop:
+
+1. results matching an ignore region (IoU >= 0.5) are dropped,
+2. ground truth objects keep their previous hypothesis when still valid,
+3. the other valid pairs are matched for a maximal number of matches then a
+   minimal distance, and a match changing the hypothesis of an object is an
+   ID switch,
+4. IDF1 matches object and hypothesis ids over the whole sequence.
+
+Ties in step 3 may be broken differently than motmetrics, which only moves the
+metrics by a few events on crowded sequences. Result files are evaluated in a
+process pool with
+
+    python -m infer_bytetrack.yolox.tracking_utils.metrics MOT17/train results --workers 16
+"""
+import argparse
+import glob
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+
+from infer_bytetrack.yolox.tracking_utils.io import read_mot_columns, select_mot_rows
+
+COUNTS = ('num_frames', 'num_objects', 'num_predictions', 'num_matches', 'num_switches',
+          'num_false_positives', 'num_misses', 'idtp', 'idfp', 'idfn')
+RATIOS = ('mota', 'precision', 'recall', 'idp', 'idr', 'idf1')
+
+
+def columns_arrays(columns):
+    """
+    :type columns: MOTColumns
+    :return: (frames, ids, tlwhs) arrays sorted by frame, in file order within a frame
+    """
+    return columns.frames, columns.ids, columns.tlwhs
+
+
+def track_results_arrays(results):
+    """
+    :param results: list of (frame_id, tlwhs, track_ids, ...), e.g. from `offline.track_detections`
+    :return: (frames, ids, tlwhs) arrays, without the frames holding no track
+    """
+    frames = [np.full(len(row[2]), row[0], dtype=np.int64) for row in results]
+    ids = [np.asarray(row[2], dtype=np.int64) for row in results]
+    tlwhs = [np.asarray(row[1], dtype=np.float64).reshape(-1, 4) for row in results]
+    if not results:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty((0, 4))
+    frames, ids, tlwhs = np.concatenate(frames), np.concatenate(ids), np.concatenate(tlwhs)
+    order = np.argsort(frames, kind='stable')
+    return frames[order], ids[order], tlwhs[order]
+
+
+def load_ground_truth(data_root, seq_name, sidecar=False):
+    """
+    :param sidecar: keep the parsed file as `gt.txt.npz`, see `read_mot_columns`
+    :return: (gt, ignore) (frames, ids, tlwhs) arrays of `<data_root>/<seq_name>/gt/gt.txt`
+    """
+    gt_filename = os.path.join(data_root, seq_name, 'gt', 'gt.txt')
+    columns = read_mot_columns(gt_filename, sidecar=sidecar)
+    gt = columns_arrays(select_mot_rows(columns, gt_filename, is_gt=True))
+    ignore = columns_arrays(select_mot_rows(columns, gt_filename, is_ignore=True))
+    return gt, ignore
+
+
+def same_frame_pairs(frames_a, frames_b):
+    """
+    :param frames_a: sorted frame ids of the rows of a
+    :param frames_b: sorted frame ids of the rows of b
+    :return: (ia, ib) indices of every pair of rows of a and b in the same frame, ordered by ia then ib
+    """
+    starts = np.searchsorted(frames_b, frames_a, side='left')
+    counts = np.searchsorted(frames_b, frames_a, side='right') - starts
+    ia = np.repeat(np.arange(len(frames_a)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    ib = np.repeat(starts, counts) + offsets
+    return ia, ib
+
+
+def pair_iou(tlwhs_a, tlwhs_b):
+    """IoU of the boxes of two (N, 4) tlwh arrays, row by row, as `motmetrics.distances.boxiou`."""
+    tl = np.maximum(tlwhs_a[:, :2], tlwhs_b[:, :2])
+    br = np.minimum(tlwhs_a[:, :2] + tlwhs_a[:, 2:], tlwhs_b[:, :2] + tlwhs_b[:, 2:])
+    inter = np.prod(np.maximum(br - tl, 0), axis=1)
+    area_a = np.prod(np.maximum(tlwhs_a[:, 2:], 0), axis=1)
+    area_b = np.prod(np.maximum(tlwhs_b[:, 2:], 0), axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(inter == 0, 0., inter / (area_a + area_b - inter))
+
+
+def max_matching(rows, cols, costs):
+    """
+    Match the valid (row, col) pairs of one frame for the most matches, then the lowest
+    total cost, like `motmetrics.lap.linear_sum_assignment` on a matrix of NaN invalid pairs
+    :return: bool mask of the matched pairs
+    """
+    matched = np.zeros(len(rows), dtype=bool)
+    if len(rows) == 0:
+        return matched
+    ur, ir = np.unique(rows, return_inverse=True)
+    uc, ic = np.unique(cols, return_inverse=True)
+    if len(ur) == len(rows) and len(uc) == len(cols):
+        matched[:] = True
+        return matched
+    # Every valid pair is worth more than any sum of costs, so the cardinality comes first
+    bonus = (np.abs(costs).max() + 1.) * (min(len(ur), len(uc)) + 1)
+    matrix = np.zeros((len(ur), len(uc)))
+    matrix[ir, ic] = costs - bonus
+    pair_index = np.full((len(ur), len(uc)), -1)
+    pair_index[ir, ic] = np.arange(len(rows))
+    x, y = linear_sum_assignment(matrix)
+    chosen = pair_index[x, y]
+    matched[chosen[chosen >= 0]] = True
+    return matched
+
+
+def _frame_slices(frames):
+    """(start, end) of the runs of equal values of the sorted `frames`"""
+    bounds = np.flatnonzero(np.diff(frames)) + 1
+    return zip(np.concatenate([[0], bounds]).tolist(), np.concatenate([bounds, [len(frames)]]).tolist())
+
+
+def _match_frames(frames, rows, cols, costs):
+    """`max_matching` of every frame, the pairs without a competing pair are matched directly"""
+    matched = np.zeros(len(rows), dtype=bool)
+    if len(rows) == 0:
+        return matched
+    single = (np.bincount(rows)[rows] == 1) & (np.bincount(cols)[cols] == 1)
+    matched[single] = True
+    rest = np.flatnonzero(~single)
+    for start, end in _frame_slices(frames[rest]):
+        pairs = rest[start:end]
+        matched[pairs] = max_matching(rows[pairs], cols[pairs], costs[pairs])
+    return matched
+
+
+def _candidate_pairs(frames_a, tlwhs_a, frames_b, tlwhs_b, max_dist):
+    """Same-frame pairs of rows of a and b that may be closer than `max_dist`, ordered by ia then ib"""
+    if max_dist > 0.5 or len(frames_a) == 0 or len(frames_b) == 0:
+        return same_frame_pairs(frames_a, frames_b)
+    # An IoU of 0.5 or more puts the center of each box inside the other one: look for the
+    # centers of b between the left and right sides of a, on a (frame, x) axis
+    centers_b = tlwhs_b[:, 0] + tlwhs_b[:, 2] / 2
+    x_min = min(tlwhs_a[:, 0].min(), centers_b.min()) - 1
+    span = max((tlwhs_a[:, 0] + tlwhs_a[:, 2]).max(), centers_b.max()) - x_min + 2
+    keys_b = frames_b * span + (centers_b - x_min)
+    order = np.argsort(keys_b, kind='stable')
+    offset_a = frames_a * span - x_min
+    starts = np.searchsorted(keys_b[order], offset_a + tlwhs_a[:, 0] - 1, side='left')
+    counts = np.maximum(np.searchsorted(keys_b[order], offset_a + tlwhs_a[:, 0] + tlwhs_a[:, 2] + 1,
+                                        side='right') - starts, 0)
+    ia = np.repeat(np.arange(len(frames_a)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    ib = order[np.repeat(starts, counts) + offsets]
+    pairs = np.lexsort((ib, ia))
+    return ia[pairs], ib[pairs]
+
+
+def _valid_pairs(frames_a, tlwhs_a, frames_b, tlwhs_b, max_dist):
+    """Same-frame pairs of rows of a and b with an IoU distance of at most `max_dist`"""
+    ia, ib = _candidate_pairs(frames_a, tlwhs_a, frames_b, tlwhs_b, max_dist)
+    dist = 1. - pair_iou(tlwhs_a[ia], tlwhs_b[ib])
+    valid = dist <= max_dist
+    return ia[valid], ib[valid], dist[valid]
+
+
+def _correspondences(frames, gt_rows, res_rows, gt_ids, res_ids, dist):
+    """
+    CLEAR-MOT matching of the valid pairs, sorted by frame
+    :return: number of matches and of ID switches
+    """
+    last_match = {}  # object id -> hypothesis id of its last match
+    num_matches = num_switches = 0
+    gt_row_list, res_row_list = gt_rows.tolist(), res_rows.tolist()
+    gt_ids, res_ids = gt_ids.tolist(), res_ids.tolist()
+    for start, end in _frame_slices(frames):
+        taken_gt, taken_res = set(), set()
+        # Objects keep their hypothesis when the pair is still valid
+        for k in range(start, end):
+            if last_match.get(gt_ids[k]) == res_ids[k] and gt_row_list[k] not in taken_gt \
+                    and res_row_list[k] not in taken_res:
+                taken_gt.add(gt_row_list[k])
+                taken_res.add(res_row_list[k])
+                num_matches += 1
+        rest = [k for k in range(start, end)
+                if gt_row_list[k] not in taken_gt and res_row_list[k] not in taken_res]
+        if not rest:
+            continue
+        rest = np.asarray(rest)
+        matched = max_matching(gt_rows[rest], res_rows[rest], dist[rest])
+        for k in rest[matched].tolist():
+            gt_id, res_id = gt_ids[k], res_ids[k]
+            if gt_id in last_match and last_match[gt_id] != res_id:
+                num_switches += 1
+            else:
+                num_matches += 1
+            last_match[gt_id] = res_id
+    return num_matches, num_switches
+
+
+def _id_true_positives(gt_ids, res_ids):
+    """Frames of the best one-to-one matching of object and hypothesis ids, from their valid pairs"""
+    if len(gt_ids) == 0:
+        return 0
+    uo, io = np.unique(gt_ids, return_inverse=True)
+    uh, ih = np.unique(res_ids, return_inverse=True)
+    overlaps = np.bincount(io * len(uh) + ih, minlength=len(uo) * len(uh)).reshape(len(uo), len(uh))
+    x, y = linear_sum_assignment(overlaps, maximize=True)
+    return int(overlaps[x, y].sum())
+
+
+def _num_distinct(frames, ids):
+    if len(frames) == 0:
+        return 0
+    ids = ids - ids.min()
+    return len(np.unique(frames * (int(ids.max()) + 1) + ids))
+
+
+def with_ratios(counts):
+    """
+    :param counts: dict of the `COUNTS` of one sequence or summed over sequences
+    :return: the counts and the `RATIOS` computed from them
+    """
+    c = {name: counts[name] for name in COUNTS}
+    detections = c['num_matches'] + c['num_switches']
+    with np.errstate(divide='ignore', invalid='ignore'):
+        objects, predictions = np.float64(c['num_objects']), np.float64(c['num_predictions'])
+        c['mota'] = float(1. - (c['num_misses'] + c['num_switches'] + c['num_false_positives']) / objects)
+        c['precision'] = float(detections / np.float64(detections + c['num_false_positives']))
+        c['recall'] = float(detections / objects)
+        c['idp'] = float(c['idtp'] / np.float64(c['idtp'] + c['idfp']))
+        c['idr'] = float(c['idtp'] / np.float64(c['idtp'] + c['idfn']))
+        c['idf1'] = float(2 * c['idtp'] / (objects + predictions))
+    return c
+
+
+def clear_mot(gt, results, ignore=None, frames=None, max_dist=0.5):
+    """
+    Metrics of the results of one sequence
+    :param gt: (frames, ids, tlwhs) arrays of the ground truth, sorted by frame
+    :param results: (frames, ids, tlwhs) arrays of the tracks, sorted by frame
+    :param ignore: (frames, ids, tlwhs) arrays of the ignore regions, or None
+    :param frames: evaluated frame ids, the frames of the results if None, as `Evaluator.eval_file`
+    :param max_dist: largest 1 - IoU distance of a match
+    :return: dict of the `COUNTS` and `RATIOS`
+    """
+    res_frames, res_ids, res_tlwhs = results
+    gt_frames, gt_ids, gt_tlwhs = gt
+    if frames is None:
+        frames = np.unique(res_frames)
+    else:
+        frames = np.unique(np.asarray(frames, dtype=np.int64))
+        keep = np.isin(res_frames, frames)
+        res_frames, res_ids, res_tlwhs = res_frames[keep], res_ids[keep], res_tlwhs[keep]
+    keep = np.isin(gt_frames, frames)
+    gt_frames, gt_ids, gt_tlwhs = gt_frames[keep], gt_ids[keep], gt_tlwhs[keep]
+
+    if ignore is not None and len(ignore[0]) > 0:
+        ignore_frames, _, ignore_tlwhs = ignore
+        ii, ir, dist = _valid_pairs(ignore_frames, ignore_tlwhs, res_frames, res_tlwhs, max_dist)
+        keep = np.ones(len(res_frames), dtype=bool)
+        keep[ir[_match_frames(res_frames[ir], ii, ir, dist)]] = False
+        res_frames, res_ids, res_tlwhs = res_frames[keep], res_ids[keep], res_tlwhs[keep]
+
+    ig, ir, dist = _valid_pairs(gt_frames, gt_tlwhs, res_frames, res_tlwhs, max_dist)
+    num_matches, num_switches = _correspondences(gt_frames[ig], ig, ir, gt_ids[ig], res_ids[ir], dist)
+    id_matches = _id_true_positives(gt_ids[ig], res_ids[ir])
+    # motmetrics counts the frames of each id, so that duplicated ids in a frame add up once
+    idfn = _num_distinct(gt_frames, gt_ids) - id_matches
+    idfp = _num_distinct(res_frames, res_ids) - id_matches
+
+    num_objects, num_predictions = len(gt_frames), len(res_frames)
+    detections = num_matches + num_switches
+    return with_ratios(dict(
+        num_frames=len(frames), num_objects=num_objects, num_predictions=num_predictions,
+        num_matches=num_matches, num_switches=num_switches,
+        num_false_positives=num_predictions - detections, num_misses=num_objects - detections,
+        idtp=num_objects - idfn, idfp=idfp, idfn=idfn))
+
+
+def summarize(metrics):
+    """
+    :param metrics: iterable of `clear_mot` dicts
+    :return: metrics of all the sequences together, as the OVERALL row of motmetrics
+    """
+    metrics = list(metrics)
+    return with_ratios({name: sum(m[name] for m in metrics) for name in COUNTS})
+
+
+def evaluate_sequence(data_root, seq_name, result_file, sidecar=False):
+    """
+    :param sidecar: see `load_ground_truth`
+    :return: `clear_mot` metrics of a MOT result file against `<data_root>/<seq_name>/gt/gt.txt`
+    """
+    gt, ignore = load_ground_truth(data_root, seq_name, sidecar=sidecar)
+    results = read_mot_columns(result_file)
+    return clear_mot(gt, columns_arrays(results), ignore, frames=results.frame_ids)
+
+
+def evaluate_sequences(data_root, result_files, workers=None, sidecar=False):
+    """
+    Evaluate many result files in a process pool, one sequence per task
+    :param result_files: dict, sequence name -> MOT result file
+    :param workers: number of processes, all the cores if None, 1 to evaluate in this process
+    :param sidecar: see `load_ground_truth`
+    :return: dict, sequence name -> `clear_mot` metrics
+    """
+    names = list(result_files)
+    if workers == 1:
+        metrics = [evaluate_sequence(data_root, name, result_files[name], sidecar) for name in names]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(evaluate_sequence, data_root, name, result_files[name], sidecar)
+                       for name in names]
+            metrics = [future.result() for future in futures]
+    return dict(zip(names, metrics))
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("CLEAR-MOT and IDF1 metrics of MOT result files")
+    parser.add_argument("data_root", help="folder of the sequences, holding <sequence>/gt/gt.txt")
+    parser.add_argument("results", nargs="+", help="<sequence>.txt result files or folders of them")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, all the cores by default")
+    parser.add_argument("--sidecar", default=False, action="store_true",
+                        help="keep the parsed ground truth next to gt.txt for faster reloads")
+    return parser
+
+
+def main():
+    args = make_parser().parse_args()
+    result_files = []
+    for path in args.results:
+        result_files.extend(sorted(glob.glob(os.path.join(path, '*.txt'))) if os.path.isdir(path) else [path])
+    result_files = {os.path.splitext(os.path.basename(f))[0]: f for f in result_files}
+    result_files = {name: f for name, f in result_files.items()
+                    if os.path.isfile(os.path.join(args.data_root, name, 'gt', 'gt.txt'))}
+
+    metrics = evaluate_sequences(args.data_root, result_files, workers=args.workers, sidecar=args.sidecar)
+    if len(metrics) > 1:
+        metrics['OVERALL'] = summarize(metrics.values())
+    print("{:<16} {:>7} {:>7} {:>7} {:>7} {:>7} {:>7} {:>7}".format(
+        "", "MOTA", "IDF1", "IDP", "IDR", "Prcn", "Rcll", "IDs"))
+    for name, m in metrics.items():
+        print("{:<16} {:>7.1%} {:>7.1%} {:>7.1%} {:>7.1%} {:>7.1%} {:>7.1%} {:>7d}".format(
+            name, m['mota'], m['idf1'], m['idp'], m['idr'], m['precision'], m['recall'], m['num_switches']))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,182 @@
+"""
+Offline tracking of MOT detection files, without detector nor Ikomia runtime.
+
+Each sequence is tracked by its own BYTETracker in a process pool, and its
+tracks are written in the MOT result format of `MOTEvaluator`:
+
+    python -m infer_bytetrack.yolox.tracking_utils.offline MOT17/train -o results --workers 16
+
+Inputs are det.txt files or directories searched for `<sequence>/det/det.txt`
+and `<sequence>.txt` files.
+"""
+import argparse
+import glob
+import os
+import time
+from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from infer_bytetrack.yolox.tracking_utils.io import ResultWriter, read_mot_detections
+
+
+def write_results(filename, results):
+    # Same format as the results of MOTEvaluator
+    with ResultWriter(filename) as writer:
+        for frame_id, tlwhs, track_ids, scores in results:
+            writer.add(frame_id, tlwhs, track_ids, scores)
+
+
+def sequence_name(det_file):
+    """`MOT17-02/det/det.txt` -> `MOT17-02`, `MOT17-02.txt` -> `MOT17-02`"""
+    parent = os.path.dirname(os.path.abspath(det_file))
+    if os.path.basename(det_file) == 'det.txt' and os.path.basename(parent) == 'det':
+        return os.path.basename(os.path.dirname(parent))
+    return os.path.splitext(os.path.basename(det_file))[0]
+
+
+def find_detection_files(inputs):
+    det_files = []
+    for path in inputs:
+        if os.path.isdir(path):
+            found = sorted(glob.glob(os.path.join(path, '*', 'det', 'det.txt')))
+            if not found:
+                found = sorted(glob.glob(os.path.join(path, '*.txt')))
+            det_files.extend(found)
+        else:
+            det_files.append(path)
+    return det_files
+
+
+def create_tracker(track_thresh=0.5, track_buffer=30, match_thresh=0.8, mot20=False, frame_rate=30,
+                   backend='object', sparse_iou=False, dtype=np.float64, **thresholds):
+    """
+    :param dtype: float type of the Kalman states and cost matrices
+    :param thresholds: other tracker args, e.g. `second_match_thresh`, `unconfirmed_match_thresh`
+        or `low_thresh`
+    """
+    # Imported here so that the pool workers load the tracker themselves
+    from infer_bytetrack.yolox.tracker.byte_tracker import BYTETracker
+    from infer_bytetrack.yolox.tracker.array_tracker import ArrayBYTETracker
+
+    args = Namespace(track_thresh=track_thresh, track_buffer=track_buffer, match_thresh=match_thresh, mot20=mot20,
+                     **thresholds)
+    if backend == 'array':
+        return ArrayBYTETracker(args, frame_rate=frame_rate, sparse_iou=sparse_iou, dtype=dtype)
+    return BYTETracker(args, frame_rate=frame_rate, sparse_iou=sparse_iou, dtype=dtype)
+
+
+def track_detections(detections, min_box_area=100, aspect_ratio_thresh=1.6, detector_stride=1, **tracker_kwargs):
+    """
+    Track the detections of one sequence
+    :param detections: dict, frame id -> (N, 5) array of x1, y1, x2, y2, score
+    :param min_box_area: tracks with a smaller box are not kept
+    :param aspect_ratio_thresh: tracks wider than this width / height ratio are not
+        kept, as in `MOTEvaluator` for pedestrians, 0 to keep them all
+    :param detector_stride: only read the detections of one frame every `detector_stride`
+        frames and coast on the Kalman predictions in between, as the Ikomia task does
+    :param tracker_kwargs: `create_tracker` arguments
+    :return: list of (frame_id, tlwhs, track_ids, scores), and the time spent in the tracker
+    """
+    tracker = create_tracker(**tracker_kwargs)
+    last_frame = max(detections) if detections else 0
+    empty = np.empty((0, 5))
+    results = []
+    track_time = 0.
+    # Frames without detection still update the tracker, for lost tracks to age
+    for frame_id in range(1, last_frame + 1):
+        dets = detections.get(frame_id, empty)
+        start = time.perf_counter()
+        # The tracker scales boxes in place
+        if (frame_id - 1) % detector_stride == 0:
+            online_targets = tracker.update(dets.copy(), (1, 1), (1, 1))
+        else:
+            online_targets = tracker.coast()
+        track_time += time.perf_counter() - start
+        online_tlwhs = []
+        online_ids = []
+        online_scores = []
+        for t in online_targets:
+            tlwh = t.tlwh
+            vertical = aspect_ratio_thresh > 0 and tlwh[2] / tlwh[3] > aspect_ratio_thresh
+            if tlwh[2] * tlwh[3] > min_box_area and not vertical:
+                online_tlwhs.append(tlwh)
+                online_ids.append(t.track_id)
+                online_scores.append(t.score)
+        results.append((frame_id, online_tlwhs, online_ids, online_scores))
+    return results, track_time
+
+
+def track_sequence(det_file, result_file, **kwargs):
+    """
+    Track the detections of one sequence and write its result file
+    :param kwargs: `track_detections` arguments
+    :return: number of frames and of written boxes
+    """
+    results, _ = track_detections(read_mot_detections(det_file), **kwargs)
+    write_results(result_file, results)
+    return len(results), sum(len(track_ids) for _, _, track_ids, _ in results)
+
+
+def track_sequences(det_files, result_folder, workers=None, **kwargs):
+    """
+    Track many sequences in a process pool, one sequence per task
+    :param workers: number of processes, all the cores if None, 1 to track in this process
+    :param kwargs: `track_sequence` arguments
+    :return: dict, sequence name -> (result file, number of frames, number of boxes)
+    """
+    result_files = {sequence_name(det_file): os.path.join(result_folder, sequence_name(det_file) + '.txt')
+                    for det_file in det_files}
+    if len(result_files) != len(det_files):
+        raise ValueError("Several detection files map to the same sequence name")
+
+    if workers == 1:
+        stats = [track_sequence(det_file, result_files[sequence_name(det_file)], **kwargs) for det_file in det_files]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(track_sequence, det_file, result_files[sequence_name(det_file)], **kwargs)
+                       for det_file in det_files]
+            stats = [future.result() for future in futures]
+    return {sequence_name(det_file): (result_files[sequence_name(det_file)],) + tuple(seq_stats)
+            for det_file, seq_stats in zip(det_files, stats)}
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("ByteTrack offline tracking of MOT detection files")
+    parser.add_argument("inputs", nargs="+", help="det.txt files or directories of sequences")
+    parser.add_argument("-o", "--output", required=True, help="folder of the result files")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, all the cores by default")
+    parser.add_argument("--track_thresh", type=float, default=0.5, help="tracking confidence threshold")
+    parser.add_argument("--track_buffer", type=int, default=30, help="the frames for keep lost tracks")
+    parser.add_argument("--match_thresh", type=float, default=0.8, help="matching threshold for tracking")
+    parser.add_argument("--mot20", dest="mot20", default=False, action="store_true", help="test mot20.")
+    parser.add_argument("--frame_rate", type=int, default=30)
+    parser.add_argument("--min_box_area", type=float, default=100, help="filter out tiny boxes")
+    parser.add_argument("--aspect_ratio_thresh", type=float, default=1.6,
+                        help="filter out boxes wider than this ratio, 0 to keep them")
+    parser.add_argument("--detector_stride", type=int, default=1,
+                        help="use the detections of one frame every n frames and coast in between")
+    parser.add_argument("--backend", choices=("object", "array"), default="object")
+    parser.add_argument("--sparse_iou", default=False, action="store_true")
+    parser.add_argument("--dtype", choices=("float64", "float32"), default="float64",
+                        help="float type of the Kalman states and cost matrices")
+    return parser
+
+
+def main():
+    args = make_parser().parse_args()
+    det_files = find_detection_files(args.inputs)
+    stats = track_sequences(
+        det_files, args.output, workers=args.workers,
+        min_box_area=args.min_box_area, aspect_ratio_thresh=args.aspect_ratio_thresh,
+        detector_stride=args.detector_stride,
+        track_thresh=args.track_thresh, track_buffer=args.track_buffer, match_thresh=args.match_thresh,
+        mot20=args.mot20, frame_rate=args.frame_rate, backend=args.backend, sparse_iou=args.sparse_iou,
+        dtype=np.dtype(args.dtype))
+    for name, (result_file, num_frames, num_boxes) in stats.items():
+        print("{}: {} frames, {} boxes -> {}".format(name, num_frames, num_boxes, result_file))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Accuracy report of the float32 tracker against the float64 one.
+
+Every sequence is tracked twice from its cached detections, with float64 and
+float32 Kalman states and cost matrices. The report compares the two runs:
+the share of output boxes found with the same track id in the same frame of
+both, the largest deviation between those boxes, MOTA and IDF1 of each run
+when the sequence has ground truth, and the tracking time:
+
+    python -m infer_bytetrack.yolox.tracking_utils.precision MOT17/train --backend array
+
+Detections are found as in `offline.py`, ground truth is
+`<data_root>/<sequence>/gt/gt.txt`.
+"""
+import argparse
+import csv
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from infer_bytetrack.yolox.tracking_utils.io import read_mot_detections
+from infer_bytetrack.yolox.tracking_utils.metrics import clear_mot, load_ground_truth, track_results_arrays
+from infer_bytetrack.yolox.tracking_utils.offline import find_detection_files, sequence_name, track_detections
+
+DTYPES = (np.float64, np.float32)
+COLUMNS = ('sequence', 'boxes_float64', 'boxes_float32', 'same_id', 'max_box_diff',
+           'mota_float64', 'mota_float32', 'idf1_float64', 'idf1_float32', 'time_float64', 'time_float32')
+
+
+def state_bytes(dtype):
+    """Memory of the Kalman state of one track: an 8 mean and an 8x8 covariance."""
+    return (8 + 8 * 8) * np.dtype(dtype).itemsize
+
+
+def compare_results(results, other):
+    """
+    :param results: `track_detections` results of the reference run
+    :param other: `track_detections` results of the same frames in another run
+    :return: share of the boxes of both runs whose (frame, track id) is in both, and the
+        largest absolute coordinate difference between the boxes of those pairs
+    """
+    same = total = 0
+    max_diff = 0.
+    for (_, tlwhs, track_ids, _), (_, other_tlwhs, other_ids, _) in zip(results, other):
+        boxes = dict(zip(track_ids, tlwhs))
+        other_boxes = dict(zip(other_ids, other_tlwhs))
+        common = boxes.keys() & other_boxes.keys()
+        same += 2 * len(common)
+        total += len(boxes) + len(other_boxes)
+        for track_id in common:
+            diff = np.abs(np.asarray(boxes[track_id], dtype=np.float64) - other_boxes[track_id]).max()
+            max_diff = max(max_diff, float(diff))
+    return (same / total if total else 1.), max_diff
+
+
+def compare_sequence(det_file, gt_root, seq_name, track_kwargs=None):
+    """
+    Track one sequence in float64 and float32 and compare the runs
+    :param gt_root: folder holding `<sequence>/gt/gt.txt`, or None to skip MOTA and IDF1
+    :param track_kwargs: other `track_detections` arguments
+    :return: dict with the `COLUMNS` of the sequence
+    """
+    detections = read_mot_detections(det_file)
+    has_gt = gt_root is not None and os.path.isfile(os.path.join(gt_root, seq_name, 'gt', 'gt.txt'))
+    gt = load_ground_truth(gt_root, seq_name) if has_gt else None
+    row = {'sequence': seq_name}
+    runs = []
+    for dtype in DTYPES:
+        name = np.dtype(dtype).name
+        results, track_time = track_detections(detections, dtype=dtype, **dict(track_kwargs or {}))
+        runs.append(results)
+        row['boxes_' + name] = sum(len(track_ids) for _, _, track_ids, _ in results)
+        row['time_' + name] = track_time
+        if gt is not None:
+            metrics = clear_mot(gt[0], track_results_arrays(results), gt[1])
+            row['mota_' + name] = float(metrics['mota'])
+            row['idf1_' + name] = float(metrics['idf1'])
+        else:
+            row['mota_' + name] = row['idf1_' + name] = float('nan')
+    row['same_id'], row['max_box_diff'] = compare_results(*runs)
+    return row
+
+
+def compare_sequences(det_files, gt_root, workers=None, track_kwargs=None):
+    """
+    :param workers: number of processes, all the cores if None, 1 to run in this process
+    :return: list of `compare_sequence` rows, in `det_files` order
+    """
+    tasks = [(det_file, gt_root, sequence_name(det_file), track_kwargs) for det_file in det_files]
+    if workers == 1:
+        return [compare_sequence(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(compare_sequence, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def write_report(filename, rows):
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        for row in rows:
+            writer.writerow([row[column] for column in COLUMNS])
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("Accuracy of the float32 ByteTrack states against float64")
+    parser.add_argument("data_root", help="folder of the sequences, holding <sequence>/gt/gt.txt")
+    parser.add_argument("--dets", nargs="+", default=None,
+                        help="det.txt files or folders, <data_root>/<sequence>/det/det.txt by default")
+    parser.add_argument("--report", default=None, help="CSV file of the comparison of every sequence")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, all the cores by default")
+    parser.add_argument("--backend", choices=("object", "array"), default="object")
+    parser.add_argument("--track_buffer", type=int, default=30, help="the frames for keep lost tracks")
+    parser.add_argument("--mot20", dest="mot20", default=False, action="store_true", help="test mot20.")
+    parser.add_argument("--min_box_area", type=float, default=100, help="filter out tiny boxes")
+    return parser
+
+
+def main():
+    args = make_parser().parse_args()
+    det_files = find_detection_files(args.dets or [args.data_root])
+    rows = compare_sequences(det_files, args.data_root, workers=args.workers,
+                             track_kwargs=dict(backend=args.backend, track_buffer=args.track_buffer,
+                                               mot20=args.mot20, min_box_area=args.min_box_area))
+    if args.report:
+        write_report(args.report, rows)
+
+    print("{:<20} {:>8} {:>10} {:>14} {:>14} {:>14}".format(
+        "sequence", "same id", "max diff", "MOTA f64/f32", "IDF1 f64/f32", "time f64/f32"))
+    for row in rows:
+        print("{:<20} {:>8.4f} {:>10.2e} {:>14} {:>14} {:>14}".format(
+            row['sequence'], row['same_id'], row['max_box_diff'],
+            "{:.3f}/{:.3f}".format(row['mota_float64'], row['mota_float32']),
+            "{:.3f}/{:.3f}".format(row['idf1_float64'], row['idf1_float32']),
+            "{:.2f}s/{:.2f}s".format(row['time_float64'], row['time_float32'])))
+    boxes = sum(row['boxes_float64'] + row['boxes_float32'] for row in rows)
+    same = sum(row['same_id'] * (row['boxes_float64'] + row['boxes_float32']) for row in rows)
+    print("Same id on {:.4f} of the boxes, max box difference {:.2e}".format(
+        same / boxes if boxes else 1., max((row['max_box_diff'] for row in rows), default=0.)))
+    print("Kalman state per track: {} bytes in float64, {} bytes in float32".format(
+        state_bytes(np.float64), state_bytes(np.float32)))
+
+
+if __name__ == "__main__":
+    main()
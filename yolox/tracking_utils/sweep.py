@@ -0,0 +1,218 @@
+"""
+Tracker hyperparameter sweep on cached detections.
+
+Every (sequence, config) pair is tracked and evaluated against the sequence
+ground truth in a process pool. The sweep reports MOTA, IDF1, ID switches and
+tracking fps of each pair, and the best config of each sequence, saved as a
+JSON table usable as `MOTEvaluator(sequence_configs=...)`:
+
+    python -m infer_bytetrack.yolox.tracking_utils.sweep MOT17/train -o best.json \\
+        --param track_thresh=0.5,0.6,0.7 --param track_buffer=14,30 --param match_thresh=0.7,0.8
+
+Detections are the MOT det.txt files of the sequences (`<sequence>/det/det.txt`
+by default, see `offline.py`), ground truth is `<data_root>/<sequence>/gt/gt.txt`.
+With `--random N`, N configs are drawn from the parameters instead of the full
+grid, and parameters may be given as `low:high` ranges.
+"""
+import argparse
+import csv
+import functools
+import itertools
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from infer_bytetrack.yolox.tracking_utils.io import read_mot_detections
+from infer_bytetrack.yolox.tracking_utils.metrics import clear_mot, load_ground_truth, track_results_arrays
+from infer_bytetrack.yolox.tracking_utils.offline import find_detection_files, sequence_name, track_detections
+
+# Tracker settings a sweep can search, with their `create_tracker` defaults
+SWEEP_PARAMS = {
+    'track_thresh': 0.5,
+    'match_thresh': 0.8,
+    'track_buffer': 30,
+    'second_match_thresh': 0.5,
+    'unconfirmed_match_thresh': 0.7,
+    'low_thresh': 0.1,
+}
+METRICS = ('mota', 'idf1', 'num_switches')
+
+
+def grid_configs(space):
+    """
+    :param space: dict, parameter name -> list of values
+    :return: list of dict, every combination of the values
+    """
+    names = sorted(space)
+    return [dict(zip(names, values)) for values in itertools.product(*(space[name] for name in names))]
+
+
+def random_configs(space, count, seed=0):
+    """
+    :param space: dict, parameter name -> list of values to choose from, or (low, high)
+        tuple to sample uniformly, as integers when both bounds are
+    :return: list of `count` dict
+    """
+    rng = random.Random(seed)
+    configs = []
+    for _ in range(count):
+        config = {}
+        for name in sorted(space):
+            values = space[name]
+            if isinstance(values, tuple):
+                low, high = values
+                if isinstance(low, int) and isinstance(high, int):
+                    config[name] = rng.randint(low, high)
+                else:
+                    config[name] = round(rng.uniform(low, high), 3)
+            else:
+                config[name] = rng.choice(values)
+        configs.append(config)
+    return configs
+
+
+@functools.lru_cache(maxsize=None)
+def _load_sequence(det_file, gt_root, seq_name):
+    # Each pool worker loads a sequence once for all its configs
+    return read_mot_detections(det_file), load_ground_truth(gt_root, seq_name)
+
+
+def evaluate_config(det_file, gt_root, seq_name, config, track_kwargs=None):
+    """
+    Track one sequence with one config and evaluate it
+    :param config: dict of tracker settings, e.g. a `grid_configs` item
+    :param track_kwargs: other `track_detections` arguments, shared by all configs
+    :return: dict with the sequence name, the config, its metrics and the tracking fps
+    """
+    detections, (gt, ignore) = _load_sequence(det_file, gt_root, seq_name)
+    results, track_time = track_detections(detections, **dict(track_kwargs or {}, **config))
+    # Like `Evaluator.eval_file`, which only sees the frames of the result file
+    metrics = clear_mot(gt, track_results_arrays(results), ignore)
+
+    row = {'sequence': seq_name, 'config': config}
+    for metric in METRICS:
+        row[metric] = float(metrics[metric])
+    row['fps'] = len(results) / track_time if track_time > 0 else float('inf')
+    return row
+
+
+def sweep(det_files, gt_root, configs, workers=None, track_kwargs=None):
+    """
+    Evaluate every config on every sequence in a process pool
+    :param det_files: MOT detection files, one per sequence
+    :param gt_root: folder holding `<sequence>/gt/gt.txt`
+    :param workers: number of processes, all the cores if None, 1 to run in this process
+    :return: list of `evaluate_config` rows, sequences then configs in input order
+    """
+    tasks = [(det_file, gt_root, sequence_name(det_file), config, track_kwargs)
+             for det_file in det_files for config in configs]
+    if workers == 1:
+        return [evaluate_config(*task) for task in tasks]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(evaluate_config, *task) for task in tasks]
+        return [future.result() for future in futures]
+
+
+def best_configs(rows, metric='mota'):
+    """
+    :return: dict, sequence name -> config with the highest `metric` on it
+    """
+    best = {}
+    for row in rows:
+        current = best.get(row['sequence'])
+        if current is None or row[metric] > current[metric]:
+            best[row['sequence']] = row
+    return {seq: dict(row['config']) for seq, row in best.items()}
+
+
+def config_means(rows):
+    """
+    :return: list of (config, mean metrics over the sequences), in config order
+    """
+    grouped = {}
+    for row in rows:
+        key = json.dumps(row['config'], sort_keys=True)
+        grouped.setdefault(key, (row['config'], []))[1].append(row)
+    means = []
+    for config, config_rows in grouped.values():
+        means.append((config, {name: float(np.mean([r[name] for r in config_rows])) for name in METRICS + ('fps',)}))
+    return means
+
+
+def write_report(filename, rows):
+    names = sorted({name for row in rows for name in row['config']})
+    with open(filename, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['sequence'] + names + list(METRICS) + ['fps'])
+        for row in rows:
+            writer.writerow([row['sequence']] + [row['config'].get(name) for name in names] +
+                            [row[metric] for metric in METRICS] + [row['fps']])
+
+
+def parse_param(text, ranges=False):
+    """`name=v1,v2,...` -> (name, [values]), or `name=low:high` -> (name, (low, high)) with ranges"""
+    name, values = text.split('=', 1)
+    if name not in SWEEP_PARAMS:
+        raise argparse.ArgumentTypeError("Unknown parameter {}, expected one of {}".format(name, sorted(SWEEP_PARAMS)))
+    cast = int if isinstance(SWEEP_PARAMS[name], int) else float
+    if ':' in values:
+        if not ranges:
+            raise argparse.ArgumentTypeError("Ranges need --random: {}".format(text))
+        low, high = values.split(':')
+        return name, (cast(low), cast(high))
+    return name, [cast(value) for value in values.split(',')]
+
+
+def make_parser():
+    parser = argparse.ArgumentParser("ByteTrack hyperparameter sweep on cached detections")
+    parser.add_argument("data_root", help="folder of the sequences, holding <sequence>/gt/gt.txt")
+    parser.add_argument("--dets", nargs="+", default=None,
+                        help="det.txt files or folders, <data_root>/<sequence>/det/det.txt by default")
+    parser.add_argument("-o", "--output", required=True, help="JSON file of the best config per sequence")
+    parser.add_argument("--report", default=None, help="CSV file of the metrics of every sequence and config")
+    parser.add_argument("--param", action="append", default=[], help="name=v1,v2,... or name=low:high")
+    parser.add_argument("--random", type=int, default=0, help="number of random configs instead of the grid")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--metric", choices=("mota", "idf1"), default="mota")
+    parser.add_argument("--workers", type=int, default=None, help="number of processes, all the cores by default")
+    parser.add_argument("--mot20", dest="mot20", default=False, action="store_true", help="test mot20.")
+    parser.add_argument("--min_box_area", type=float, default=100, help="filter out tiny boxes")
+    return parser
+
+
+def main():
+    args = make_parser().parse_args()
+    space = dict(parse_param(text, ranges=args.random > 0) for text in args.param)
+    if not space:
+        space = {name: [value] for name, value in SWEEP_PARAMS.items()}
+    configs = random_configs(space, args.random, args.seed) if args.random > 0 else grid_configs(space)
+
+    det_files = find_detection_files(args.dets or [args.data_root])
+    det_files = [f for f in det_files
+                 if os.path.isfile(os.path.join(args.data_root, sequence_name(f), 'gt', 'gt.txt'))]
+    print("{} sequences x {} configs".format(len(det_files), len(configs)))
+
+    rows = sweep(det_files, args.data_root, configs, workers=args.workers,
+                 track_kwargs=dict(mot20=args.mot20, min_box_area=args.min_box_area))
+    if args.report:
+        write_report(args.report, rows)
+    best = best_configs(rows, args.metric)
+    with open(args.output, 'w') as f:
+        json.dump(best, f, indent=2, sort_keys=True)
+
+    by_sequence = {(row['sequence'], json.dumps(row['config'], sort_keys=True)): row for row in rows}
+    print("Best config per sequence ({}):".format(args.metric))
+    for seq, config in sorted(best.items()):
+        row = by_sequence[(seq, json.dumps(config, sort_keys=True))]
+        print("  {}: {} MOTA {:.3f} IDF1 {:.3f} IDs {:d} {:.0f} fps".format(
+            seq, config, row['mota'], row['idf1'], int(row['num_switches']), row['fps']))
+    config, means = max(config_means(rows), key=lambda item: item[1][args.metric])
+    print("Best shared config: {} mean MOTA {:.3f} IDF1 {:.3f} {:.0f} fps".format(
+        config, means['mota'], means['idf1'], means['fps']))
+
+
+if __name__ == "__main__":
+    main()
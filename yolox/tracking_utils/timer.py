@@ -1,4 +1,7 @@
 import time
+from collections import deque
+
+import numpy as np
 
 
 class Timer(object):
@@ -34,4 +37,97 @@ class Timer(object):
         self.start_time = 0.
         self.diff = 0.
         self.average_time = 0.
-        self.duration = 0.
\ No newline at end of file
+        self.duration = 0.
+
+
+class StageProfiler(object):
+    """
+    Rolling per-stage wall times and counters of a tracker update.
+
+    A tracker calls `start()` at the beginning of an update, then
+    `mark(stage)` at the end of each stage, which records the time spent
+    since the previous mark. `count` and `shape` record per-frame values
+    such as track counts and cost-matrix shapes. Only the last `window`
+    frames are kept.
+
+    A profiler belongs to one tracker: `start` and `mark` keep the time of
+    the previous mark, so trackers updated concurrently must not share one.
+    Use `merge` to summarize the profilers of several trackers.
+    """
+
+    def __init__(self, window=1000):
+        self.window = window
+        self.frames = 0
+        self.times = {}
+        self.counts = {}
+        self.shapes = {}
+        self._last = 0.
+
+    @classmethod
+    def merge(cls, profilers):
+        """
+        Profiler holding the samples of all `profilers`, e.g. one per tracker of a
+        pool. Its `frames` and its samples are per tracker update.
+        """
+        profilers = list(profilers)
+        merged = cls(window=max(sum(profiler.window for profiler in profilers), 1))
+        for profiler in profilers:
+            merged.frames += profiler.frames
+            for samples, merged_samples in ((profiler.times, merged.times), (profiler.counts, merged.counts),
+                                            (profiler.shapes, merged.shapes)):
+                for name, values in samples.items():
+                    merged_samples.setdefault(name, deque(maxlen=merged.window)).extend(values)
+        return merged
+
+    def start(self):
+        self.frames += 1
+        self._last = time.perf_counter()
+
+    def mark(self, stage):
+        now = time.perf_counter()
+        samples = self.times.get(stage)
+        if samples is None:
+            samples = self.times[stage] = deque(maxlen=self.window)
+        samples.append(now - self._last)
+        self._last = now
+
+    def count(self, name, value):
+        samples = self.counts.get(name)
+        if samples is None:
+            samples = self.counts[name] = deque(maxlen=self.window)
+        samples.append(value)
+
+    def shape(self, name, shape):
+        samples = self.shapes.get(name)
+        if samples is None:
+            samples = self.shapes[name] = deque(maxlen=self.window)
+        samples.append(tuple(shape))
+
+    def summary(self):
+        """
+        p50/p95/p99 and mean over the window of the stage times in milliseconds,
+        the counters and the row and column counts of the cost matrices.
+        """
+        def percentiles(values):
+            p50, p95, p99 = np.percentile(values, (50, 95, 99))
+            return {"p50": float(p50), "p95": float(p95), "p99": float(p99), "mean": float(np.mean(values))}
+
+        times = {stage: percentiles(np.asarray(samples) * 1e3) for stage, samples in self.times.items()}
+        if len({len(samples) for samples in self.times.values()}) == 1:
+            times["total"] = percentiles(np.sum([np.asarray(s) for s in self.times.values()], axis=0) * 1e3)
+        shapes = {}
+        for name, samples in self.shapes.items():
+            samples = np.asarray(samples).reshape(-1, 2)
+            shapes[name] = {"rows": percentiles(samples[:, 0]), "cols": percentiles(samples[:, 1])}
+        return {
+            "frames": self.frames,
+            "times_ms": times,
+            "counts": {name: percentiles(samples) for name, samples in self.counts.items()},
+            "cost_shapes": shapes,
+        }
+
+    def clear(self):
+        self.frames = 0
+        self.times.clear()
+        self.counts.clear()
+        self.shapes.clear()
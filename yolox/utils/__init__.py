@@ -14,3 +14,5 @@ from .metric import *
 from .model_utils import *
 from .setup_env import *
 from .visualize import *
+
+configure_module()